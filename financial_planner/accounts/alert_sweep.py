@@ -0,0 +1,154 @@
+from itertools import groupby
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection
+from django.db.models import Count, F, Max, Min
+from django.utils import timezone
+from . import currency
+from .alerting import ALERT_THRESHOLD, WARNING_THRESHOLD_MAX, WARNING_THRESHOLD_MIN
+from .models import (
+    DEFAULT_CURRENCY, BudgetAlertState, BudgetLine, Category, CategorySpend, Expense, Profile,
+)
+
+# Nightly evaluation of every user's budget status. Each chunk of users is one
+# INSERT ... SELECT that joins the user's categories to their budget lines and
+# per-category totals and upserts the result into BudgetAlertState, so the work stays in
+# the database no matter how many users there are. Totals are in each user's
+# base currency: the rollup keeps them converted, and ledger amounts are
+# converted in the same statement, as currency.convert does. A category with
+# spend on a day without a rate is stored as 'unknown' with the part that
+# could be converted, rather than judged on that partial total.
+
+SWEEP_USER_CHUNK = 50000
+DIGEST_BATCH_SIZE = 500
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def _upsert_clause():
+    columns = ['status', 'expenses', 'budget', 'evaluated_at']
+    if connection.vendor == 'mysql':
+        return "ON DUPLICATE KEY UPDATE " + ", ".join(f"{column} = VALUES({column})" for column in columns)
+    # SQLite and PostgreSQL
+    return "ON CONFLICT (user_id, category) DO UPDATE SET " + ", ".join(
+        f"{column} = excluded.{column}" for column in columns
+    )
+
+
+def _sweep_sql(from_expenses):
+    # Totals come from the CategorySpend rollup, or straight from the ledger
+    base = f"COALESCE(p.base_currency, '{DEFAULT_CURRENCY}')"
+    if from_expenses:
+        totals = (
+            f"SELECT e.user_id, e.category, SUM(CASE WHEN e.currency = {base} THEN e.amount "
+            f"ELSE e.amount * r.rate END) AS total, "
+            f"COUNT(*) - COUNT(CASE WHEN e.currency = {base} THEN e.amount ELSE r.rate END) AS unconverted "
+            f"FROM {_table(Expense)} e LEFT JOIN {_table(Profile)} p ON p.user_id = e.user_id "
+            f"{currency.rate_join_sql('r', 'e.currency', 'e.date', base)} "
+            f"WHERE e.user_id BETWEEN %s AND %s GROUP BY e.user_id, e.category"
+        )
+    else:
+        totals = (
+            "SELECT t.user_id, t.category, SUM(t.converted) AS total, "
+            "COUNT(*) - COUNT(t.converted) AS unconverted "
+            f"FROM {_table(CategorySpend)} t "
+            f"WHERE t.user_id BETWEEN %s AND %s GROUP BY t.user_id, t.category"
+        )
+
+    # Same rules as alerting.get_status
+    sql = f"""
+        INSERT INTO {_table(BudgetAlertState)}
+            (user_id, category, status, expenses, budget, notified_status, evaluated_at)
+        SELECT s.user_id, s.category,
+            CASE
+                WHEN s.unconverted > 0 THEN 'unknown'
+                WHEN s.expenses >= s.budget * %s THEN 'alert'
+                WHEN s.expenses >= s.budget * %s AND s.expenses <= s.budget * %s THEN 'warning'
+                ELSE ''
+            END,
+            s.expenses, s.budget, '', %s
+        FROM (
+            SELECT c.user_id AS user_id, c.name AS category,
+                COALESCE(t.total, 0) AS expenses, COALESCE(b.amount, 0) AS budget,
+                COALESCE(t.unconverted, 0) AS unconverted
+            FROM {_table(Category)} c
+            LEFT JOIN {_table(BudgetLine)} b ON b.category_id = c.id
+            LEFT JOIN ({totals}) t ON t.user_id = c.user_id AND t.category = c.name
+            WHERE c.user_id BETWEEN %s AND %s
+        ) s
+        WHERE s.user_id BETWEEN %s AND %s
+        {_upsert_clause()}
+    """
+    return sql
+
+
+def evaluate_all(chunk_size=SWEEP_USER_CHUNK, from_expenses=False):
+    # Returns the number of users evaluated
+    bounds = Category.objects.aggregate(low=Min('user_id'), high=Max('user_id'), users=Count('user_id', distinct=True))
+    if not bounds['users']:
+        return 0
+
+    sql = _sweep_sql(from_expenses)
+    now = timezone.now()
+    low = bounds['low']
+    while low <= bounds['high']:
+        high = low + chunk_size - 1
+        params = [ALERT_THRESHOLD, WARNING_THRESHOLD_MIN, WARNING_THRESHOLD_MAX, now]
+        params += [low, high, low, high, low, high]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+        low = high + 1
+    return bounds['users']
+
+
+def _digest_message(email, username, base_currency, rows):
+    symbol = currency.symbol(base_currency or DEFAULT_CURRENCY)
+    lines = [f"Hi {username},", "", "Your budget status has changed:", ""]
+    for category, status, expenses, budget in rows:
+        label = 'over budget' if status == 'alert' else 'close to the budget'
+        lines.append(f"  {category}: {label} - spent {symbol}{expenses:.2f} of {symbol}{budget:.2f}")
+    return EmailMessage(
+        subject="Your budget alerts",
+        body="\n".join(lines) + "\n",
+        from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', None),
+        to=[email],
+    )
+
+
+def send_digests(batch_size=DIGEST_BATCH_SIZE):
+    # Email each user the categories that entered warning or alert since their
+    # last digest, then record what was reported. A zero budget means the user
+    # never set one, so those are left out. Returns the number of emails sent.
+    changed = (
+        BudgetAlertState.objects
+        .filter(status__in=['warning', 'alert'], budget__gt=0)
+        .exclude(status=F('notified_status'))
+        .exclude(user__email='')
+        .order_by('user_id', 'category')
+        .values_list(
+            'user_id', 'user__email', 'user__username', 'user__profile__base_currency',
+            'category', 'status', 'expenses', 'budget',
+        )
+    )
+
+    sent = 0
+    messages = []
+    email_connection = get_connection()
+    for (user_id, email, username, base_currency), rows in groupby(
+        changed.iterator(chunk_size=2000), key=lambda row: row[:4],
+    ):
+        messages.append(_digest_message(email, username, base_currency, [row[4:] for row in rows]))
+        if len(messages) >= batch_size:
+            sent += email_connection.send_messages(messages) or 0
+            messages = []
+    if messages:
+        sent += email_connection.send_messages(messages) or 0
+
+    # Also covers categories that dropped back, so a later crossing is reported
+    # again; an unknown status says nothing either way, so it is left alone
+    BudgetAlertState.objects.exclude(status=F('notified_status')).exclude(status='unknown').update(
+        notified_status=F('status'),
+    )
+    return sent
@@ -0,0 +1,84 @@
+import threading
+from django.db import transaction
+from . import budgets
+
+# Define thresholds for warning and alert status
+WARNING_THRESHOLD_MIN = 0.60  # 60% of the budget
+WARNING_THRESHOLD_MAX = 0.99  # 99% of the budget
+ALERT_THRESHOLD = 1.0         # 100% of the budget
+
+
+def get_status(expenses, budget):
+    if expenses >= budget * ALERT_THRESHOLD:
+        return 'alert'
+    elif expenses >= budget * WARNING_THRESHOLD_MIN and expenses <= budget * WARNING_THRESHOLD_MAX:
+        return 'warning'
+    return ''
+
+
+# Lightweight in-process pub/sub. Each subscriber is a callable taking an
+# event dict; the SSE view registers one that hands events to its event loop.
+# Only listeners in the process that handled the write are notified.
+_subscribers_lock = threading.Lock()
+_subscribers = {}
+
+
+def subscribe(user_id, deliver):
+    with _subscribers_lock:
+        _subscribers.setdefault(user_id, set()).add(deliver)
+
+
+def unsubscribe(user_id, deliver):
+    with _subscribers_lock:
+        listeners = _subscribers.get(user_id)
+        if listeners:
+            listeners.discard(deliver)
+            if not listeners:
+                del _subscribers[user_id]
+
+
+def has_subscribers(user_id):
+    return user_id in _subscribers
+
+
+def publish(user_id, event):
+    with _subscribers_lock:
+        listeners = list(_subscribers.get(user_id, ()))
+    for deliver in listeners:
+        deliver(event)
+
+
+def spent_before(user_id, categories):
+    # Called inside an expense write's transaction, before the rollups are
+    # updated: {category: spent so far} in the user's base currency, for
+    # publish_status_changes to compare against. None when nobody listens.
+    if not has_subscribers(user_id):
+        return None
+    return {category: spent for category, _, spent in budgets.get_budget_lines(user_id, categories)}
+
+
+def publish_status_changes(user_id, before):
+    # Called after the rollups have been updated, with what spent_before
+    # returned. Looks up the new totals once per write (not per listener) and,
+    # once the transaction commits, publishes an event for every category
+    # whose status moved. Free when nobody listens.
+    if not has_subscribers(user_id) or not before:
+        return
+
+    events = []
+    for category, budget, spent in budgets.get_budget_lines(user_id, before):
+        budget = float(budget)
+        expenses = float(spent)
+        previous_status = get_status(float(before[category]), budget)
+        status = get_status(expenses, budget)
+        if status != previous_status:
+            events.append({
+                'category': category,
+                'status': status,
+                'previous_status': previous_status,
+                'expenses': round(expenses, 2),
+                'budget': round(budget, 2),
+            })
+
+    if events:
+        transaction.on_commit(lambda: [publish(user_id, event) for event in events])
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+from . import budgets, caching, ledger
+
+ROLLING_WINDOWS = (7, 30)
+PERCENTILES = (50, 75, 90, 95, 99)
+DAILY_SERIES_DAYS = 90
+
+
+def load_ledger(user, user_ledger=None):
+    # The compact in-memory ledger as a frame; everything below is vectorized.
+    # An empty Ledger is falsy, so it is compared with None.
+    return (user_ledger if user_ledger is not None else ledger.get_ledger(user)).to_frame()
+
+
+def daily_totals(frame):
+    # Spend per calendar day, with zero-spend days filled in so rolling windows are in days
+    totals = frame.groupby('date')['amount'].sum()
+    days = pd.date_range(totals.index.min(), totals.index.max(), freq='D')
+    return totals.reindex(days, fill_value=0.0)
+
+
+def monthly_totals(frame):
+    return frame.groupby(frame['date'].dt.to_period('M'))['amount'].sum()
+
+
+def rolling_averages(daily, windows=ROLLING_WINDOWS):
+    return pd.DataFrame({
+        f'avg_{window}': daily.rolling(window, min_periods=1).mean()
+        for window in windows
+    })
+
+
+def category_month_over_month(frame, categories):
+    # Month x category spend matrix and its month-over-month change
+    by_month = frame.pivot_table(
+        index=frame['date'].dt.to_period('M'),
+        columns='category',
+        values='amount',
+        aggfunc='sum',
+        fill_value=0.0,
+    ).reindex(columns=categories, fill_value=0.0)
+    # Make the month index contiguous so a quiet month counts as zero spend
+    months = pd.period_range(by_month.index.min(), by_month.index.max(), freq='M')
+    by_month = by_month.reindex(months, fill_value=0.0)
+    delta = by_month.diff()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta_pct = np.where(by_month.shift(1) > 0, delta / by_month.shift(1) * 100, np.nan)
+    return by_month, delta, pd.DataFrame(delta_pct, index=by_month.index, columns=by_month.columns)
+
+
+def percentiles(values, qs=PERCENTILES):
+    if len(values) == 0:
+        return []
+    return [
+        {'percentile': q, 'value': round(float(value), 2)}
+        for q, value in zip(qs, np.percentile(values, qs))
+    ]
+
+
+def compute_analytics(user, user_ledger=None):
+    frame = load_ledger(user, user_ledger)
+    categories = budgets.get_category_names(user)
+    if frame.empty:
+        return {
+            'monthly_trend': [],
+            'daily_series': [],
+            'rolling': {},
+            'latest_month': None,
+            'category_deltas': [],
+            'expense_percentiles': [],
+            'daily_percentiles': [],
+        }
+
+    monthly = monthly_totals(frame)
+    daily = daily_totals(frame)
+    rolling = rolling_averages(daily)
+    by_month, delta, delta_pct = category_month_over_month(frame, categories)
+
+    recent = rolling.tail(DAILY_SERIES_DAYS)
+    latest_month = by_month.index[-1]
+    category_deltas = []
+    for category in categories:
+        change_pct = delta_pct.at[latest_month, category]
+        category_deltas.append({
+            'category': category,
+            'this_month': round(float(by_month.at[latest_month, category]), 2),
+            'last_month': round(float(by_month[category].shift(1).fillna(0.0).iat[-1]), 2),
+            'delta': round(float(np.nan_to_num(delta.at[latest_month, category])), 2),
+            'delta_pct': None if np.isnan(change_pct) else round(float(change_pct), 1),
+        })
+
+    return {
+        'monthly_trend': [
+            {'month': str(month), 'total': round(float(total), 2)}
+            for month, total in monthly.items()
+        ],
+        'daily_series': [
+            {
+                'date': day.date().isoformat(),
+                'total': round(float(daily.at[day]), 2),
+                **{column: round(float(value), 2) for column, value in row.items()},
+            }
+            for day, row in recent.iterrows()
+        ],
+        'rolling': {
+            column: round(float(rolling[column].iat[-1]), 2)
+            for column in rolling.columns
+        },
+        'latest_month': str(latest_month),
+        'category_deltas': category_deltas,
+        'expense_percentiles': percentiles(frame['amount'].to_numpy()),
+        'daily_percentiles': percentiles(daily.to_numpy()),
+    }
+
+
+def get_analytics(user, user_ledger=None):
+    # Pass the ledger if the caller already has it, so a miss does not load it twice
+    return caching.get_user_data(user, 'report-analytics', lambda: compute_analytics(user, user_ledger))
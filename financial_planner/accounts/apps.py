@@ -6,3 +6,6 @@ class AccountsConfig(AppConfig):
 
     def ready(self):
         import accounts.signals  # Import signals here
+        from django.db.backends.signals import connection_created
+        from .timing import install_query_hook
+        connection_created.connect(install_query_hook)
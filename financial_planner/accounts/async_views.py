@@ -0,0 +1,188 @@
+import asyncio
+import contextvars
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.db import connections
+from django.http import StreamingHttpResponse
+from django.shortcuts import render
+from . import alerting, analytics, budgets, caching, currency, forecasting, ledger, reports, rollups, views
+
+# Async versions of the summary pages. Each page's independent queries are
+# issued at the same time, so under an ASGI server a page costs about as much
+# as its slowest query instead of the sum of all of them.
+#
+# Django's async ORM methods (aget, afirst, ...) all funnel through one
+# thread-sensitive worker and so still run one after another. To overlap them
+# for real, the queries run on a small pool of ASYNC_VIEWS_QUERY_THREADS
+# threads. Each pool thread keeps its database connection from one query to
+# the next, whatever CONN_MAX_AGE says, so a request does not pay for a new
+# connection per query; the pool size bounds how many are open. A connection
+# left unusable by an error is closed and reopened by the next query.
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'ASYNC_VIEWS_QUERY_THREADS', 4),
+                thread_name_prefix='async-views-query',
+            )
+        return _executor
+
+
+def _run_query(func):
+    try:
+        return func()
+    finally:
+        for connection in connections.all(initialized_only=True):
+            if connection.errors_occurred:
+                if connection.is_usable():
+                    connection.errors_occurred = False
+                else:
+                    connection.close()
+
+
+async def gather_queries(*funcs):
+    # Run the given zero-argument query callables concurrently and return their results in order
+    if getattr(settings, 'ASYNC_VIEWS_PARALLEL_QUERIES', True):
+        loop = asyncio.get_running_loop()
+        executor = _get_executor()
+        # Each query carries a copy of the request's context, so the
+        # per-request instrumentation still sees it
+        return await asyncio.gather(*(
+            loop.run_in_executor(executor, contextvars.copy_context().run, _run_query, func)
+            for func in funcs
+        ))
+    return [await sync_to_async(func)() for func in funcs]
+
+
+def async_login_required(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        # Resolving request.user touches the session and the database, so do it off the event loop
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def abuild_notification_context(user):
+    budget_lines, forecast, unconverted = await gather_queries(
+        lambda: budgets.get_budget_lines(user),
+        lambda: forecasting.compute_forecast(user),
+        lambda: currency.get_unconverted_currencies(user),
+    )
+    return views.notification_context(budget_lines, forecast, unconverted)
+
+
+async def abuild_alerts_context(user):
+    budget_lines, forecast, unconverted = await gather_queries(
+        lambda: budgets.get_budget_lines(user),
+        lambda: forecasting.get_forecast(user),
+        lambda: currency.get_unconverted_currencies(user),
+    )
+    return views.alerts_context(budget_lines, forecast, unconverted)
+
+
+async def abuild_dashboard_context(user):
+    latest_expenses, expenses_by_category, total_budget, base_currency, unconverted = await gather_queries(
+        lambda: views.get_latest_expenses(user),
+        lambda: rollups.get_category_breakdown(user),
+        lambda: budgets.get_total_budget(user),
+        lambda: currency.get_base_currency(user),
+        lambda: currency.get_unconverted_currencies(user),
+    )
+    return views.dashboard_context(latest_expenses, expenses_by_category, total_budget, base_currency, unconverted)
+
+
+async def abuild_financial_reports_context(user):
+    # The analytics are computed from the ledger on a cache miss, so it is
+    # loaded first and handed over rather than loaded twice at once
+    user_ledger, = await gather_queries(lambda: ledger.get_ledger(user))
+    trends, = await gather_queries(lambda: analytics.get_analytics(user, user_ledger))
+    return views.financial_reports_context(reports.ledger_report_data(user_ledger), trends)
+
+
+async def _render(request, template_name, context):
+    return await sync_to_async(render)(request, template_name, context)
+
+
+@async_login_required
+async def notification(request):
+    # Served from the per-user cache until the user's expenses or budgets change,
+    # or the day (and so the month-end projection) does
+    context = await caching.aget_user_data(
+        request.user, 'notification', lambda: abuild_notification_context(request.user),
+        timeout=forecasting.seconds_until_midnight(),
+    )
+    return await _render(request, 'accounts/notification.html', context)
+
+
+@async_login_required
+async def alerts(request):
+    context = await abuild_alerts_context(request.user)
+    return await _render(request, 'accounts/alerts.html', context)
+
+
+@async_login_required
+async def dashboard(request):
+    # Served from the per-user cache until the user's expenses or budgets change
+    context = await caching.aget_user_data(
+        request.user, 'dashboard', lambda: abuild_dashboard_context(request.user)
+    )
+    return await _render(request, 'accounts/dashboard.html', context)
+
+
+@async_login_required
+async def financial_reports(request):
+    context = await abuild_financial_reports_context(request.user)
+    return await _render(request, 'accounts/financial_reports.html', context)
+
+
+def _sse_message(event):
+    return f"event: budget\ndata: {json.dumps(event)}\n\n"
+
+
+async def _alert_events(user_id):
+    # Events are handed over from whichever thread committed the expense write
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def deliver(event):
+        loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    keepalive = getattr(settings, 'ALERT_STREAM_KEEPALIVE_SECONDS', 15)
+    alerting.subscribe(user_id, deliver)
+    try:
+        # Tell EventSource how long to wait before reconnecting
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                # Comment line so proxies don't close an idle connection
+                yield ": keepalive\n\n"
+                continue
+            yield _sse_message(event)
+    finally:
+        # Runs when the client disconnects and the server cancels the stream
+        alerting.unsubscribe(user_id, deliver)
+
+
+@async_login_required
+async def alert_stream(request):
+    # Server-sent events for budget status changes; needs an ASGI server to stream
+    response = StreamingHttpResponse(_alert_events(request.user.pk), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,110 @@
+from decimal import Decimal, InvalidOperation
+from django.db import connection, transaction
+from django.db.models import DecimalField, Sum, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+from .models import DEFAULT_CATEGORIES, BudgetLine, Category, CategorySpend
+from . import currency, versioning
+
+CENTS = Decimal('0.01')
+MAX_BUDGET = Decimal('100000000')  # BudgetLine.amount holds 10 digits, 2 after the point
+ZERO = Value(Decimal('0.00'), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+class BudgetError(ValueError):
+    pass
+
+
+def parse_amount(value):
+    try:
+        amount = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        raise BudgetError(f'Invalid budget amount: {value!r}.')
+    if not amount.is_finite() or amount < 0 or amount >= MAX_BUDGET:
+        raise BudgetError(f'Invalid budget amount: {value!r}.')
+    return amount.quantize(CENTS)
+
+
+def create_default_categories(user):
+    Category.objects.bulk_create(
+        [Category(user=user, name=name) for name in DEFAULT_CATEGORIES],
+        ignore_conflicts=True,
+    )
+
+
+def get_category_names(user):
+    return list(Category.objects.filter(user=user).values_list('name', flat=True))
+
+
+def get_budget_lines(user, categories=None):
+    # [(category, budget, spent)] for every one of the user's categories (or
+    # just the named ones), in one query: categories left-joined to their
+    # budget line and rollup rows, whose totals are kept converted to the
+    # user's base currency. Spend without a rate is left out; see
+    # currency.get_unconverted_currencies. The sum is written as SQL: this
+    # runs on every budget page and write, and the ORM takes longer to build
+    # it than the database takes to run it.
+    category = connection.ops.quote_name(Category._meta.db_table)
+    spent = RawSQL(
+        "SELECT SUM(t.converted) "
+        f"FROM {connection.ops.quote_name(CategorySpend._meta.db_table)} t "
+        f"WHERE t.user_id = {category}.user_id AND t.category = {category}.name",
+        (),
+        output_field=currency.AMOUNT_FIELD,
+    )
+    rows = Category.objects.filter(user=user)
+    if categories is not None:
+        rows = rows.filter(name__in=list(categories))
+    rows = (
+        rows.annotate(
+            budget=Coalesce('budget_line__amount', ZERO),
+            spent=Coalesce(spent, ZERO),
+        )
+        .values_list('name', 'budget', 'spent')
+    )
+    # SQLite drops the scale of the coalesced decimals
+    return [(name, budget.quantize(CENTS), spent.quantize(CENTS)) for name, budget, spent in rows]
+
+
+def get_total_budget(user):
+    return BudgetLine.objects.filter(category__user=user).aggregate(total=Coalesce(Sum('amount'), ZERO))['total']
+
+
+def get_budgets(user):
+    # {category: budget} for every one of the user's categories
+    return {name: budget for name, budget, _ in get_budget_lines(user)}
+
+
+def add_category(user, name, budget=None):
+    name = (name or '').strip()
+    if not name:
+        raise BudgetError('Category name is required.')
+    if budget is not None:
+        budget = parse_amount(budget)
+    if len(name) > Category._meta.get_field('name').max_length:
+        raise BudgetError('Category name is too long.')
+    if name == 'All':
+        raise BudgetError('"All" is reserved for the expense filter.')
+
+    with transaction.atomic():
+        category, created = Category.objects.get_or_create(user=user, name=name)
+        if not created:
+            raise BudgetError('You already have a category with that name.')
+        if budget is not None:
+            BudgetLine.objects.create(category=category, amount=budget)
+        versioning.bump(user.pk)
+    return category
+
+
+def set_budgets(user, amounts):
+    # amounts is {category: budget}; every name must be one of the user's categories
+    amounts = {name: parse_amount(amount) for name, amount in amounts.items()}
+    categories = dict(Category.objects.filter(user=user, name__in=list(amounts)).values_list('name', 'id'))
+    unknown = [name for name in amounts if name not in categories]
+    if unknown:
+        raise BudgetError(f"Unknown category: {', '.join(sorted(unknown))}.")
+
+    with transaction.atomic():
+        for name, amount in amounts.items():
+            BudgetLine.objects.update_or_create(category_id=categories[name], defaults={'amount': amount})
+        versioning.bump(user.pk)
@@ -0,0 +1,66 @@
+import threading
+from collections import Counter
+from django.core.cache import cache
+from . import metrics, versioning
+
+DEFAULT_TIMEOUT = 60 * 60 * 24
+
+_stats_lock = threading.Lock()
+_hits = Counter()
+_misses = Counter()
+
+
+def _record(name, hit):
+    with _stats_lock:
+        (_hits if hit else _misses)[name] += 1
+    metrics.count_cache_lookup(name, hit)
+
+
+def get_user_data(user, name, compute, timeout=DEFAULT_TIMEOUT):
+    # Cache `compute()` per user under the user's current data version.
+    # Expense and budget writes bump the version, so invalidation is a single
+    # counter update and an old entry can never be read again; it just ages out.
+    cache_key = f'user-data:{name}:{user.pk}:{versioning.get_version(user)}'
+    value = cache.get(cache_key)
+    if value is not None:
+        _record(name, True)
+        return value
+
+    _record(name, False)
+    value = compute()
+    cache.set(cache_key, value, timeout)
+    return value
+
+
+async def aget_user_data(user, name, acompute, timeout=DEFAULT_TIMEOUT):
+    # Async twin of get_user_data; `acompute` is a coroutine function
+    cache_key = f'user-data:{name}:{user.pk}:{await versioning.aget_version(user)}'
+    value = await cache.aget(cache_key)
+    if value is not None:
+        _record(name, True)
+        return value
+
+    _record(name, False)
+    value = await acompute()
+    await cache.aset(cache_key, value, timeout)
+    return value
+
+
+def get_stats():
+    # Hit/miss counts for this process, per cached page or result
+    with _stats_lock:
+        names = sorted(_hits.keys() | _misses.keys())
+        return {
+            name: {
+                'hits': _hits[name],
+                'misses': _misses[name],
+                'hit_ratio': round(_hits[name] / (_hits[name] + _misses[name]), 4),
+            }
+            for name in names
+        }
+
+
+def reset_stats():
+    with _stats_lock:
+        _hits.clear()
+        _misses.clear()
@@ -0,0 +1,291 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.db import connection, transaction
+from django.db.models import (
+    Case, DateField, DecimalField, ExpressionWrapper, F, Max, Min, OuterRef, Q, Subquery, Value, When,
+)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, Least
+from .models import DEFAULT_CURRENCY, CategorySpend, DailyRate, DailySpend, FxRate, Profile
+from . import versioning
+
+# Expenses keep the currency they were paid in; totals are converted to the
+# user's base currency in SQL. Rows already in the base currency are used as
+# they are and never touch the rate tables, so single-currency data costs what
+# it did before. A foreign-currency amount is multiplied by its day's rate,
+# found with an equality join on DailyRate, which load_rates fills in with
+# every pair's rate carried forward to every day up to the last day quoted.
+# Later days use that last day's rates.
+#
+# Rates are loaded with the load_fx_rates command, which stores every ordered
+# pair of the currencies quoted on a day, so a lookup never has to go through
+# a third currency.
+#
+# The per-category rollups also keep their total converted (see rollups), so
+# the budget pages never add up daily rows. A day without a rate makes a
+# converted amount NULL; get_unconverted_currencies reports which currencies
+# that left out, so pages can say their totals are incomplete.
+
+RATE_PLACES = Decimal('1e-10')  # FxRate.rate holds 10 decimal places
+LOAD_DAYS_CHUNK = 100  # Days of rates replaced per DELETE and bulk insert
+DAILY_RATES_BATCH = 1000
+REFRESH_USER_CHUNK = 500  # Users whose converted totals are recomputed per UPDATE
+AMOUNT_FIELD = DecimalField(max_digits=14, decimal_places=2)
+SYMBOLS = {
+    'INR': '₹', 'USD': '$', 'EUR': '€', 'GBP': '£', 'JPY': '¥', 'THB': '฿',
+    'AED': 'AED ', 'SGD': 'S$', 'AUD': 'A$', 'CAD': 'C$', 'CHF': 'CHF ',
+}
+
+
+class CurrencyError(ValueError):
+    pass
+
+
+def symbol(currency):
+    return SYMBOLS.get(currency, f'{currency} ')
+
+
+def get_base_currency(user):
+    return Profile.objects.filter(user=user).values_list('base_currency', flat=True).first() or DEFAULT_CURRENCY
+
+
+def base_currency(user):
+    # The user's base currency as an SQL expression. It does not refer to
+    # the outer row, so the database evaluates it once per query.
+    profile = Profile.objects.filter(user=user).values('base_currency')[:1]
+    return Coalesce(Subquery(profile), Value(DEFAULT_CURRENCY))
+
+
+def rate(currency, day, base):
+    # Units of `base` per unit of `currency` on `day`, or on the last day
+    # loaded if `day` is later; NULL if the pair had no rate yet
+    last_day = DailyRate.objects.order_by('-day').values('day')[:1]
+    rates = DailyRate.objects.filter(
+        currency=currency, base=base, day=Least(day, Subquery(last_day), output_field=DateField()),
+    ).values('rate')
+    return Subquery(rates)
+
+
+def convert(amount, currency, day, base):
+    # The `amount` field of a row, paid in its `currency` field on its `day`
+    # field, in `base`
+    converted = ExpressionWrapper(F(amount) * rate(OuterRef(currency), OuterRef(day), base), output_field=AMOUNT_FIELD)
+    return Case(When(Q((currency, base)), then=F(amount)), default=converted, output_field=AMOUNT_FIELD)
+
+
+# The same conversions as SQL text, for statements run too often or over too
+# many users to build with the ORM: compiling the nested expressions above
+# takes milliseconds, several times what the database needs to run them.
+# Arguments are SQL expressions.
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def base_currency_sql(user_id):
+    return (
+        f"COALESCE((SELECT bp.base_currency FROM {_table(Profile)} bp WHERE bp.user_id = {user_id}), "
+        f"'{DEFAULT_CURRENCY}')"
+    )
+
+
+def rate_day_sql(day):
+    # `day`, or the last day rates were loaded for if it is later
+    last_day = f"(SELECT MAX(ld.day) FROM {_table(DailyRate)} ld)"
+    return f"CASE WHEN {day} > {last_day} THEN {last_day} ELSE {day} END"
+
+
+def convert_sql(amount, currency, day, base):
+    # As convert, with the rate read by a lookup on DailyRate's unique index
+    return (
+        f"CASE WHEN {currency} = {base} THEN {amount} ELSE {amount} * (SELECT r.rate FROM {_table(DailyRate)} r "
+        f"WHERE r.currency = {currency} AND r.base = {base} AND r.day = {rate_day_sql(day)}) END"
+    )
+
+
+def rate_join_sql(alias, currency, day, base):
+    # Joins the rate of `currency` to `base` on `day` as `alias`.rate
+    return (
+        f"LEFT JOIN {_table(DailyRate)} {alias} ON {alias}.currency = {currency} AND {alias}.base = {base} "
+        f"AND {alias}.day = {rate_day_sql(day)}"
+    )
+
+
+def converted_amount(user_id, currency, day, amount):
+    # `amount` paid in `currency` on `day` in the base currency of the user
+    # `user_id`, as an expression for the rollup writes to add to a converted
+    # total; NULL if there is no rate
+    sql = convert_sql('%s', '%s', '%s', base_currency_sql('%s'))
+    params = (currency, user_id, amount, amount, currency, user_id, day, day)
+    return RawSQL(sql, params, output_field=AMOUNT_FIELD)
+
+
+def refresh_converted(user_ids):
+    # Recomputes the converted CategorySpend totals of the given users from
+    # their daily rows, after their base currency or the rates they were
+    # converted at changed. A total stays NULL while any of its days has no
+    # rate.
+    spend = _table(CategorySpend)
+    base = base_currency_sql(f'{spend}.user_id')
+    converted = (
+        f"SELECT CASE WHEN COUNT(*) = COUNT(r.rate) THEN COALESCE(SUM(d.total * r.rate), 0) END "
+        f"FROM {_table(DailySpend)} d {rate_join_sql('r', 'd.currency', 'd.day', base)} "
+        f"WHERE d.user_id = {spend}.user_id AND d.category = {spend}.category "
+        f"AND d.currency = {spend}.currency AND d.count > 0"
+    )
+    user_ids = sorted(user_ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(user_ids), REFRESH_USER_CHUNK):
+            chunk = user_ids[start:start + REFRESH_USER_CHUNK]
+            cursor.execute(
+                f"UPDATE {spend} SET converted = CASE WHEN {spend}.currency = {base} THEN {spend}.total "
+                f"ELSE ({converted}) END WHERE {spend}.user_id IN ({', '.join(['%s'] * len(chunk))})",
+                chunk,
+            )
+
+
+def get_unconverted_currencies(user):
+    # The currencies some of the user's spend was paid in on days without a
+    # rate to their base currency; the converted totals leave that spend out
+    return list(
+        CategorySpend.objects.filter(user=user, count__gt=0, converted__isnull=True)
+        .values_list('currency', flat=True)
+        .distinct()
+        .order_by('currency')
+    )
+
+
+class RateCoverage:
+    # Whether amounts in a currency on a day can be converted to `base`. The
+    # first day with a rate for each currency is read once, on the first
+    # foreign-currency question, so validating a large import stays cheap.
+    def __init__(self, base):
+        self.base = base
+        self._first_days = None
+
+    def covers(self, currency, day):
+        if currency == self.base:
+            return True
+        if self._first_days is None:
+            self._first_days = dict(
+                FxRate.objects.filter(base=self.base)
+                .values('currency')
+                .annotate(first_day=Min('day'))
+                .values_list('currency', 'first_day')
+            )
+        first_day = self._first_days.get(currency)
+        return first_day is not None and first_day <= day
+
+
+def get_rate_coverage(user):
+    return RateCoverage(get_base_currency(user))
+
+
+def set_base_currency(user, base):
+    # Every currency the user has spent in needs rates to `base` from its
+    # first expense on, or some of their totals could not be converted
+    coverage = RateCoverage(base)
+    first_days = (
+        DailySpend.objects.filter(user=user, count__gt=0)
+        .values('currency')
+        .annotate(first_day=Min('day'))
+        .values_list('currency', 'first_day')
+    )
+    missing = sorted(currency for currency, first_day in first_days if not coverage.covers(currency, first_day))
+    if missing:
+        raise CurrencyError(f"No exchange rates from {', '.join(missing)} to {base} for all of your expenses.")
+
+    with transaction.atomic():
+        Profile.objects.update_or_create(user=user, defaults={'base_currency': base})
+        refresh_converted([user.pk])
+        versioning.bump(user.pk)
+
+
+def pair_rates(day, quotes, quote_currency):
+    # quotes: {currency: units of quote_currency per unit}. Returns an FxRate
+    # for every ordered pair of the quoted currencies and the quote currency.
+    quotes = {**quotes, quote_currency: Decimal(1)}
+    return [
+        FxRate(day=day, currency=currency, base=base, rate=(quotes[currency] / quotes[base]).quantize(RATE_PLACES))
+        for currency in quotes
+        for base in quotes
+        if currency != base
+    ]
+
+
+def fill_daily_rates(start):
+    # Rebuilds DailyRate from `start` on: each pair's rate on the day before
+    # (itself carried forward) or its latest quote, for every day up to the
+    # last day quoted
+    last_day = FxRate.objects.aggregate(last_day=Max('day'))['last_day']
+    DailyRate.objects.filter(day__gte=start).delete()
+    if last_day is None or last_day < start:
+        return 0
+
+    rates = {
+        (currency, base): value
+        for currency, base, value in DailyRate.objects.filter(day=start - timedelta(days=1))
+        .values_list('currency', 'base', 'rate')
+    }
+    quotes = {}
+    quoted = FxRate.objects.filter(day__gte=start).values_list('day', 'currency', 'base', 'rate')
+    for day, currency, base, value in quoted:
+        quotes.setdefault(day, []).append((currency, base, value))
+
+    batch = []
+    stored = 0
+    for offset in range((last_day - start).days + 1):
+        day = start + timedelta(days=offset)
+        for currency, base, value in quotes.get(day, ()):
+            rates[currency, base] = value
+        batch += [
+            DailyRate(day=day, currency=currency, base=base, rate=value) for (currency, base), value in rates.items()
+        ]
+        if len(batch) >= DAILY_RATES_BATCH:
+            DailyRate.objects.bulk_create(batch)
+            stored += len(batch)
+            batch = []
+    DailyRate.objects.bulk_create(batch)
+    return stored + len(batch)
+
+
+def load_rates(quotes, quote_currency=DEFAULT_CURRENCY):
+    # quotes: iterable of (day, currency, units of quote_currency per unit).
+    # Replaces the stored rates of every day quoted, carries them forward into
+    # DailyRate, and recomputes the converted totals and bumps the data
+    # version of the users they may have changed. Returns the number of rates
+    # stored.
+    by_day = {}
+    for day, currency, value in quotes:
+        if value <= 0:
+            raise CurrencyError(f"Rate for {currency} on {day} must be positive.")
+        by_day.setdefault(day, {})[currency] = value
+    if not by_day:
+        return 0
+
+    stored = 0
+    currencies = {quote_currency}
+    with transaction.atomic():
+        days_quoted = sorted(by_day)
+        for start in range(0, len(days_quoted), LOAD_DAYS_CHUNK):
+            days = days_quoted[start:start + LOAD_DAYS_CHUNK]
+            rates = [pair for day in days for pair in pair_rates(day, by_day[day], quote_currency)]
+            FxRate.objects.filter(day__in=days).delete()
+            FxRate.objects.bulk_create(rates, batch_size=1000)
+            stored += len(rates)
+        for quoted in by_day.values():
+            currencies.update(quoted)
+        fill_daily_rates(min(by_day))
+
+        # A day's rates also apply to the days after it that have none
+        affected = (
+            DailySpend.objects.filter(day__gte=min(by_day), currency__in=currencies, count__gt=0)
+            .exclude(currency=Coalesce(F('user__profile__base_currency'), Value(DEFAULT_CURRENCY)))
+            .values_list('user_id', flat=True)
+            .distinct()
+        )
+        user_ids = set(affected)
+        if user_ids:
+            refresh_converted(user_ids)
+            versioning.bump_many(user_ids)
+    return stored
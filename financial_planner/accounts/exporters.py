@@ -0,0 +1,55 @@
+import csv
+import json
+import zlib
+from .pagination import keyset_page
+
+EXPORT_FIELDS = ('id', 'date', 'description', 'amount', 'category', 'currency')
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    # Pseudo-buffer for csv.writer: hands each formatted line straight back
+    def write(self, value):
+        return value
+
+
+def iter_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    # Walks the rows newest first in bounded keyset pages, as the listing
+    # does. The MySQL driver buffers a whole result set even under
+    # .iterator(), so seeking page by page is what keeps memory flat there.
+    cursor = None
+    while True:
+        rows, cursor = keyset_page(queryset, EXPORT_FIELDS, cursor, chunk_size)
+        yield from rows
+        if cursor is None:
+            return
+
+
+def csv_lines(queryset):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in iter_rows(queryset):
+        yield writer.writerow([
+            row['id'], row['date'].isoformat(), row['description'], row['amount'], row['category'], row['currency'],
+        ])
+
+
+def jsonl_lines(queryset):
+    for row in iter_rows(queryset):
+        yield json.dumps({**row, 'date': row['date'].isoformat(), 'amount': str(row['amount'])}) + '\n'
+
+
+def gzip_stream(lines, flush_every=64 * 1024):
+    # Compress on the fly, emitting a gzip member piece by piece
+    compressor = zlib.compressobj(wbits=31)
+    pending = 0
+    for line in lines:
+        data = line.encode()
+        pending += len(data)
+        chunk = compressor.compress(data)
+        if pending >= flush_every:
+            chunk += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        if chunk:
+            yield chunk
+    yield compressor.flush()
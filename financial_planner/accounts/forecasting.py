@@ -0,0 +1,118 @@
+import calendar
+from datetime import datetime, time, timedelta
+import numpy as np
+from django.utils import timezone
+from .models import DailySpend
+from . import caching, currency
+
+# Month-end spend projections per category. Each category's run rate (mean
+# spend per day over the last HISTORY_DAYS of daily rollup rows) is scaled by
+# a weekday profile (how that weekday compares to the average day) and summed
+# over the days left in the month; the views add that to the spend so far this
+# month and compare the sum with the budget.
+#
+# Projections are cached per user under the data version, so they are only
+# recomputed after the user's data changes, and until midnight, when there is
+# a day less to go.
+
+HISTORY_DAYS = 84  # Twelve weeks, so every weekday is seen twelve times
+# Pseudo-days at the run rate added to every weekday, so a single expensive
+# Saturday does not make every Saturday look expensive
+PROFILE_PRIOR_DAYS = 2
+
+
+def seconds_until_midnight():
+    now = timezone.localtime()
+    midnight = timezone.make_aware(datetime.combine(now.date() + timedelta(days=1), time.min), now.tzinfo)
+    return max(1, int((midnight - now).total_seconds()))
+
+
+def weekday_counts(start, days):
+    # How many of each weekday (Monday first) the `days` days from `start` hold
+    return np.bincount((start.weekday() + np.arange(days)) % 7, minlength=7)
+
+
+def project(rows, as_of, history_days=HISTORY_DAYS):
+    # rows: (day, category, total) up to and including as_of. Returns
+    # (categories, spend expected from the day after as_of to month end).
+    if not rows:
+        return [], np.zeros(0)
+    categories = sorted({category for _, category, _ in rows})
+    index = {category: i for i, category in enumerate(categories)}
+    # History starts at the window's first day with any spend, so a new user
+    # is not averaged over weeks before they signed up
+    start = max(as_of - timedelta(days=history_days - 1), min(day for day, _, _ in rows))
+    days = (as_of - start).days + 1
+
+    matrix = np.zeros((len(categories), days))
+    np.add.at(
+        matrix,
+        (
+            np.fromiter((index[category] for _, category, _ in rows), dtype=np.intp, count=len(rows)),
+            np.fromiter(((day - start).days for day, _, _ in rows), dtype=np.intp, count=len(rows)),
+        ),
+        np.fromiter((total for _, _, total in rows), dtype=float, count=len(rows)),
+    )
+
+    run_rate = matrix.sum(axis=1) / days
+    weekdays = np.eye(7)[(start.weekday() + np.arange(days)) % 7]  # days x 7, one-hot
+    weekday_mean = (matrix @ weekdays + PROFILE_PRIOR_DAYS * run_rate[:, None]) / (
+        weekday_counts(start, days) + PROFILE_PRIOR_DAYS
+    )
+    profile = np.divide(weekday_mean, run_rate[:, None], out=np.ones_like(weekday_mean), where=run_rate[:, None] > 0)
+
+    month_end = as_of.replace(day=calendar.monthrange(as_of.year, as_of.month)[1])
+    remaining = weekday_counts(as_of + timedelta(days=1), (month_end - as_of).days)
+    return categories, run_rate * (profile @ remaining)
+
+
+def compute_forecast(user, as_of=None):
+    as_of = as_of or timezone.localdate()
+    base = currency.get_base_currency(user)
+    # One row per day, category and currency paid in, converted to the base
+    # currency; project() adds up rows that share a day and category. Rows
+    # without an exchange rate are skipped; the pages showing the forecast
+    # say which currencies that leaves out (currency.get_unconverted_currencies).
+    rows = [
+        row for row in
+        DailySpend.objects.filter(
+            user=user, count__gt=0, day__gt=as_of - timedelta(days=HISTORY_DAYS), day__lte=as_of,
+        )
+        .annotate(converted=currency.convert('total', 'currency', 'day', base))
+        .values_list('day', 'category', 'converted')
+        if row[2] is not None
+    ]
+    categories, remaining = project(rows, as_of)
+    # The history window is longer than a month, so it holds all of this month
+    month_start = as_of.replace(day=1)
+    month_to_date = {}
+    for day, category, total in rows:
+        if day >= month_start:
+            month_to_date[category] = month_to_date.get(category, 0.0) + float(total)
+    return {
+        'as_of': as_of,
+        'currency': base,
+        'month_to_date': {category: round(amount, 2) for category, amount in month_to_date.items()},
+        'remaining': {category: round(float(amount), 2) for category, amount in zip(categories, remaining)},
+    }
+
+
+def get_forecast(user):
+    # {'as_of': date, 'currency': the user's base currency,
+    # 'month_to_date': {category: spend from the first of the month to as_of},
+    # 'remaining': {category: spend expected by month end}};
+    # the notification page caches its whole context and computes it directly
+    return caching.get_user_data(user, 'forecast', lambda: compute_forecast(user), timeout=seconds_until_midnight())
+
+
+def with_projections(categories, forecast):
+    # Adds the projected month-end spend and any projected overshoot of the
+    # budget to each category dict ('name', 'budget'). The projection starts
+    # from this month's spend, not the all-time total in 'expenses'.
+    month_to_date, remaining = forecast['month_to_date'], forecast['remaining']
+    for category in categories:
+        budget = float(category['budget'])
+        projected = round(month_to_date.get(category['name'], 0.0) + remaining.get(category['name'], 0.0), 2)
+        category['projected'] = projected
+        category['projected_overshoot'] = round(max(projected - budget, 0.0), 2) if budget > 0 else 0.0
+    return categories
@@ -1,6 +1,6 @@
 from django import forms
 from django.contrib.auth.models import User
-from .models import Expense, Profile
+from .models import CURRENCY_CHOICES, DEFAULT_CURRENCY, Expense, Profile
 
 class UserRegistrationForm(forms.ModelForm):
     password = forms.CharField(
@@ -31,11 +31,41 @@ class UserRegistrationForm(forms.ModelForm):
 
 class ExpenseForm(forms.ModelForm):
     date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
-    category = forms.ChoiceField(choices=Expense.CATEGORY_CHOICES, widget=forms.Select())
+    category = forms.ChoiceField(choices=[], widget=forms.Select())
+    # Left out, a new expense is in the user's base currency and an edited one keeps its own
+    currency = forms.ChoiceField(choices=CURRENCY_CHOICES, required=False)
 
     class Meta:
         model = Expense
-        fields = ['date', 'description', 'amount', 'category']
+        fields = ['date', 'description', 'amount', 'currency', 'category']
+
+    def __init__(self, *args, categories=(), rates=None, **kwargs):
+        # categories: the names of the user's categories, the only valid choices;
+        # rates: the user's currency.RateCoverage, when a foreign-currency
+        # amount must be convertible to their base currency to be accepted
+        super().__init__(*args, **kwargs)
+        self.fields['category'].choices = [(name, name) for name in categories]
+        self.rates = rates
+
+    def clean_currency(self):
+        if self.cleaned_data['currency']:
+            return self.cleaned_data['currency']
+        if not self.instance._state.adding:
+            return self.instance.currency
+        return self.rates.base if self.rates is not None else DEFAULT_CURRENCY
+
+    def clean(self):
+        cleaned_data = super().clean()
+        currency = cleaned_data.get('currency')
+        day = cleaned_data.get('date')
+        if self.rates is not None and currency and day and not self.rates.covers(currency, day):
+            self.add_error('currency', f"No exchange rate from {currency} to {self.rates.base} on or before {day}.")
+        return cleaned_data
+
+    def save(self, commit=True):
+        # The model form leaves fields missing from the submitted data alone
+        self.instance.currency = self.cleaned_data['currency']
+        return super().save(commit)
 
 
 class ProfileForm(forms.ModelForm):
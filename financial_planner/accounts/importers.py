@@ -0,0 +1,91 @@
+import csv
+from django.db import transaction
+from .forms import ExpenseForm
+from .models import Expense
+from . import budgets, currency, rollups
+
+CSV_COLUMNS = ['date', 'description', 'amount', 'category']
+# Amounts are taken to be in the user's base currency when this is left out
+OPTIONAL_COLUMNS = ['currency']
+DEFAULT_BATCH_SIZE = 1000
+# Only the first errors are reported row by row; the rest are just counted
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportFormatError(ValueError):
+    # `imported` rows were already committed when the error was hit
+    def __init__(self, message, imported=0):
+        super().__init__(message)
+        self.imported = imported
+
+
+def _insert_batch(batch):
+    with transaction.atomic():
+        Expense.objects.bulk_create(batch)
+        rollups.expenses_added(batch)
+
+
+def import_expenses_csv(user, lines, batch_size=DEFAULT_BATCH_SIZE, max_errors=MAX_REPORTED_ERRORS):
+    # `lines` is any iterable of text lines (an open file, a decoded upload).
+    # Rows are validated with ExpenseForm and inserted one batch per
+    # transaction, so only a single batch is ever held in memory. Text that
+    # fails to decode stops the import after the rows before it are inserted.
+    reader = csv.DictReader(lines)
+    try:
+        header = [name.strip().lower() for name in reader.fieldnames or []]
+    except UnicodeDecodeError:
+        raise ImportFormatError("CSV file must be UTF-8 encoded.") from None
+    missing = [column for column in CSV_COLUMNS if column not in header]
+    if missing:
+        raise ImportFormatError(f"CSV header is missing column(s): {', '.join(missing)}")
+    reader.fieldnames = header
+
+    categories = budgets.get_category_names(user)
+    rates = currency.get_rate_coverage(user)
+    imported = 0
+    failed = 0
+    errors = []
+    batch = []
+
+    try:
+        for row in reader:
+            data = {column: (row.get(column) or '').strip() for column in CSV_COLUMNS + OPTIONAL_COLUMNS}
+            data['currency'] = data['currency'].upper() or rates.base
+            form = ExpenseForm(data, categories=categories, rates=rates)
+            if not form.is_valid():
+                failed += 1
+                if len(errors) < max_errors:
+                    errors.append({
+                        'row': reader.line_num,
+                        'errors': {field: list(messages) for field, messages in form.errors.items()},
+                    })
+                continue
+
+            expense = form.save(commit=False)
+            expense.user = user
+            batch.append(expense)
+            if len(batch) >= batch_size:
+                _insert_batch(batch)
+                imported += len(batch)
+                batch = []
+    except UnicodeDecodeError:
+        decode_failed = True
+    else:
+        decode_failed = False
+
+    if batch:
+        _insert_batch(batch)
+        imported += len(batch)
+    if decode_failed:
+        raise ImportFormatError(
+            f"CSV file must be UTF-8 encoded; stopped after line {reader.line_num}, "
+            f"with {imported} expense(s) before it imported.",
+            imported,
+        )
+
+    return {
+        'imported': imported,
+        'failed': failed,
+        'errors': errors,
+        'errors_truncated': failed > len(errors),
+    }
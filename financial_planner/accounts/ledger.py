@@ -0,0 +1,160 @@
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db.models import BigIntegerField
+from django.db.models.functions import Cast, Round
+from .models import DEFAULT_CURRENCY, Expense
+from . import currency, versioning
+
+# A user's whole ledger as three parallel typed arrays: the date as a day
+# ordinal, the amount in paise (hundredths of the user's base currency) and a
+# small category code. That is 14 bytes a row, against several hundred for a
+# model instance or a dict of date/Decimal/str objects, and NumPy reads the
+# arrays without copying.
+
+DEFAULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+FETCH_CHUNK = 5000
+UNIX_EPOCH_ORDINAL = 719163  # date(1970, 1, 1).toordinal()
+# NumPy types with the same C layout as each array typecode
+DTYPES = {'i': np.intc, 'q': np.longlong, 'H': np.ushort}
+
+
+class Ledger:
+    __slots__ = ('days', 'amounts', 'codes', 'categories', 'currency', 'unconverted')
+
+    def __init__(self, days, amounts, codes, categories, currency=DEFAULT_CURRENCY, unconverted=0):
+        self.days = days                # array('i') of date ordinals, ascending
+        self.amounts = amounts          # array('q') of amounts in paise
+        self.codes = codes              # array('H') of indexes into categories
+        self.categories = categories    # category names, in order of first use
+        self.currency = currency        # the base currency the amounts were converted to
+        self.unconverted = unconverted  # expenses left out for want of an exchange rate
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def nbytes(self):
+        return sum(sys.getsizeof(column) for column in (self.days, self.amounts, self.codes)) + sum(
+            sys.getsizeof(name) for name in self.categories
+        )
+
+    def _column(self, column):
+        # Zero-copy NumPy view of one of the arrays
+        return np.frombuffer(column, dtype=DTYPES[column.typecode])
+
+    def category_totals(self):
+        # {category: total spent} for the categories the user has spent in.
+        # Float sums of whole paise are exact up to 2**53 paise.
+        if not len(self):
+            return {}
+        totals = np.bincount(self._column(self.codes), weights=self._column(self.amounts), minlength=len(self.categories))
+        return {name: Decimal(int(total)).scaleb(-2) for name, total in zip(self.categories, totals)}
+
+    def category_breakdown(self):
+        # Same shape as rollups.get_category_breakdown
+        return sorted(self.category_totals().items())
+
+    def active_day_count(self):
+        # Number of distinct days with at least one expense; the days are sorted
+        if not len(self):
+            return 0
+        return int(np.count_nonzero(np.diff(self._column(self.days)))) + 1
+
+    def to_frame(self):
+        # The date / amount / category frame the analytics engine works on
+        return pd.DataFrame({
+            'date': pd.to_datetime(self._column(self.days) - UNIX_EPOCH_ORDINAL, unit='D'),
+            'amount': self._column(self.amounts) / 100.0,
+            'category': pd.Categorical.from_codes(self._column(self.codes), categories=self.categories),
+        })
+
+
+def load_ledger(user):
+    # One streamed values_list fetch. Amounts are converted to the base
+    # currency and to paise in SQL so no Decimal is created per row.
+    base = currency.get_base_currency(user)
+    amount = currency.convert('amount', 'currency', 'date', base)
+    rows = (
+        Expense.objects.filter(user=user)
+        .annotate(paise=Cast(Round(amount * 100), BigIntegerField()))
+        .order_by('date', 'id')
+        .values_list('date', 'paise', 'category')
+    )
+    days, amounts, codes = array('i'), array('q'), array('H')
+    code_of = {}
+    unconverted = 0
+    for day, paise, category in rows.iterator(chunk_size=FETCH_CHUNK):
+        if paise is None:
+            # No exchange rate to convert it with; counted so the pages built
+            # on the ledger can say their figures leave it out
+            unconverted += 1
+            continue
+        days.append(day.toordinal())
+        amounts.append(paise)
+        code = code_of.get(category)
+        if code is None:
+            code = code_of[category] = len(code_of)
+        codes.append(code)
+    return Ledger(days, amounts, codes, list(code_of), base, unconverted)
+
+
+# Per-process LRU of ledgers, bounded by their total size in bytes. Each user
+# has at most one entry, tagged with the data version it was loaded at.
+_lock = threading.Lock()
+_entries = OrderedDict()  # user id -> (data version, ledger)
+_cached_bytes = 0
+
+
+def _max_bytes():
+    return getattr(settings, 'LEDGER_CACHE_MAX_BYTES', DEFAULT_CACHE_MAX_BYTES)
+
+
+def _evict(user_id):
+    global _cached_bytes
+    _, ledger = _entries.pop(user_id)
+    _cached_bytes -= ledger.nbytes
+
+
+def _store(user_id, version, ledger):
+    global _cached_bytes
+    max_bytes = _max_bytes()
+    with _lock:
+        if user_id in _entries:
+            _evict(user_id)
+        if ledger.nbytes > max_bytes:
+            return
+        while _entries and _cached_bytes + ledger.nbytes > max_bytes:
+            _evict(next(iter(_entries)))
+        _entries[user_id] = (version, ledger)
+        _cached_bytes += ledger.nbytes
+
+
+def get_ledger(user):
+    version = versioning.get_version(user)
+    with _lock:
+        entry = _entries.get(user.pk)
+        if entry is not None and entry[0] == version:
+            _entries.move_to_end(user.pk)
+            return entry[1]
+
+    ledger = load_ledger(user)
+    _store(user.pk, version, ledger)
+    return ledger
+
+
+def cache_info():
+    with _lock:
+        return {'entries': len(_entries), 'bytes': _cached_bytes, 'max_bytes': _max_bytes()}
+
+
+def clear_cache():
+    global _cached_bytes
+    with _lock:
+        _entries.clear()
+        _cached_bytes = 0
@@ -0,0 +1,104 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+from accounts import analytics
+from accounts.models import DEFAULT_CATEGORIES, Expense
+
+
+def orm_analytics(user):
+    # The same figures as analytics.compute_analytics, built from ORM
+    # aggregates and plain Python loops instead of a DataFrame
+    expenses = Expense.objects.filter(user=user)
+
+    monthly = list(
+        expenses.annotate(month=TruncMonth('date')).values('month')
+        .annotate(total=Sum('amount')).order_by('month')
+    )
+
+    daily = dict(expenses.values_list('date').annotate(total=Sum('amount')).order_by('date'))
+    first_day, last_day = min(daily), max(daily)
+    days = [first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+    daily_values = [float(daily.get(day, 0)) for day in days]
+    rolling = {}
+    for window in analytics.ROLLING_WINDOWS:
+        averages = []
+        running = 0.0
+        for i, value in enumerate(daily_values):
+            running += value
+            if i >= window:
+                running -= daily_values[i - window]
+            averages.append(running / min(i + 1, window))
+        rolling[window] = averages
+
+    by_month = {}
+    for row in expenses.annotate(month=TruncMonth('date')).values('month', 'category').annotate(total=Sum('amount')):
+        by_month.setdefault(row['month'], {})[row['category']] = float(row['total'])
+    months = sorted(by_month)
+    deltas = {
+        category: [
+            by_month[months[i]].get(category, 0.0) - by_month[months[i - 1]].get(category, 0.0)
+            for i in range(1, len(months))
+        ]
+        for category in DEFAULT_CATEGORIES
+    }
+
+    count = expenses.count()
+    expense_percentiles = [
+        float(expenses.order_by('amount').values_list('amount', flat=True)[min(count - 1, int(count * q / 100))])
+        for q in analytics.PERCENTILES
+    ]
+    return monthly, rolling, deltas, expense_percentiles
+
+
+class Command(BaseCommand):
+    help = "Time the pandas analytics engine against an ORM-only implementation on a seeded ledger (rolled back afterwards)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--days', type=int, default=3 * 365, help="Spread the rows over this many days.")
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def time_best(self, func, user, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func(user)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def handle(self, *args, **options):
+        rows, days, repeat = options['rows'], options['days'], options['repeat']
+        rng = random.Random(42)
+        start = date.today() - timedelta(days=days)
+
+        # Everything happens in one transaction that is rolled back at the end
+        with transaction.atomic():
+            user = User.objects.create(username=f'benchmark-analytics-{time.time_ns()}')
+            self.stdout.write(f"Seeding {rows} expenses...")
+            batch = []
+            for i in range(rows):
+                batch.append(Expense(
+                    user=user,
+                    date=start + timedelta(days=rng.randrange(days)),
+                    description='benchmark',
+                    amount=Decimal(rng.randrange(100, 500000)) / 100,
+                    category=rng.choice(DEFAULT_CATEGORIES),
+                ))
+                if len(batch) == 10000:
+                    Expense.objects.bulk_create(batch)
+                    batch = []
+            Expense.objects.bulk_create(batch)
+
+            pandas_time = self.time_best(analytics.compute_analytics, user, repeat)
+            orm_time = self.time_best(orm_analytics, user, repeat)
+            self.stdout.write(f"pandas/NumPy engine: {pandas_time * 1000:.0f} ms")
+            self.stdout.write(f"ORM-only:            {orm_time * 1000:.0f} ms")
+            self.stdout.write(self.style.SUCCESS(f"Speed-up: {orm_time / pandas_time:.1f}x"))
+            transaction.set_rollback(True)
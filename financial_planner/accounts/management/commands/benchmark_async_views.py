@@ -0,0 +1,80 @@
+import asyncio
+import statistics
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from accounts import async_views, rollups, views
+from accounts.models import DEFAULT_CATEGORIES, Expense
+
+PAGES = [
+    ('notification', views.build_notification_context, async_views.abuild_notification_context),
+    ('alerts', views.build_alerts_context, async_views.abuild_alerts_context),
+    ('dashboard', views.build_dashboard_context, async_views.abuild_dashboard_context),
+    ('financial_reports', views.build_financial_reports_context, async_views.abuild_financial_reports_context),
+]
+
+
+class Command(BaseCommand):
+    help = "Compare sync and async summary-page context building under a simulated per-query database delay."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delay-ms', type=float, default=20.0, help="Delay added to every SQL query.")
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        delay = options['delay_ms'] / 1000
+        repeat = options['repeat']
+
+        def delayed_execute(execute, sql, params, many, context):
+            time.sleep(delay)
+            return execute(sql, params, many, context)
+
+        # Install the delay on this thread's connection and on every connection the worker threads open
+        def add_delay(sender, connection, **kwargs):
+            connection.execute_wrappers.append(delayed_execute)
+
+        user = User.objects.create_user(username=f'benchmark-async-{time.time_ns()}')
+        try:
+            expenses = [
+                Expense(user=user, date=date(2024, 1, 1) + timedelta(days=i % 200), description='benchmark',
+                        amount=Decimal(i % 90 + 10), category=DEFAULT_CATEGORIES[i % len(DEFAULT_CATEGORIES)])
+                for i in range(2000)
+            ]
+            Expense.objects.bulk_create(expenses)
+            rollups.expenses_added(expenses)
+            user = User.objects.get(pk=user.pk)
+
+            connection_created.connect(add_delay)
+            connection.ensure_connection()
+            connection.execute_wrappers.append(delayed_execute)
+            try:
+                for name, build_sync, build_async in PAGES:
+                    sync_times = []
+                    async_times = []
+                    for _ in range(repeat):
+                        fresh_user = User.objects.get(pk=user.pk)
+                        started = time.perf_counter()
+                        build_sync(fresh_user)
+                        sync_times.append(time.perf_counter() - started)
+
+                        fresh_user = User.objects.get(pk=user.pk)
+                        started = time.perf_counter()
+                        asyncio.run(build_async(fresh_user))
+                        async_times.append(time.perf_counter() - started)
+
+                    sync_ms = statistics.median(sync_times) * 1000
+                    async_ms = statistics.median(async_times) * 1000
+                    self.stdout.write(
+                        f"{name:<18} sync {sync_ms:8.1f} ms   async {async_ms:8.1f} ms   "
+                        f"({sync_ms / async_ms:.1f}x)"
+                    )
+            finally:
+                connection_created.disconnect(add_delay)
+                connection.execute_wrappers.remove(delayed_execute)
+        finally:
+            user.delete()
+            connections.close_all()
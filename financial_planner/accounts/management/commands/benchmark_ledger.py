@@ -0,0 +1,85 @@
+import gc
+import random
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from accounts import ledger
+from accounts.models import DEFAULT_CATEGORIES, Expense
+
+
+def model_instances(user):
+    return list(Expense.objects.filter(user=user))
+
+
+def dict_rows(user):
+    return list(Expense.objects.filter(user=user).values('date', 'amount', 'category'))
+
+
+def decimal_frame(user):
+    # The frame analytics built before the compact ledger
+    rows = Expense.objects.filter(user=user).values_list('date', 'amount', 'category')
+    frame = pd.DataFrame.from_records(list(rows), columns=['date', 'amount', 'category'])
+    frame['date'] = pd.to_datetime(frame['date'])
+    frame['amount'] = frame['amount'].astype('float64')
+    return frame
+
+
+class Command(BaseCommand):
+    help = "Measure the memory a user's ledger takes as model instances, dict rows, a DataFrame and the compact ledger (seeded data is rolled back afterwards)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000)
+        parser.add_argument('--days', type=int, default=3 * 365, help="Spread the rows over this many days.")
+
+    def measure(self, build, user):
+        # Time an untraced build, then trace a second one for the bytes still
+        # allocated once it is built and the peak on the way there
+        started = time.perf_counter()
+        build(user)
+        elapsed = time.perf_counter() - started
+        gc.collect()
+        tracemalloc.start()
+        result = build(user)
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del result
+        return retained, peak, elapsed
+
+    def handle(self, *args, **options):
+        rows, days = options['rows'], options['days']
+        rng = random.Random(42)
+        start = date.today() - timedelta(days=days)
+
+        with transaction.atomic():
+            user = User.objects.create(username=f'benchmark-ledger-{time.time_ns()}')
+            self.stdout.write(f"Seeding {rows} expenses...")
+            Expense.objects.bulk_create((
+                Expense(
+                    user=user,
+                    date=start + timedelta(days=rng.randrange(days)),
+                    description='benchmark',
+                    amount=Decimal(rng.randrange(100, 500000)) / 100,
+                    category=rng.choice(DEFAULT_CATEGORIES),
+                )
+                for _ in range(rows)
+            ), batch_size=10000)
+
+            scale = 100_000 / rows
+            self.stdout.write(f"{'per 100k rows':<18}{'retained':>12}{'peak':>12}{'time':>10}")
+            for label, build in [
+                ('model instances', model_instances),
+                ('dict rows', dict_rows),
+                ('pandas (Decimal)', decimal_frame),
+                ('compact ledger', ledger.load_ledger),
+            ]:
+                retained, peak, elapsed = self.measure(build, user)
+                self.stdout.write(
+                    f"{label:<18}{retained * scale / 2**20:>9.1f} MiB{peak * scale / 2**20:>8.1f} MiB"
+                    f"{elapsed * scale * 1000:>7.0f} ms"
+                )
+            transaction.set_rollback(True)
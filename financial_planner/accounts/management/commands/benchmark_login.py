@@ -0,0 +1,56 @@
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+PASSWORD = 'benchmark-pass-123'
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+class Command(BaseCommand):
+    help = "Measure logins per second and the queries behind a login and a logged-in page view (seeded user is rolled back afterwards)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200)
+        parser.add_argument('--delay-ms', type=float, default=1.0,
+                            help="Delay added to every SQL query, standing in for the database round trip.")
+        parser.add_argument('--fast-hasher', action='store_true',
+                            help="Hash with MD5 so the deliberately slow password hash doesn't hide the request overhead.")
+
+    def handle(self, *args, **options):
+        delay = options['delay_ms'] / 1000
+        hashers = FAST_HASHERS if options['fast_hasher'] else settings.PASSWORD_HASHERS
+
+        def delayed_execute(execute, sql, params, many, context):
+            time.sleep(delay)
+            return execute(sql, params, many, context)
+
+        self.stdout.write(f"Session engine: {settings.SESSION_ENGINE}")
+        with override_settings(PASSWORD_HASHERS=hashers), transaction.atomic():
+            user = User.objects.create_user(username=f'benchmark-login-{time.time_ns()}', password=PASSWORD)
+            credentials = {'username': user.username, 'password': PASSWORD}
+            client = Client(HTTP_HOST='localhost')
+
+            with connection.execute_wrapper(delayed_execute):
+                with CaptureQueriesContext(connection) as queries:
+                    client.post(reverse('login'), credentials)
+                login_queries = len(queries)
+                with CaptureQueriesContext(connection) as queries:
+                    client.get(reverse('profile'))
+                page_queries = len(queries)
+
+                started = time.perf_counter()
+                for _ in range(options['logins']):
+                    client.post(reverse('login'), credentials)
+                elapsed = time.perf_counter() - started
+
+            self.stdout.write(f"Queries per login:            {login_queries}")
+            self.stdout.write(f"Queries per logged-in page:   {page_queries}")
+            self.stdout.write(self.style.SUCCESS(
+                f"{options['logins'] / elapsed:.1f} logins/s ({elapsed / options['logins'] * 1000:.2f} ms each)"
+            ))
+            transaction.set_rollback(True)
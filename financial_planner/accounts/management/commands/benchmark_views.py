@@ -0,0 +1,287 @@
+import json
+import math
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from accounts import profiling, rollups, synthetic, urls
+from accounts.models import Expense
+
+DEFAULT_SIZES = '100,1000,10000'
+DEFAULT_BASELINE = settings.BASE_DIR / 'benchmarks' / 'views_baseline.json'
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+PERCENTILES = (50, 95, 99)
+# Views that can't be timed as a single request
+SKIPPED_VIEWS = {
+    'alert_stream': "streams events until the client disconnects",
+}
+
+
+class Run:
+    # State shared by the scenarios for one data size
+    def __init__(self, user, client):
+        self.user = user
+        self.client = client
+        self.expense = Expense.objects.filter(user=user).order_by('id').first()
+        self.password = synthetic.DEFAULT_PASSWORD
+        self.counter = 0
+
+    def next(self):
+        self.counter += 1
+        return self.counter
+
+    def new_expense(self):
+        # A row for delete_expense to remove, with its rollups kept in step
+        with transaction.atomic():
+            expense = Expense.objects.create(user=self.user, date=date(2024, 1, 1), description='to delete',
+                                             amount=Decimal('1.00'), category='Food')
+            rollups.expense_added(expense)
+        return expense.id
+
+    def new_password(self):
+        old, self.password = self.password, f'{synthetic.DEFAULT_PASSWORD}-{self.next()}'
+        return {'old_password': old, 'new_password': self.password}
+
+    def profile_id(self):
+        # A captured profile for the profile page, made on first use
+        if not profiling.list_profiles():
+            self.client.get(reverse('home'), {'profile': 1})
+        return profiling.list_profiles()[0]['id']
+
+    def relogin(self):
+        self.client.force_login(self.user)
+
+
+def json_body(data):
+    return {'data': json.dumps(data), 'content_type': 'application/json'}
+
+
+def csv_upload(run):
+    content = f"date,description,amount,category\n2024-02-{run.next() % 28 + 1:02d},imported,12.50,Food\n"
+    return {'data': {'file': SimpleUploadedFile('expenses.csv', content.encode(), content_type='text/csv')}}
+
+
+# (label, URL name, method, prepare). prepare(run) returns the path and the
+# keyword arguments of the request; it runs before the timer starts, so
+# writes get fresh targets every time. Read-only pages come first.
+SCENARIOS = [
+    ('home', 'home', 'get', lambda run: (reverse('home'), {})),
+    ('profile', 'profile', 'get', lambda run: (reverse('profile'), {})),
+    ('edit_profile', 'edit_profile', 'get', lambda run: (reverse('edit_profile'), {})),
+    ('register', 'register', 'get', lambda run: (reverse('register'), {})),
+    ('notification', 'notification', 'get', lambda run: (reverse('notification'), {})),
+    ('alerts', 'alerts', 'get', lambda run: (reverse('alerts'), {})),
+    ('dashboard', 'dashboard', 'get', lambda run: (reverse('dashboard'), {})),
+    ('financial_reports', 'financial_reports', 'get', lambda run: (reverse('financial_reports'), {})),
+    ('financial_report_pdf', 'financial_report_pdf', 'get', lambda run: (reverse('financial_report_pdf'), {})),
+    ('notification_async', 'notification_async', 'get', lambda run: (reverse('notification_async'), {})),
+    ('alerts_async', 'alerts_async', 'get', lambda run: (reverse('alerts_async'), {})),
+    ('dashboard_async', 'dashboard_async', 'get', lambda run: (reverse('dashboard_async'), {})),
+    ('financial_reports_async', 'financial_reports_async', 'get',
+     lambda run: (reverse('financial_reports_async'), {})),
+    ('add_expenses GET', 'add_expenses', 'get', lambda run: (reverse('add_expenses'), {})),
+    ('edit_expense GET', 'edit_expense', 'get', lambda run: (reverse('edit_expense', args=[run.expense.id]), {})),
+    ('view_expenses', 'view_expenses', 'get', lambda run: (reverse('view_expenses'), {})),
+    ('get_categories', 'get_categories', 'get', lambda run: (reverse('get_categories'), {})),
+    ('filter_expenses', 'filter_expenses', 'get',
+     lambda run: (reverse('filter_expenses'), {'data': {
+         'category': 'Food', 'start_date': (date.today() - timedelta(days=90)).isoformat(),
+         'end_date': date.today().isoformat(),
+     }})),
+    ('search_expenses', 'search_expenses', 'get',
+     lambda run: (reverse('search_expenses'), {'data': {'q': 'taxi'}})),
+    ('export_expenses', 'export_expenses', 'get', lambda run: (reverse('export_expenses'), {})),
+    ('spend_summary', 'spend_summary', 'get',
+     lambda run: (reverse('spend_summary'), {'data': {'bucket': 'month'}})),
+    ('cache_stats', 'cache_stats', 'get', lambda run: (reverse('cache_stats'), {})),
+    ('metrics', 'metrics', 'get', lambda run: (reverse('metrics'), {})),
+    ('request_profiles', 'request_profiles', 'get', lambda run: (reverse('request_profiles'), {})),
+    ('request_profile', 'request_profile', 'get',
+     lambda run: (reverse('request_profile', args=[run.profile_id()]), {})),
+    ('set-budget GET', 'set-budget', 'get', lambda run: (reverse('set-budget'), {})),
+    ('add_expenses POST', 'add_expenses', 'post', lambda run: (reverse('add_expenses'), {'data': {
+        'date': '2024-03-01', 'description': 'benchmark lunch', 'amount': '45.00', 'category': 'Food',
+    }})),
+    ('edit_expense POST', 'edit_expense', 'post', lambda run: (reverse('edit_expense', args=[run.expense.id]), {
+        'data': {'date': '2024-03-02', 'description': 'edited', 'amount': f'{run.next() % 90 + 10}.00',
+                 'category': 'Food'},
+    })),
+    ('delete_expense', 'delete_expense', 'post', lambda run: (reverse('delete_expense', args=[run.new_expense()]), {})),
+    ('import_expenses', 'import_expenses', 'post', lambda run: (reverse('import_expenses'), csv_upload(run))),
+    ('set-budget POST', 'set-budget', 'post',
+     lambda run: (reverse('set-budget'), json_body({'Food': 5000 + run.next()}))),
+    ('add_category', 'add_category', 'post',
+     lambda run: (reverse('add_category'), json_body({'name': f'Bench {run.next()}', 'budget': 100}))),
+    ('change_password', 'change_password', 'post',
+     lambda run: (reverse('change_password'), json_body(run.new_password()))),
+    ('login', 'login', 'post',
+     lambda run: (reverse('login'), {'data': {'username': run.user.username, 'password': run.password}})),
+    ('logout', 'logout', 'post', lambda run: (reverse('logout'), {})),
+]
+# Requests after which the benchmark user has to be logged back in
+RELOGIN_AFTER = {'logout'}
+
+
+class QueryCounter:
+    # Counts queries on every connection, including the ones the async
+    # views open in worker threads
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, sender, connection, **kwargs):
+        # A worker thread's connection object is reopened between requests;
+        # wrapping it again would count its queries twice
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+def check_coverage():
+    # Every named route in accounts/urls.py is either benchmarked or skipped on purpose
+    names = {pattern.name for pattern in urls.urlpatterns if pattern.name}
+    covered = {url_name for _, url_name, _, _ in SCENARIOS} | set(SKIPPED_VIEWS)
+    return sorted(names - covered)
+
+
+def percentile(values, q):
+    # Nearest-rank percentile
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def time_request(run, counter, label, method, prepare):
+    path, kwargs = prepare(run)
+    counter.count = 0
+    started = time.perf_counter()
+    response = getattr(run.client, method)(path, **kwargs)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    elapsed = time.perf_counter() - started
+    query_count = counter.count
+    if response.status_code >= 400:
+        raise CommandError(f"{label} returned HTTP {response.status_code}.")
+    if label in RELOGIN_AFTER:
+        run.relogin()
+    return elapsed, query_count
+
+
+def compare(results, baseline, tolerance, min_slowdown_ms):
+    # Regressions against the baseline: any extra query, or a median that is
+    # both `tolerance` slower in relative terms and min_slowdown_ms in absolute
+    # ones. The tail percentiles are reported but too noisy to gate on.
+    regressions = []
+    for size, views in results.items():
+        for label, result in views.items():
+            before = baseline.get(size, {}).get(label)
+            if before is None:
+                continue
+            if result['queries'] > before['queries']:
+                regressions.append(f"{label} @ {size} rows: {before['queries']} -> {result['queries']} queries")
+            slowdown = result['p50_ms'] - before['p50_ms']
+            if result['p50_ms'] > before['p50_ms'] * (1 + tolerance) and slowdown > min_slowdown_ms:
+                regressions.append(f"{label} @ {size} rows: p50 {before['p50_ms']} -> {result['p50_ms']} ms")
+    return regressions
+
+
+class Command(BaseCommand):
+    help = ("Time every view in accounts/urls.py through the test client at several ledger sizes, reporting "
+            "latency percentiles and query counts, and fail on regressions against a stored baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default=DEFAULT_SIZES, help="Comma-separated expense counts for the user.")
+        parser.add_argument('--repeat', type=int, default=20, help="Timed requests per view and size.")
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument('--update-baseline', action='store_true',
+                            help="Write the results to the baseline instead of checking against it.")
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help="Allowed relative p50 slowdown before it counts as a regression.")
+        parser.add_argument('--min-slowdown-ms', type=float, default=5.0,
+                            help="Smaller p50 slowdowns are treated as noise.")
+
+    def benchmark_size(self, size, repeat):
+        user_id, = synthetic.generate(1, size, prefix='benchmark-views', seed=size)
+        try:
+            user = User.objects.get(pk=user_id)
+            user.is_staff = True  # for cache_stats and the profile pages
+            user.save(update_fields=['is_staff'])
+            client = Client(HTTP_HOST='localhost')
+            run = Run(user, client)
+            run.relogin()
+
+            counter = QueryCounter()
+            connection_created.connect(counter.install)
+            try:
+                with connection.execute_wrapper(counter):
+                    results = {}
+                    for label, _, method, prepare in SCENARIOS:
+                        time_request(run, counter, label, method, prepare)  # warm-up
+                        times, query_counts = [], []
+                        for _ in range(repeat):
+                            elapsed, query_count = time_request(run, counter, label, method, prepare)
+                            times.append(elapsed * 1000)
+                            query_counts.append(query_count)
+                        results[label] = {
+                            **{f'p{q}_ms': round(percentile(times, q), 2) for q in PERCENTILES},
+                            'queries': max(query_counts),
+                        }
+                return results
+            finally:
+                connection_created.disconnect(counter.install)
+        finally:
+            User.objects.filter(pk=user_id).delete()
+
+    def handle(self, *args, **options):
+        missing = check_coverage()
+        if missing:
+            raise CommandError(f"No benchmark scenario for: {', '.join(missing)}")
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError("--sizes must be a comma-separated list of integers.")
+
+        results = {}
+        # Profiles captured for the profile page go to a scratch directory
+        with tempfile.TemporaryDirectory() as profile_dir, \
+                override_settings(PASSWORD_HASHERS=FAST_HASHERS, REQUEST_PROFILING_DIR=profile_dir):
+            for size in sizes:
+                self.stdout.write(f"\n{size} expenses")
+                self.stdout.write(f"  {'view':<26}{'p50':>9}{'p95':>9}{'p99':>9}{'queries':>9}")
+                results[str(size)] = self.benchmark_size(size, options['repeat'])
+                for label, result in results[str(size)].items():
+                    self.stdout.write(
+                        f"  {label:<26}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+                        f"{result['p99_ms']:>9.2f}{result['queries']:>9}"
+                    )
+
+        baseline_path = options['baseline']
+        if options['update_baseline']:
+            with open(baseline_path, 'w') as baseline_file:
+                json.dump(results, baseline_file, indent=2, sort_keys=True)
+                baseline_file.write('\n')
+            self.stdout.write(self.style.SUCCESS(f"\nBaseline written to {baseline_path}."))
+            return
+
+        try:
+            with open(baseline_path) as baseline_file:
+                baseline = json.load(baseline_file)
+        except FileNotFoundError:
+            raise CommandError(f"No baseline at {baseline_path}; run with --update-baseline first.")
+        regressions = compare(results, baseline, options['tolerance'], options['min_slowdown_ms'])
+        if regressions:
+            raise CommandError("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS("\nNo regressions against the baseline."))
@@ -0,0 +1,64 @@
+import time
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from accounts import synthetic
+
+
+class Command(BaseCommand):
+    help = "Create synthetic users with budgets and expense histories across every category, using batched inserts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--expenses', type=int, default=1000, help="Expenses per user.")
+        parser.add_argument('--recurring', type=int, default=0,
+                            help="Recurring expense schedules per user, left for materialize_recurring.")
+        parser.add_argument('--foreign-share', type=float, default=0.0,
+                            help="Share of expenses paid in a foreign currency (0 to 1); loads rates for the range.")
+        parser.add_argument('--start-date', help="First expense date (YYYY-MM-DD); defaults to a year before --end-date.")
+        parser.add_argument('--end-date', help="Last expense date (YYYY-MM-DD); defaults to today.")
+        parser.add_argument('--extra-categories', type=int, default=0,
+                            help="User-defined categories per user on top of the default four.")
+        parser.add_argument('--prefix', default='synthetic', help="Usernames are <prefix>-1, <prefix>-2, ...")
+        parser.add_argument('--password', default=synthetic.DEFAULT_PASSWORD)
+        parser.add_argument('--seed', type=int, help="Seed for reproducible data.")
+        parser.add_argument('--batch-size', type=int, default=synthetic.BATCH_SIZE, help="Rows per INSERT.")
+
+    def parse_date_option(self, options, name):
+        value = options[name]
+        if value is None:
+            return None
+        parsed = parse_date(value)
+        if parsed is None:
+            raise CommandError(f"--{name.replace('_', '-')} must be a date in YYYY-MM-DD format.")
+        return parsed
+
+    def handle(self, *args, **options):
+        start_date = self.parse_date_option(options, 'start_date')
+        end_date = self.parse_date_option(options, 'end_date')
+        if start_date and start_date > (end_date or date.today()):
+            raise CommandError("--start-date must not be after --end-date.")
+        if options['users'] < 1 or options['expenses'] < 0 or options['recurring'] < 0:
+            raise CommandError("--users must be positive and --expenses and --recurring must not be negative.")
+        if not 0 <= options['foreign_share'] <= 1:
+            raise CommandError("--foreign-share must be between 0 and 1.")
+
+        started = time.perf_counter()
+        user_ids = synthetic.generate(
+            options['users'],
+            options['expenses'],
+            start_date=start_date,
+            end_date=end_date,
+            extra_categories=options['extra_categories'],
+            prefix=options['prefix'],
+            password=options['password'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            recurring_per_user=options['recurring'],
+            foreign_share=options['foreign_share'],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(user_ids)} user(s) with {len(user_ids) * options['expenses']} expense(s) "
+            f"and {len(user_ids) * options['recurring']} recurring schedule(s) in {elapsed:.1f}s."
+        ))
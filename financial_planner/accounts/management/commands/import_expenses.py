@@ -0,0 +1,39 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from accounts.importers import DEFAULT_BATCH_SIZE, ImportFormatError, import_expenses_csv
+
+
+class Command(BaseCommand):
+    help = "Import expenses for a user from a CSV file with date, description, amount and category columns."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('csv_path')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help="Rows inserted per transaction.")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' does not exist.")
+
+        try:
+            with open(options['csv_path'], newline='', encoding='utf-8-sig') as csv_file:
+                result = import_expenses_csv(user, csv_file, batch_size=options['batch_size'])
+        except OSError as e:
+            raise CommandError(f"Could not read {options['csv_path']}: {e}")
+        except ImportFormatError as e:
+            raise CommandError(str(e))
+
+        for error in result['errors']:
+            messages = '; '.join(
+                f"{field}: {' '.join(field_errors)}" for field, field_errors in error['errors'].items()
+            )
+            self.stderr.write(f"Row {error['row']}: {messages}")
+        if result['errors_truncated']:
+            self.stderr.write(f"... {result['failed'] - len(result['errors'])} more invalid row(s) not shown.")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['imported']} expense(s); skipped {result['failed']} invalid row(s)."
+        ))
@@ -0,0 +1,53 @@
+import csv
+import time
+from decimal import Decimal, InvalidOperation
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from accounts import currency
+from accounts.models import CURRENCY_CHOICES, DEFAULT_CURRENCY
+
+
+class Command(BaseCommand):
+    help = (
+        "Load daily exchange rates from a CSV file with date,currency,rate columns, where rate is the price "
+        "of one unit of the currency in the quote currency. Every pair of the currencies quoted on a day is "
+        "stored; days already loaded are replaced."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file to load.")
+        parser.add_argument('--quote', default=DEFAULT_CURRENCY, help="Currency the rates are quoted in.")
+
+    def read_quotes(self, csv_file, known):
+        reader = csv.DictReader(csv_file)
+        missing = [column for column in ('date', 'currency', 'rate') if column not in (reader.fieldnames or [])]
+        if missing:
+            raise CommandError(f"CSV header is missing column(s): {', '.join(missing)}")
+        for row in reader:
+            day = parse_date((row['date'] or '').strip())
+            code = (row['currency'] or '').strip().upper()
+            try:
+                rate = Decimal((row['rate'] or '').strip())
+            except InvalidOperation:
+                rate = None
+            if day is None or code not in known or rate is None or not rate.is_finite():
+                raise CommandError(f"Invalid rate on line {reader.line_num}: {row}")
+            yield day, code, rate
+
+    def handle(self, *args, **options):
+        known = dict(CURRENCY_CHOICES)
+        quote = options['quote'].upper()
+        if quote not in known:
+            raise CommandError(f"Unsupported quote currency: {quote}.")
+
+        started = time.perf_counter()
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as csv_file:
+                stored = currency.load_rates(self.read_quotes(csv_file, known), quote)
+        except OSError as e:
+            raise CommandError(f"Cannot read {options['path']}: {e}")
+        except currency.CurrencyError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {stored} exchange rate(s) in {time.perf_counter() - started:.1f}s."
+        ))
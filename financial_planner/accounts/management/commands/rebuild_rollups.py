@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from accounts import rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-user category and daily spend rollups from the raw Expense rows, or check them with --check."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help="Only process this user id (may be repeated).")
+        parser.add_argument('--check', action='store_true',
+                            help="Report rollups that disagree with the ledger without changing anything.")
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+
+        if options['check']:
+            mismatches = rollups.find_mismatches(user_ids)
+            for table, key, expected, stored in mismatches:
+                self.stdout.write(
+                    f"{table} user={key[0]} key={'/'.join(str(part) for part in key[1:])} "
+                    f"expected total={expected[0]} count={expected[1]} "
+                    f"stored total={stored[0]} count={stored[1]}"
+                )
+            if mismatches:
+                raise CommandError(f"{len(mismatches)} rollup row(s) out of date; run without --check to rebuild.")
+            self.stdout.write(self.style.SUCCESS("Rollups match the expense ledger."))
+            return
+
+        rebuilt = rollups.rebuild_rollups(user_ids)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} rollup row(s)."))
@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from accounts import alert_sweep
+
+
+class Command(BaseCommand):
+    help = "Evaluate every user's budget status in bulk, store it in BudgetAlertState and email digests of the changes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=alert_sweep.SWEEP_USER_CHUNK,
+                            help="Users evaluated per SQL statement.")
+        parser.add_argument('--from-expenses', action='store_true',
+                            help="Aggregate the raw Expense rows instead of reading the CategorySpend rollup.")
+        parser.add_argument('--no-email', action='store_true',
+                            help="Only refresh the alert states; don't send digests.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        users = alert_sweep.evaluate_all(options['chunk_size'], options['from_expenses'])
+        self.stdout.write(f"Evaluated {users} user(s) in {time.perf_counter() - started:.1f}s.")
+
+        if not options['no_email']:
+            sent = alert_sweep.send_digests()
+            self.stdout.write(f"Sent {sent} digest email(s).")
+        self.stdout.write(self.style.SUCCESS("Budget alert sweep complete."))
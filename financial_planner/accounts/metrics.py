@@ -0,0 +1,338 @@
+import atexit
+import bisect
+import hmac
+import json
+import os
+import threading
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.decorators import sync_and_async_middleware
+from . import timing
+
+# Request latency and query count histograms per URL name, request, cache and
+# expense write counters, served in the Prometheus text format at /metrics.
+#
+# Every process keeps its totals in memory; an observation takes one
+# uncontended lock. With METRICS_DIR set, a background thread in each process
+# also writes its totals to <pid>.json there every METRICS_FLUSH_SECONDS if
+# they changed, so no request (or event loop) ever waits on the file, and a
+# scrape adds up the files of all processes, so any worker can answer it.
+# Without it only the process that answers the scrape is reported.
+#
+# /metrics needs the METRICS_TOKEN bearer token or a staff login, unless
+# METRICS_PUBLIC is set.
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_FLUSH_SECONDS = 1.0
+UNMATCHED = 'unmatched'  # Requests that resolved to no URL, so 404s cannot add a series each
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+COUNTERS = {
+    'http_requests_total': 'Requests by URL name, method and status code.',
+    'cache_requests_total': 'Per-user result cache lookups by cached result and outcome.',
+    'expense_writes_total': 'Expense rows created, updated and deleted.',
+}
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('Request latency by URL name.', DURATION_BUCKETS),
+    'http_request_db_queries': ('Database queries per request by URL name.', QUERY_BUCKETS),
+}
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()  # Serializes the file writes
+_counters = {}    # (name, labels) -> total; labels is a tuple of (key, value) pairs
+_histograms = {}  # (name, labels) -> [count per bucket..., count above the last bucket, sum]
+_dirty = False    # Totals changed since the last flush
+_flusher = None   # This process's background flush thread, once started
+_adopted_pid = None
+
+
+def get_directory():
+    directory = getattr(settings, 'METRICS_DIR', None)
+    return str(directory) if directory else None
+
+
+def _inc(name, labels, amount):
+    key = (name, labels)
+    _counters[key] = _counters.get(key, 0) + amount
+
+
+def _observe(name, labels, value):
+    buckets = HISTOGRAMS[name][1]
+    key = (name, labels)
+    values = _histograms.get(key)
+    if values is None:
+        values = _histograms[key] = [0] * (len(buckets) + 2)
+    values[bisect.bisect_left(buckets, value)] += 1
+    values[-1] += value
+
+
+def _changed():
+    # Called with the lock held
+    global _dirty, _flusher
+    _dirty = True
+    if _flusher is None and get_directory() is not None:
+        _flusher = threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True)
+        _flusher.start()
+
+
+def _flush_loop():
+    # Stops once METRICS_DIR is unset; the next observation starts it again
+    global _flusher
+    while True:
+        time.sleep(getattr(settings, 'METRICS_FLUSH_SECONDS', DEFAULT_FLUSH_SECONDS))
+        with _lock:
+            if get_directory() is None:
+                _flusher = None
+                return
+            due = _dirty
+        if due:
+            flush()
+
+
+def inc(name, labels, amount=1):
+    with _lock:
+        _inc(name, labels, amount)
+        _changed()
+
+
+def observe_request(view, method, status, seconds, queries):
+    with _lock:
+        _inc('http_requests_total', (('view', view), ('method', method), ('status', str(status))), 1)
+        _observe('http_request_duration_seconds', (('view', view),), seconds)
+        if queries is not None:
+            _observe('http_request_db_queries', (('view', view),), queries)
+        _changed()
+
+
+def count_cache_lookup(name, hit):
+    inc('cache_requests_total', (('cache', name), ('result', 'hit' if hit else 'miss')))
+
+
+def count_expense_writes(operation, count=1):
+    # operation is 'create', 'update' or 'delete'
+    inc('expense_writes_total', (('operation', operation),), count)
+
+
+def _snapshot(flushing=False):
+    global _dirty
+    with _lock:
+        if flushing:
+            _dirty = False
+        return {
+            'counters': [[name, labels, value] for (name, labels), value in _counters.items()],
+            'histograms': [[name, labels, list(values)] for (name, labels), values in _histograms.items()],
+        }
+
+
+def _read(path):
+    try:
+        with open(path) as snapshot_file:
+            return json.load(snapshot_file)
+    except (OSError, ValueError):
+        return None
+
+
+def _adopt(snapshot):
+    # Totals left by an earlier process with the same pid; kept so that the
+    # merged counters never go backwards
+    with _lock:
+        for name, labels, value in snapshot['counters']:
+            _inc(name, tuple(map(tuple, labels)), value)
+        for name, labels, values in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            current = _histograms.setdefault(key, [0] * len(values))
+            for index, value in enumerate(values):
+                current[index] += value
+
+
+def flush():
+    # Write this process's totals to METRICS_DIR/<pid>.json
+    global _adopted_pid
+    directory = get_directory()
+    if directory is None:
+        return
+    os.makedirs(directory, exist_ok=True)
+    pid = os.getpid()
+    path = os.path.join(directory, f'{pid}.json')
+    with _flush_lock:
+        if _adopted_pid != pid:
+            _adopted_pid = pid
+            previous = _read(path)
+            if previous is not None:
+                _adopt(previous)
+        # Written aside and renamed, so a scrape never reads half a file
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as snapshot_file:
+            json.dump(_snapshot(flushing=True), snapshot_file)
+        os.replace(temporary, path)
+
+
+def collect():
+    # (counters, histograms) summed over every process that reported
+    directory = get_directory()
+    if directory is None:
+        snapshots = [_snapshot()]
+    else:
+        flush()
+        snapshots = [
+            _read(os.path.join(directory, name))
+            for name in os.listdir(directory) if name.endswith('.json')
+        ]
+
+    counters = {}
+    histograms = {}
+    for snapshot in filter(None, snapshots):
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            current = histograms.setdefault(key, [0] * len(values))
+            for index, value in enumerate(values):
+                current[index] += value
+    return counters, histograms
+
+
+def route_names():
+    # Named routes of the accounts app; imported here because the URLconf
+    # imports the views, which import this module
+    from . import urls
+    return sorted({pattern.name for pattern in urls.urlpatterns if pattern.name})
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _series(name, labels, value):
+    label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}'
+
+
+def render():
+    counters, histograms = collect()
+    # Every route is reported, with zero counts until it is first requested
+    for view in route_names():
+        for name in HISTOGRAMS:
+            buckets = HISTOGRAMS[name][1]
+            histograms.setdefault((name, (('view', view),)), [0] * (len(buckets) + 2))
+
+    lines = []
+    for name, help_text in COUNTERS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        lines += [
+            _series(name, labels, value)
+            for (series_name, labels), value in sorted(counters.items()) if series_name == name
+        ]
+
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for (series_name, labels), values in sorted(histograms.items()):
+            if series_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(list(map(float, buckets)) + ['+Inf'], values[:-1]):
+                cumulative += count
+                lines.append(_series(f'{name}_bucket', labels + (('le', bound),), cumulative))
+            lines.append(_series(f'{name}_sum', labels, round(values[-1], 6)))
+            lines.append(_series(f'{name}_count', labels, cumulative))
+
+    # Derived from cache_requests_total at scrape time
+    lookups = {}
+    for (name, labels), value in counters.items():
+        if name == 'cache_requests_total':
+            labels = dict(labels)
+            hits, total = lookups.get(labels['cache'], (0, 0))
+            lookups[labels['cache']] = (hits + (value if labels['result'] == 'hit' else 0), total + value)
+    lines += [
+        '# HELP cache_hit_ratio Share of per-user result cache lookups that were hits.',
+        '# TYPE cache_hit_ratio gauge',
+    ]
+    lines += [
+        _series('cache_hit_ratio', (('cache', cache_name),), round(hits / total, 4))
+        for cache_name, (hits, total) in sorted(lookups.items())
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def is_authorized(request):
+    # The METRICS_TOKEN bearer token or a staff login, unless METRICS_PUBLIC
+    if getattr(settings, 'METRICS_PUBLIC', False):
+        return True
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        supplied = request.headers.get('Authorization', '')
+        if hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode()):
+            return True
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_authenticated and user.is_staff)
+
+
+def reset():
+    # Forget this process's totals (tests, and forked children)
+    global _dirty, _adopted_pid
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _dirty = False
+        _adopted_pid = None
+
+
+def _reset_after_fork():
+    # A forked worker must not report its parent's totals again, and the
+    # parent's flush thread does not exist in it
+    global _flusher
+    reset()
+    _flusher = None
+
+
+def _flush_at_exit():
+    if _dirty:
+        flush()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(_flush_at_exit)
+
+
+def _observe_response(request, response, started):
+    match = request.resolver_match
+    timings = timing.get_current()
+    observe_request(
+        match.view_name if match else UNMATCHED,
+        request.method,
+        response.status_code,
+        time.perf_counter() - started,
+        timings.queries if timings else None,
+    )
+
+
+@sync_and_async_middleware
+def request_metrics_middleware(get_response):
+    # Goes right after the timing middleware, whose collector counts the queries
+    if not getattr(settings, 'METRICS_ENABLED', True):
+        raise MiddlewareNotUsed
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            started = time.perf_counter()
+            response = await get_response(request)
+            _observe_response(request, response, started)
+            return response
+
+        markcoroutinefunction(middleware)
+        return middleware
+
+    def middleware(request):
+        started = time.perf_counter()
+        response = get_response(request)
+        _observe_response(request, response, started)
+        return response
+
+    return middleware
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.6 on 2026-10-18 08:12
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+import django.db.models.deletion
+
+
+def populate_category_spend(apps, schema_editor):
+    Expense = apps.get_model('accounts', 'Expense')
+    CategorySpend = apps.get_model('accounts', 'CategorySpend')
+    rows = (
+        Expense.objects.values('user_id', 'category')
+        .annotate(total=Sum('amount'), count=Count('id'))
+        .order_by()
+    )
+    CategorySpend.objects.bulk_create(
+        [
+            CategorySpend(user_id=row['user_id'], category=row['category'], total=row['total'], count=row['count'])
+            for row in rows.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0005_remove_profile_budget_profile_entertainment_budget_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategorySpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('Food', 'Food'), ('Utilities', 'Utilities'), ('Entertainment', 'Entertainment'), ('Others', 'Others')], max_length=20)),
+                ('total', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_spend', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'category')},
+            },
+        ),
+        migrations.RunPython(populate_category_spend, migrations.RunPython.noop),
+    ]
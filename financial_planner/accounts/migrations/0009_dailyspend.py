@@ -0,0 +1,52 @@
+# Generated by Django 4.2.6 on 2026-10-18 08:23
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+import django.db.models.deletion
+
+
+def populate_daily_spend(apps, schema_editor):
+    Expense = apps.get_model('accounts', 'Expense')
+    DailySpend = apps.get_model('accounts', 'DailySpend')
+    rows = (
+        Expense.objects.values('user_id', 'date', 'category')
+        .annotate(total=Sum('amount'), count=Count('id'))
+        .order_by()
+    )
+    batch = []
+    for row in rows.iterator():
+        batch.append(DailySpend(
+            user_id=row['user_id'], day=row['date'], category=row['category'],
+            total=row['total'], count=row['count'],
+        ))
+        if len(batch) >= 1000:
+            DailySpend.objects.bulk_create(batch)
+            batch = []
+    DailySpend.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0008_dataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('category', models.CharField(choices=[('Food', 'Food'), ('Utilities', 'Utilities'), ('Entertainment', 'Entertainment'), ('Others', 'Others')], max_length=20)),
+                ('total', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_spend', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'day', 'category')},
+            },
+        ),
+        migrations.RunPython(populate_daily_spend, migrations.RunPython.noop),
+    ]
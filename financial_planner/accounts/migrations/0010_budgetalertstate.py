@@ -0,0 +1,32 @@
+# Generated by Django 4.2.6 on 2026-10-18 08:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0009_dailyspend'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BudgetAlertState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('Food', 'Food'), ('Utilities', 'Utilities'), ('Entertainment', 'Entertainment'), ('Others', 'Others')], max_length=20)),
+                ('status', models.CharField(blank=True, choices=[('', 'OK'), ('warning', 'Warning'), ('alert', 'Alert')], default='', max_length=10)),
+                ('expenses', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('budget', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('notified_status', models.CharField(blank=True, choices=[('', 'OK'), ('warning', 'Warning'), ('alert', 'Alert')], default='', max_length=10)),
+                ('evaluated_at', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='budget_alert_states', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'category')},
+            },
+        ),
+    ]
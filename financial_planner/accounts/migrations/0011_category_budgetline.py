@@ -0,0 +1,131 @@
+# Generated by Django 4.2.6 on 2026-10-18 08:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# The four categories that used to be hard-coded, with their old Profile columns
+BUDGET_FIELDS = {
+    'Food': 'food_budget',
+    'Utilities': 'utilities_budget',
+    'Entertainment': 'entertainment_budget',
+    'Others': 'others_budget',
+}
+USER_CHUNK = 500
+
+
+def copy_budgets(apps, schema_editor):
+    # Every user gets the old four categories, with the budgets from their
+    # profile, plus any other category name their expenses already use
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Profile = apps.get_model('accounts', 'Profile')
+    Expense = apps.get_model('accounts', 'Expense')
+    Category = apps.get_model('accounts', 'Category')
+    BudgetLine = apps.get_model('accounts', 'BudgetLine')
+
+    user_ids = list(User.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(user_ids), USER_CHUNK):
+        chunk = user_ids[start:start + USER_CHUNK]
+        profiles = {
+            row['user_id']: row
+            for row in Profile.objects.filter(user_id__in=chunk).values('user_id', *BUDGET_FIELDS.values())
+        }
+        names = {(user_id, name) for user_id in chunk for name in BUDGET_FIELDS}
+        used = Expense.objects.filter(user_id__in=chunk).values_list('user_id', 'category').order_by().distinct()
+        extra = sorted(set(used) - names)
+
+        Category.objects.bulk_create(
+            [Category(user_id=user_id, name=name) for user_id in chunk for name in BUDGET_FIELDS]
+            + [Category(user_id=user_id, name=name) for user_id, name in extra]
+        )
+        category_ids = {
+            (user_id, name): category_id
+            for category_id, user_id, name in Category.objects.filter(user_id__in=chunk).values_list('id', 'user_id', 'name')
+        }
+        BudgetLine.objects.bulk_create([
+            BudgetLine(category_id=category_ids[(user_id, name)], amount=profile[field] or 0)
+            for user_id, profile in profiles.items()
+            for name, field in BUDGET_FIELDS.items()
+        ])
+
+
+def restore_budgets(apps, schema_editor):
+    Profile = apps.get_model('accounts', 'Profile')
+    BudgetLine = apps.get_model('accounts', 'BudgetLine')
+
+    budgets = {}
+    lines = BudgetLine.objects.filter(category__name__in=list(BUDGET_FIELDS)).values_list(
+        'category__user_id', 'category__name', 'amount'
+    )
+    for user_id, name, amount in lines.iterator():
+        budgets.setdefault(user_id, {})[BUDGET_FIELDS[name]] = amount
+    for user_id, fields in budgets.items():
+        Profile.objects.filter(user_id=user_id).update(**fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0010_budgetalertstate'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='budgetalertstate',
+            name='category',
+            field=models.CharField(max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='categoryspend',
+            name='category',
+            field=models.CharField(max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='dailyspend',
+            name='category',
+            field=models.CharField(max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='expense',
+            name='category',
+            field=models.CharField(default='Others', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=20)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='categories', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['id'],
+                'unique_together': {('user', 'name')},
+            },
+        ),
+        migrations.CreateModel(
+            name='BudgetLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='budget_line', to='accounts.category')),
+            ],
+        ),
+        migrations.RunPython(copy_budgets, restore_budgets),
+        migrations.RemoveField(
+            model_name='profile',
+            name='entertainment_budget',
+        ),
+        migrations.RemoveField(
+            model_name='profile',
+            name='food_budget',
+        ),
+        migrations.RemoveField(
+            model_name='profile',
+            name='others_budget',
+        ),
+        migrations.RemoveField(
+            model_name='profile',
+            name='utilities_budget',
+        ),
+    ]
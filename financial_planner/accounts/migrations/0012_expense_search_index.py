@@ -0,0 +1,58 @@
+from django.db import migrations
+
+# The DDL is spelled out here rather than taken from accounts.search, so later
+# changes to that module cannot change what this migration does.
+
+SQLITE_INSTALL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS accounts_expense_fts USING fts5("
+    "description, user_id, content='accounts_expense', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    """CREATE TRIGGER IF NOT EXISTS accounts_expense_fts_ai AFTER INSERT ON accounts_expense BEGIN
+        INSERT INTO accounts_expense_fts(rowid, description, user_id) VALUES (new.id, new.description, new.user_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS accounts_expense_fts_ad AFTER DELETE ON accounts_expense BEGIN
+        INSERT INTO accounts_expense_fts(accounts_expense_fts, rowid, description, user_id)
+        VALUES ('delete', old.id, old.description, old.user_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS accounts_expense_fts_au AFTER UPDATE OF description, user_id ON accounts_expense BEGIN
+        INSERT INTO accounts_expense_fts(accounts_expense_fts, rowid, description, user_id)
+        VALUES ('delete', old.id, old.description, old.user_id);
+        INSERT INTO accounts_expense_fts(rowid, description, user_id) VALUES (new.id, new.description, new.user_id);
+    END""",
+    # Index the rows that already exist
+    "INSERT INTO accounts_expense_fts(accounts_expense_fts) VALUES ('rebuild')",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS accounts_expense_fts_ai",
+    "DROP TRIGGER IF EXISTS accounts_expense_fts_ad",
+    "DROP TRIGGER IF EXISTS accounts_expense_fts_au",
+    "DROP TABLE IF EXISTS accounts_expense_fts",
+]
+MYSQL_INSTALL = ["CREATE FULLTEXT INDEX expense_description_ft ON accounts_expense (description)"]
+MYSQL_DROP = ["DROP INDEX expense_description_ft ON accounts_expense"]
+
+
+def _run(schema_editor, statements):
+    with schema_editor.connection.cursor() as cursor:
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            cursor.execute(sql)
+
+
+def create_search_index(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_INSTALL, 'mysql': MYSQL_INSTALL})
+
+
+def drop_search_index(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_DROP, 'mysql': MYSQL_DROP})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_category_budgetline'),
+    ]
+
+    operations = [
+        # MySQL FULLTEXT index, or an FTS5 table plus sync triggers on SQLite
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 4.2.6 on 2026-10-18 09:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Adding the column rebuilds accounts_expense on SQLite, which drops the
+# full-text search triggers of migration 0012. They are recreated from a copy
+# of its DDL, so later changes to accounts.search cannot change this migration.
+SQLITE_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS accounts_expense_fts_ai AFTER INSERT ON accounts_expense BEGIN
+        INSERT INTO accounts_expense_fts(rowid, description, user_id) VALUES (new.id, new.description, new.user_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS accounts_expense_fts_ad AFTER DELETE ON accounts_expense BEGIN
+        INSERT INTO accounts_expense_fts(accounts_expense_fts, rowid, description, user_id)
+        VALUES ('delete', old.id, old.description, old.user_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS accounts_expense_fts_au AFTER UPDATE OF description, user_id ON accounts_expense BEGIN
+        INSERT INTO accounts_expense_fts(accounts_expense_fts, rowid, description, user_id)
+        VALUES ('delete', old.id, old.description, old.user_id);
+        INSERT INTO accounts_expense_fts(rowid, description, user_id) VALUES (new.id, new.description, new.user_id);
+    END""",
+    "INSERT INTO accounts_expense_fts(accounts_expense_fts) VALUES ('rebuild')",
+]
+
+
+def reinstall_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for sql in SQLITE_TRIGGERS:
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0012_expense_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurringExpense',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('description', models.TextField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('category', models.CharField(default='Others', max_length=20)),
+                ('cadence', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly'), ('monthly', 'Monthly'), ('yearly', 'Yearly')], default='monthly', max_length=10)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('next_due', models.DateField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='recurringexpense',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurring_expenses', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='recurring',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='expenses', to='accounts.recurringexpense'),
+        ),
+        migrations.AddConstraint(
+            model_name='expense',
+            constraint=models.UniqueConstraint(fields=('recurring', 'date'), name='expense_recurring_date_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='recurringexpense',
+            index=models.Index(fields=['next_due'], name='recurring_next_due_idx'),
+        ),
+        migrations.RunPython(reinstall_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 4.2.6 on 2026-10-18 10:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# SQLite rebuilds the expense table to add the column, which drops the
+# full-text search triggers of migration 0012. They are recreated from a copy
+# of its DDL, so later changes to accounts.search cannot change this migration.
+SQLITE_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS accounts_expense_fts_ai AFTER INSERT ON accounts_expense BEGIN
+        INSERT INTO accounts_expense_fts(rowid, description, user_id) VALUES (new.id, new.description, new.user_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS accounts_expense_fts_ad AFTER DELETE ON accounts_expense BEGIN
+        INSERT INTO accounts_expense_fts(accounts_expense_fts, rowid, description, user_id)
+        VALUES ('delete', old.id, old.description, old.user_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS accounts_expense_fts_au AFTER UPDATE OF description, user_id ON accounts_expense BEGIN
+        INSERT INTO accounts_expense_fts(accounts_expense_fts, rowid, description, user_id)
+        VALUES ('delete', old.id, old.description, old.user_id);
+        INSERT INTO accounts_expense_fts(rowid, description, user_id) VALUES (new.id, new.description, new.user_id);
+    END""",
+    "INSERT INTO accounts_expense_fts(accounts_expense_fts) VALUES ('rebuild')",
+]
+
+
+def reinstall_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for sql in SQLITE_TRIGGERS:
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0013_recurringexpense'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FxRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('currency', models.CharField(choices=[('INR', 'Indian Rupee'), ('USD', 'US Dollar'), ('EUR', 'Euro'), ('GBP', 'British Pound'), ('JPY', 'Japanese Yen'), ('AED', 'UAE Dirham'), ('SGD', 'Singapore Dollar'), ('THB', 'Thai Baht'), ('AUD', 'Australian Dollar'), ('CAD', 'Canadian Dollar'), ('CHF', 'Swiss Franc')], max_length=3)),
+                ('base', models.CharField(choices=[('INR', 'Indian Rupee'), ('USD', 'US Dollar'), ('EUR', 'Euro'), ('GBP', 'British Pound'), ('JPY', 'Japanese Yen'), ('AED', 'UAE Dirham'), ('SGD', 'Singapore Dollar'), ('THB', 'Thai Baht'), ('AUD', 'Australian Dollar'), ('CAD', 'Canadian Dollar'), ('CHF', 'Swiss Franc')], max_length=3)),
+                ('rate', models.DecimalField(decimal_places=10, max_digits=20)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='categoryspend',
+            unique_together=set(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyspend',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='categoryspend',
+            name='currency',
+            field=models.CharField(choices=[('INR', 'Indian Rupee'), ('USD', 'US Dollar'), ('EUR', 'Euro'), ('GBP', 'British Pound'), ('JPY', 'Japanese Yen'), ('AED', 'UAE Dirham'), ('SGD', 'Singapore Dollar'), ('THB', 'Thai Baht'), ('AUD', 'Australian Dollar'), ('CAD', 'Canadian Dollar'), ('CHF', 'Swiss Franc')], default='INR', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='dailyspend',
+            name='currency',
+            field=models.CharField(choices=[('INR', 'Indian Rupee'), ('USD', 'US Dollar'), ('EUR', 'Euro'), ('GBP', 'British Pound'), ('JPY', 'Japanese Yen'), ('AED', 'UAE Dirham'), ('SGD', 'Singapore Dollar'), ('THB', 'Thai Baht'), ('AUD', 'Australian Dollar'), ('CAD', 'Canadian Dollar'), ('CHF', 'Swiss Franc')], default='INR', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='currency',
+            field=models.CharField(choices=[('INR', 'Indian Rupee'), ('USD', 'US Dollar'), ('EUR', 'Euro'), ('GBP', 'British Pound'), ('JPY', 'Japanese Yen'), ('AED', 'UAE Dirham'), ('SGD', 'Singapore Dollar'), ('THB', 'Thai Baht'), ('AUD', 'Australian Dollar'), ('CAD', 'Canadian Dollar'), ('CHF', 'Swiss Franc')], default='INR', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='base_currency',
+            field=models.CharField(choices=[('INR', 'Indian Rupee'), ('USD', 'US Dollar'), ('EUR', 'Euro'), ('GBP', 'British Pound'), ('JPY', 'Japanese Yen'), ('AED', 'UAE Dirham'), ('SGD', 'Singapore Dollar'), ('THB', 'Thai Baht'), ('AUD', 'Australian Dollar'), ('CAD', 'Canadian Dollar'), ('CHF', 'Swiss Franc')], default='INR', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='recurringexpense',
+            name='currency',
+            field=models.CharField(choices=[('INR', 'Indian Rupee'), ('USD', 'US Dollar'), ('EUR', 'Euro'), ('GBP', 'British Pound'), ('JPY', 'Japanese Yen'), ('AED', 'UAE Dirham'), ('SGD', 'Singapore Dollar'), ('THB', 'Thai Baht'), ('AUD', 'Australian Dollar'), ('CAD', 'Canadian Dollar'), ('CHF', 'Swiss Franc')], default='INR', max_length=3),
+        ),
+        migrations.AlterUniqueTogether(
+            name='categoryspend',
+            unique_together={('user', 'category', 'currency')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyspend',
+            unique_together={('user', 'day', 'category', 'currency')},
+        ),
+        migrations.AddIndex(
+            model_name='dailyspend',
+            index=models.Index(fields=['user', 'category', 'currency'], name='dailyspend_user_cat_cur_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='fxrate',
+            constraint=models.UniqueConstraint(fields=('currency', 'base', 'day'), name='fxrate_pair_day_uniq'),
+        ),
+        migrations.RunPython(reinstall_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 4.2.6 on 2026-10-18 10:42
+
+from datetime import timedelta
+from django.db import migrations, models
+
+# The existing rates are carried forward into DailyRate and the converted
+# category totals computed from the daily rollup rows, with a copy of the
+# logic in accounts.currency as it stands, so later changes to that module
+# cannot change this migration.
+
+CONVERTED_SQL = """
+    UPDATE accounts_categoryspend SET converted = CASE
+        WHEN accounts_categoryspend.currency = {base} THEN accounts_categoryspend.total
+        ELSE (
+            SELECT CASE WHEN COUNT(*) = COUNT(r.rate) THEN COALESCE(SUM(d.total * r.rate), 0) END
+            FROM accounts_dailyspend d
+            LEFT JOIN accounts_dailyrate r ON r.currency = d.currency AND r.base = {base}
+                AND r.day = CASE WHEN d.day > (SELECT MAX(ld.day) FROM accounts_dailyrate ld)
+                    THEN (SELECT MAX(ld.day) FROM accounts_dailyrate ld) ELSE d.day END
+            WHERE d.user_id = accounts_categoryspend.user_id AND d.category = accounts_categoryspend.category
+                AND d.currency = accounts_categoryspend.currency AND d.count > 0
+        )
+    END
+""".format(base=(
+    "COALESCE((SELECT bp.base_currency FROM accounts_profile bp "
+    "WHERE bp.user_id = accounts_categoryspend.user_id), 'INR')"
+))
+
+
+def fill_rates_and_totals(apps, schema_editor):
+    FxRate = apps.get_model('accounts', 'FxRate')
+    DailyRate = apps.get_model('accounts', 'DailyRate')
+    quotes = {}
+    for day, currency, base, rate in FxRate.objects.values_list('day', 'currency', 'base', 'rate'):
+        quotes.setdefault(day, []).append((currency, base, rate))
+    if quotes:
+        rates = {}
+        batch = []
+        first_day, last_day = min(quotes), max(quotes)
+        for offset in range((last_day - first_day).days + 1):
+            day = first_day + timedelta(days=offset)
+            for currency, base, rate in quotes.get(day, ()):
+                rates[currency, base] = rate
+            batch += [
+                DailyRate(day=day, currency=currency, base=base, rate=rate) for (currency, base), rate in rates.items()
+            ]
+            if len(batch) >= 1000:
+                DailyRate.objects.bulk_create(batch)
+                batch = []
+        DailyRate.objects.bulk_create(batch)
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(CONVERTED_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_currencies'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categoryspend',
+            name='converted',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=14, null=True),
+        ),
+        migrations.CreateModel(
+            name='DailyRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('currency', models.CharField(choices=[('INR', 'Indian Rupee'), ('USD', 'US Dollar'), ('EUR', 'Euro'), ('GBP', 'British Pound'), ('JPY', 'Japanese Yen'), ('AED', 'UAE Dirham'), ('SGD', 'Singapore Dollar'), ('THB', 'Thai Baht'), ('AUD', 'Australian Dollar'), ('CAD', 'Canadian Dollar'), ('CHF', 'Swiss Franc')], max_length=3)),
+                ('base', models.CharField(choices=[('INR', 'Indian Rupee'), ('USD', 'US Dollar'), ('EUR', 'Euro'), ('GBP', 'British Pound'), ('JPY', 'Japanese Yen'), ('AED', 'UAE Dirham'), ('SGD', 'Singapore Dollar'), ('THB', 'Thai Baht'), ('AUD', 'Australian Dollar'), ('CAD', 'Canadian Dollar'), ('CHF', 'Swiss Franc')], max_length=3)),
+                ('rate', models.DecimalField(decimal_places=10, max_digits=20)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='dailyrate_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrate',
+            constraint=models.UniqueConstraint(fields=('currency', 'base', 'day'), name='dailyrate_pair_day_uniq'),
+        ),
+        migrations.RunPython(fill_rates_and_totals, migrations.RunPython.noop),
+    ]
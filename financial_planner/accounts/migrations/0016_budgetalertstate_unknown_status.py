@@ -0,0 +1,23 @@
+# Generated by Django 4.2.6 on 2026-10-18 10:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_dailyrate_converted_totals'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='budgetalertstate',
+            name='notified_status',
+            field=models.CharField(blank=True, choices=[('', 'OK'), ('warning', 'Warning'), ('alert', 'Alert'), ('unknown', 'Unknown')], default='', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='budgetalertstate',
+            name='status',
+            field=models.CharField(blank=True, choices=[('', 'OK'), ('warning', 'Warning'), ('alert', 'Alert'), ('unknown', 'Unknown')], default='', max_length=10),
+        ),
+    ]
@@ -1,31 +1,231 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+# Categories every new user starts with
+DEFAULT_CATEGORIES = ['Food', 'Utilities', 'Entertainment', 'Others']
+
+# Currencies expenses can be recorded in, and the base currency totals are
+# shown in unless the user picks another
+DEFAULT_CURRENCY = 'INR'
+CURRENCY_CHOICES = [
+    ('INR', 'Indian Rupee'),
+    ('USD', 'US Dollar'),
+    ('EUR', 'Euro'),
+    ('GBP', 'British Pound'),
+    ('JPY', 'Japanese Yen'),
+    ('AED', 'UAE Dirham'),
+    ('SGD', 'Singapore Dollar'),
+    ('THB', 'Thai Baht'),
+    ('AUD', 'Australian Dollar'),
+    ('CAD', 'Canadian Dollar'),
+    ('CHF', 'Swiss Franc'),
+]
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
-    food_budget = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
-    entertainment_budget = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
-    utilities_budget = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
-    others_budget = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     picture = models.ImageField(upload_to='profile_pictures/', null=True, blank=True)
     additional_info = models.TextField(null=True, blank=True)
+    # Every total and budget is shown in this currency
+    base_currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, default=DEFAULT_CURRENCY)
 
     def __str__(self):
         return self.user.username
 
 class Expense(models.Model):
-    CATEGORY_CHOICES = [
-        ('Food', 'Food'),
-        ('Utilities', 'Utilities'),
-        ('Entertainment', 'Entertainment'),
-        ('Others', 'Others'),
-    ]
-
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="expenses")
     date = models.DateField()
     description = models.TextField()
     amount = models.DecimalField(max_digits=10, decimal_places=2)
-    category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, default='Others')
+    # The currency the amount was paid in
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, default=DEFAULT_CURRENCY)
+    # Name of one of the user's categories
+    category = models.CharField(max_length=20, default='Others')
+    # The schedule this row was materialized from, if any
+    recurring = models.ForeignKey(
+        'RecurringExpense', on_delete=models.SET_NULL, null=True, blank=True, related_name='expenses',
+    )
+
+    class Meta:
+        constraints = [
+            # One row per schedule and date, so materializing can never duplicate
+            models.UniqueConstraint(fields=['recurring', 'date'], name='expense_recurring_date_uniq'),
+        ]
+        indexes = [
+            # Newest-first listings, date-range filters and the distinct-date count
+            models.Index(fields=['user', 'date'], name='expense_user_date_idx'),
+            # Category filters, with or without a date range
+            models.Index(fields=['user', 'category', 'date'], name='expense_user_cat_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.description} - {self.amount} {self.currency}"
+
+# A repeating expense such as rent or a subscription. The
+# materialize_recurring command turns each occurrence that has come due into
+# an Expense row and moves next_due on to the following one.
+class RecurringExpense(models.Model):
+    CADENCE_CHOICES = [
+        ('daily', 'Daily'),
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+        ('yearly', 'Yearly'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="recurring_expenses")
+    description = models.TextField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, default=DEFAULT_CURRENCY)
+    category = models.CharField(max_length=20, default='Others')
+    cadence = models.CharField(max_length=10, choices=CADENCE_CHOICES, default='monthly')
+    start_date = models.DateField()
+    end_date = models.DateField(null=True, blank=True)
+    # First occurrence not materialized yet; null once the schedule has ended
+    next_due = models.DateField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_due'], name='recurring_next_due_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.next_due is None:
+            self.next_due = self.start_date
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.description} - {self.amount} {self.currency} {self.cadence}"
+
+# A user's expense categories. Expenses and the rollup tables refer to them by
+# name, so users can add their own without a schema change.
+class Category(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="categories")
+    name = models.CharField(max_length=20)
+
+    class Meta:
+        unique_together = ('user', 'name')
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.user.username} - {self.name}"
+
+# The budget set for one of a user's categories
+class BudgetLine(models.Model):
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, related_name="budget_line")
+    amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+
+    def __str__(self):
+        # Budgets are set in the user's base currency
+        profile = getattr(self.category.user, 'profile', None)
+        return f"{self.category}: {self.amount} {profile.base_currency if profile else DEFAULT_CURRENCY}"
+
+# Running per-category totals for each user, kept in step with Expense writes
+# so the summary pages never have to aggregate the full ledger. Totals are
+# kept per currency paid in, alongside the same total converted to the user's
+# base currency at each expense's day's rate.
+class CategorySpend(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="category_spend")
+    category = models.CharField(max_length=20)
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, default=DEFAULT_CURRENCY)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    count = models.PositiveIntegerField(default=0)
+    # NULL while some day of the total has no exchange rate to convert it with
+    converted = models.DecimalField(max_digits=14, decimal_places=2, null=True, default=0.00)
+
+    class Meta:
+        unique_together = ('user', 'category', 'currency')
+
+    def __str__(self):
+        return f"{self.user.username} - {self.category}: {self.total} {self.currency}"
+
+# Per-user counter bumped on every Expense or budget change. Cached results
+# are keyed by it, so a bump retires them without touching the cache.
+class DataVersion(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='data_version')
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user.username} - v{self.version}"
+
+# One row per user, day and category. Week and month figures are rolled up
+# from here instead of scanning the raw ledger.
+class DailySpend(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="daily_spend")
+    day = models.DateField()
+    category = models.CharField(max_length=20)
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, default=DEFAULT_CURRENCY)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'day', 'category', 'currency')
+        indexes = [
+            # A category's days in one currency, converted day by day when
+            # the category's converted total is recomputed
+            models.Index(fields=['user', 'category', 'currency'], name='dailyspend_user_cat_cur_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.day} {self.category}: {self.total} {self.currency}"
+
+# Budget status per user and category as of the last nightly sweep, with the
+# status the user was last emailed about so digests only report changes.
+class BudgetAlertState(models.Model):
+    STATUS_CHOICES = [
+        ('', 'OK'),
+        ('warning', 'Warning'),
+        ('alert', 'Alert'),
+        ('unknown', 'Unknown'),  # some spend has no exchange rate to convert it at
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="budget_alert_states")
+    category = models.CharField(max_length=20)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, blank=True, default='')
+    expenses = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    budget = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    notified_status = models.CharField(max_length=10, choices=STATUS_CHOICES, blank=True, default='')
+    evaluated_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'category')
+
+    def __str__(self):
+        return f"{self.user.username} - {self.category}: {self.status or 'ok'}"
+
+# Daily exchange rates as quoted, loaded with the load_fx_rates command: one
+# row per quoted day and ordered currency pair.
+class FxRate(models.Model):
+    day = models.DateField()
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES)
+    base = models.CharField(max_length=3, choices=CURRENCY_CHOICES)
+    # Units of `base` one unit of `currency` bought that day
+    rate = models.DecimalField(max_digits=20, decimal_places=10)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['currency', 'base', 'day'], name='fxrate_pair_day_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} 1 {self.currency} = {self.rate} {self.base}"
+
+# FxRate carried forward to every day from a pair's first quote to the last
+# day quoted for any pair, rebuilt whenever rates are loaded. Converting an
+# amount is then an equality join on (currency, base, day) rather than a
+# search for the latest rate on or before the day.
+class DailyRate(models.Model):
+    day = models.DateField()
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES)
+    base = models.CharField(max_length=3, choices=CURRENCY_CHOICES)
+    rate = models.DecimalField(max_digits=20, decimal_places=10)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['currency', 'base', 'day'], name='dailyrate_pair_day_uniq'),
+        ]
+        indexes = [
+            # The last day loaded, which later days are converted at
+            models.Index(fields=['day'], name='dailyrate_day_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.description} - {self.amount} INR"
+        return f"{self.day} 1 {self.currency} = {self.rate} {self.base}"
@@ -0,0 +1,49 @@
+import base64
+import json
+from datetime import date
+from django.conf import settings
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(row):
+    # The cursor is the (date, id) of the last row on the page
+    raw = json.dumps([row['date'].isoformat(), row['id']]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        last_date, last_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return date.fromisoformat(last_date), int(last_id)
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor.')
+
+
+def get_page_size(value):
+    default_page_size = getattr(settings, 'EXPENSES_PAGE_SIZE', 50)
+    max_page_size = getattr(settings, 'EXPENSES_MAX_PAGE_SIZE', 200)
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        return default_page_size
+    return max(1, min(page_size, max_page_size))
+
+
+def keyset_page(queryset, fields, cursor, page_size):
+    # Newest first on (date, id). Seeking past the cursor instead of using
+    # OFFSET keeps every page an index range scan, however deep it is.
+    if cursor:
+        last_date, last_id = decode_cursor(cursor)
+        queryset = queryset.filter(Q(date__lt=last_date) | Q(date=last_date, id__lt=last_id))
+
+    rows = list(queryset.order_by('-date', '-id').values(*fields)[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1])
+    return rows, next_cursor
@@ -0,0 +1,187 @@
+import cProfile
+import json
+import os
+import pstats
+import random
+import re
+import time
+import uuid
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.utils import timezone
+from django.utils.decorators import sync_and_async_middleware
+from . import timing
+
+# Opt-in cProfile capture of single requests, for staff only. A request is
+# profiled when it carries an X-Profile header or a ?profile query flag, or
+# is picked by REQUEST_PROFILING_SAMPLE_RATE. Each capture is written to
+# REQUEST_PROFILING_DIR as a pstats dump plus a JSON sidecar with the view
+# name, path, duration and query count; only the newest
+# REQUEST_PROFILING_MAX_FILES captures are kept.
+#
+# Only requests served synchronously (WSGI) are profiled. Under ASGI the
+# profiler would run on the event loop thread, which interleaves other
+# requests at every await and would charge their work to the profiled one,
+# while sync views run on a worker thread it cannot see at all. Such requests
+# are served unprofiled, with an X-Profile response header saying why.
+
+DEFAULT_MAX_FILES = 50
+TOP_FUNCTIONS = 40
+PROFILE_ID = re.compile(r'^[0-9]{8}T[0-9]{12}-[0-9a-f]{32}$')
+
+
+def get_directory():
+    return str(getattr(settings, 'REQUEST_PROFILING_DIR', settings.BASE_DIR / 'profiles'))
+
+
+def profile_requested(request):
+    return 'HTTP_X_PROFILE' in request.META or 'profile' in request.GET
+
+
+def wants_profile(request):
+    # Cheap checks first; the user is only looked at if one of them matches
+    sampled = random.random() < getattr(settings, 'REQUEST_PROFILING_SAMPLE_RATE', 0.0)
+    return profile_requested(request) or sampled
+
+
+def is_staff(request):
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_authenticated and user.is_staff)
+
+
+class QueryCounter:
+    # Queries of the profiled request. The timing middleware's collector also
+    # sees the async views' worker threads, so it is used when it is on;
+    # otherwise only this thread's connection is counted.
+    def __init__(self):
+        self.timings = timing.get_current()
+        self.start = self.timings.queries if self.timings else 0
+        self.local = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.local += 1
+        return execute(sql, params, many, context)
+
+    @property
+    def count(self):
+        return self.timings.queries - self.start if self.timings else self.local
+
+
+def save_profile(profiler, request, response, duration, queries):
+    directory = get_directory()
+    os.makedirs(directory, exist_ok=True)
+    profile_id = f"{timezone.now():%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex}"
+    profiler.dump_stats(os.path.join(directory, f'{profile_id}.prof'))
+    match = request.resolver_match
+    with open(os.path.join(directory, f'{profile_id}.json'), 'w') as meta_file:
+        json.dump({
+            'id': profile_id,
+            'view': match.view_name if match else None,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'user_id': request.user.pk,
+            'duration_ms': round(duration * 1000, 1),
+            'queries': queries,
+            'created': timezone.now().isoformat(),
+        }, meta_file)
+    rotate(directory)
+    return profile_id
+
+
+def rotate(directory):
+    # Keep the newest captures; ids sort by time
+    ids = sorted(name[:-5] for name in os.listdir(directory) if name.endswith('.json'))
+    excess = len(ids) - getattr(settings, 'REQUEST_PROFILING_MAX_FILES', DEFAULT_MAX_FILES)
+    for profile_id in ids[:max(excess, 0)]:
+        for suffix in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(directory, profile_id + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles():
+    # Newest first
+    directory = get_directory()
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if name.endswith('.json'):
+            try:
+                with open(os.path.join(directory, name)) as meta_file:
+                    profiles.append(json.load(meta_file))
+            except (OSError, ValueError):
+                # Being written or rotated away, or truncated; leave it out
+                continue
+    return profiles
+
+
+def get_profile(profile_id):
+    # (metadata, top functions by cumulative time), or None for an unknown id
+    if not PROFILE_ID.match(profile_id):
+        return None
+    path = os.path.join(get_directory(), profile_id)
+    try:
+        with open(path + '.json') as meta_file:
+            meta = json.load(meta_file)
+        stats = pstats.Stats(path + '.prof')
+    except (OSError, EOFError, ValueError, TypeError):
+        # Missing, or a truncated or corrupt dump (pstats raises any of these)
+        return None
+
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP_FUNCTIONS]
+    functions = [
+        {
+            'function': pstats.func_std_string(func),
+            'calls': primitive_calls if primitive_calls == calls else f'{calls}/{primitive_calls}',
+            'tottime_ms': round(tottime * 1000, 2),
+            'cumtime_ms': round(cumtime * 1000, 2),
+        }
+        for func, (primitive_calls, calls, tottime, cumtime, _) in rows
+    ]
+    return meta, functions
+
+
+def get_profile_path(profile_id):
+    if not PROFILE_ID.match(profile_id):
+        return None
+    path = os.path.join(get_directory(), f'{profile_id}.prof')
+    return path if os.path.exists(path) else None
+
+
+@sync_and_async_middleware
+def request_profiling_middleware(get_response):
+    # Goes after AuthenticationMiddleware, which provides request.user
+    if not getattr(settings, 'REQUEST_PROFILING_ENABLED', True):
+        raise MiddlewareNotUsed
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            # Never profiled, see above
+            response = await get_response(request)
+            if profile_requested(request):
+                response['X-Profile'] = 'skipped: requests served over ASGI cannot be profiled'
+            return response
+
+        markcoroutinefunction(middleware)
+        return middleware
+
+    def middleware(request):
+        if not wants_profile(request) or not is_staff(request):
+            return get_response(request)
+        profiler, counter = cProfile.Profile(), QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            profiler.enable()
+            try:
+                response = get_response(request)
+            finally:
+                profiler.disable()
+        save_profile(profiler, request, response, time.perf_counter() - started, counter.count)
+        return response
+
+    return middleware
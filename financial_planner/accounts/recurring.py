@@ -0,0 +1,138 @@
+import calendar
+from datetime import date, timedelta
+from django.db import transaction
+from django.utils import timezone
+from .models import DEFAULT_CURRENCY, Category, Expense, Profile, RecurringExpense
+from . import currency, rollups
+
+# Turns due recurring expense schedules into Expense rows.
+#
+# Due schedules are taken SCHEDULE_CHUNK at a time off the next_due index, one
+# transaction per chunk: occurrences that are not in the table yet are
+# inserted with one bulk_create, the rollups are bumped in bulk for exactly
+# those rows, and then next_due is moved past them with one UPDATE per new
+# date. A materialized chunk is no longer due, so a re-run picks up where the
+# last one stopped, and occurrences left behind by an earlier, interrupted
+# run are skipped rather than inserted twice. Where the database supports it
+# the chunk's schedules are locked while written; SQLite serializes the
+# writing transactions instead. A duplicate that still slips in fails the
+# chunk's transaction as a whole, so the rollups never count a row that was
+# not inserted.
+#
+# As in an import, a schedule is only materialized while its category is
+# one of the user's and its amounts can be converted to the user's base
+# currency. A schedule that fails either check is skipped and left due, so
+# it catches up once the category or the exchange rates are back.
+
+SCHEDULE_CHUNK = 1000
+# Per schedule and pass, so a schedule with a long backlog cannot blow up a
+# chunk; the rest is picked up by the following passes
+MAX_OCCURRENCES = 366
+
+
+def add_months(day, months, anchor_day):
+    # `months` after `day`, on `anchor_day` or the month's last day if shorter
+    year, month = divmod(day.year * 12 + day.month - 1 + months, 12)
+    month += 1
+    return date(year, month, min(anchor_day, calendar.monthrange(year, month)[1]))
+
+
+def following(schedule, current):
+    # The occurrence after `current`. Monthly and yearly schedules keep the
+    # start date's day of the month, so Jan 31 is followed by Feb 28, Mar 31.
+    if schedule.cadence == 'daily':
+        return current + timedelta(days=1)
+    if schedule.cadence == 'weekly':
+        return current + timedelta(weeks=1)
+    months = 12 if schedule.cadence == 'yearly' else 1
+    return add_months(current, months, schedule.start_date.day)
+
+
+def due_dates(schedule, as_of):
+    # (occurrences from next_due up to as_of, the next_due after them); the
+    # new next_due is None once the schedule has passed its end date
+    last = min(as_of, schedule.end_date) if schedule.end_date else as_of
+    dates = []
+    current = schedule.next_due
+    while current <= last and len(dates) < MAX_OCCURRENCES:
+        dates.append(current)
+        current = following(schedule, current)
+    if schedule.end_date and current > schedule.end_date:
+        current = None
+    return dates, current
+
+
+def _valid_schedules(schedules, coverages):
+    # The schedules whose category exists and whose currency has rates to
+    # the user's base currency from the first occurrence on. `coverages`
+    # caches a RateCoverage per base currency across chunks.
+    user_ids = {schedule.user_id for schedule in schedules}
+    categories = set(Category.objects.filter(user_id__in=user_ids).values_list('user_id', 'name'))
+    bases = dict(Profile.objects.filter(user_id__in=user_ids).values_list('user_id', 'base_currency'))
+    valid = []
+    for schedule in schedules:
+        base = bases.get(schedule.user_id) or DEFAULT_CURRENCY
+        coverage = coverages.setdefault(base, currency.RateCoverage(base))
+        if (schedule.user_id, schedule.category) in categories and coverage.covers(schedule.currency, schedule.next_due):
+            valid.append(schedule)
+    return valid
+
+
+def materialize(as_of=None, user_ids=None, chunk_size=SCHEDULE_CHUNK):
+    # Creates every occurrence due on or before `as_of` (today by default).
+    # Returns (schedules processed, expenses created, schedules skipped).
+    as_of = as_of or timezone.localdate()
+    due = RecurringExpense.objects.filter(next_due__lte=as_of)
+    if user_ids:
+        due = due.filter(user_id__in=user_ids)
+
+    processed = created = 0
+    skipped = set()
+    coverages = {}
+    while True:
+        ids = list(
+            due.exclude(id__in=skipped).order_by('next_due', 'id').values_list('id', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return processed, created, len(skipped)
+        with transaction.atomic():
+            # Re-read under the lock: a concurrent run may have done some already
+            schedules = list(due.select_for_update().filter(id__in=ids))
+            valid = _valid_schedules(schedules, coverages)
+            skipped.update({schedule.id for schedule in schedules} - {schedule.id for schedule in valid})
+            expenses = []
+            next_dues = {}
+            for schedule in valid:
+                dates, next_due = due_dates(schedule, as_of)
+                next_dues.setdefault(next_due, []).append(schedule.id)
+                expenses += [
+                    Expense(
+                        user_id=schedule.user_id,
+                        date=day,
+                        description=schedule.description,
+                        amount=schedule.amount,
+                        currency=schedule.currency,
+                        category=schedule.category,
+                        recurring_id=schedule.id,
+                    )
+                    for day in dates
+                ]
+            if expenses:
+                # Occurrences an interrupted earlier run already wrote
+                existing = set(
+                    Expense.objects.filter(
+                        recurring_id__in=[schedule.id for schedule in valid],
+                        date__gte=min(expense.date for expense in expenses),
+                        date__lte=max(expense.date for expense in expenses),
+                    ).values_list('recurring_id', 'date')
+                )
+                expenses = [expense for expense in expenses if (expense.recurring_id, expense.date) not in existing]
+            # The lock and the filter above leave no duplicates; should a racing
+            # run still insert one, the IntegrityError rolls the whole chunk back
+            # rather than leave the rollups counting rows that were never written
+            Expense.objects.bulk_create(expenses, batch_size=rollups.BULK_BATCH_SIZE)
+            rollups.expenses_added(expenses)
+            for next_due, schedule_ids in next_dues.items():
+                RecurringExpense.objects.filter(id__in=schedule_ids).update(next_due=next_due)
+        processed += len(valid)
+        created += len(expenses)
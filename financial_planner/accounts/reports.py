@@ -0,0 +1,76 @@
+import io
+from . import caching, ledger
+
+BAR_COLORS = ['#ff6384', '#36a2eb', '#ffce56', '#4bc0c0']
+
+
+def report_data(expenses_by_category, distinct_dates, currency, unconverted=0):
+    # Extract categories and amounts
+    categories = []
+    amounts = []
+
+    for category, total in expenses_by_category:
+        categories.append(category)
+        amounts.append(float(total))  # Convert Decimal to float
+
+    # Calculate totals and averages
+    total_expense = sum(total for _, total in expenses_by_category)
+
+    # Calculate average as sum of amounts / number of unique dates
+    average_daily_expense = total_expense / distinct_dates if distinct_dates > 0 else 0
+
+    return {
+        'categories': categories,
+        'amounts': amounts,
+        'total_expense': total_expense,
+        'average_daily_expense': average_daily_expense,
+        'currency': currency,  # Every amount is in the user's base currency
+        'unconverted': unconverted,  # Expenses left out for want of an exchange rate
+    }
+
+
+def ledger_report_data(user_ledger):
+    # Per-category totals and the count of unique dates, from the compact ledger
+    return report_data(
+        user_ledger.category_breakdown(), user_ledger.active_day_count(), user_ledger.currency,
+        user_ledger.unconverted,
+    )
+
+
+def get_report_data(user):
+    # Shares the cached ledger with the analytics on the same page
+    return ledger_report_data(ledger.get_ledger(user))
+
+
+def render_report_pdf(user, data):
+    # The object-oriented matplotlib API needs no global pyplot state, so it is safe in threaded servers
+    from matplotlib.backends.backend_pdf import FigureCanvasPdf
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(8.27, 11.69))  # A4 portrait
+    figure.text(0.08, 0.94, f"{user.username}'s Financial Report", fontsize=18, weight='bold')
+    # The currency code rather than its symbol, which the PDF's fonts may not have
+    unit = data['currency']
+    figure.text(0.08, 0.90, f"Total Expense: {unit} {data['total_expense']:.2f}", fontsize=12)
+    figure.text(0.08, 0.87, f"Average Daily Expense: {unit} {data['average_daily_expense']:.2f}", fontsize=12)
+    if data['unconverted']:
+        figure.text(
+            0.08, 0.84, f"Leaves out {data['unconverted']} expense(s) with no exchange rate to {unit}.",
+            fontsize=10, color='#b00020',
+        )
+
+    axes = figure.add_axes([0.1, 0.38, 0.8, 0.42])
+    axes.bar(data['categories'], data['amounts'], color=BAR_COLORS[:len(data['categories'])])
+    axes.set_title(f'Expense Amount ({unit})')
+    axes.set_xlabel('Categories')
+    axes.set_ylabel(f'Amount ({unit})')
+    axes.set_ylim(bottom=0)
+
+    buffer = io.BytesIO()
+    FigureCanvasPdf(figure).print_pdf(buffer)
+    return buffer.getvalue()
+
+
+def get_report_pdf(user):
+    # Repeat downloads are served from the cache until an expense or budget change
+    return caching.get_user_data(user, 'report-pdf', lambda: render_report_pdf(user, get_report_data(user)))
@@ -0,0 +1,313 @@
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, TruncMonth, TruncWeek
+from .models import CategorySpend, DailySpend, Expense
+from . import alerting, budgets, currency, metrics, versioning
+
+# Each summary table with the Expense fields it is grouped by (besides user).
+# Totals are kept in the currency paid in. CategorySpend also keeps its total
+# converted to the user's base currency, each amount at its own day's rate,
+# so the budget pages read it as it is; DailySpend rows are converted when
+# they are read, as each has a single day.
+ROLLUP_TABLES = [
+    (CategorySpend, {'category': 'category', 'currency': 'currency'}),
+    (DailySpend, {'day': 'date', 'category': 'category', 'currency': 'currency'}),
+]
+REBUILD_USER_CHUNK = 500
+BULK_BATCH_SIZE = 1000
+# Up to this many summary rows are bumped one statement each, which is never
+# more queries than the bulk path's read and write
+ROW_BY_ROW_MAX = 3
+SPEND_BUCKETS = {'day': None, 'week': TruncWeek, 'month': TruncMonth}
+
+
+def _bump_row(model, amount, count, converted=None, **key):
+    # Bump the running total (and the converted one, given the expression
+    # for the amount to add to it) in place; create the row the first time
+    # the key is used. The savepoint keeps a concurrent create from
+    # poisoning the caller's transaction.
+    changes = {'total': F('total') + amount, 'count': F('count') + count}
+    initial = {'total': amount, 'count': count}
+    if converted is not None:
+        changes['converted'] = F('converted') + converted
+        initial['converted'] = converted
+    updated = model.objects.filter(**key).update(**changes)
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**initial, **key)
+    except IntegrityError:
+        model.objects.filter(**key).update(**changes)
+
+
+def _bump_rows(model, key_fields, deltas):
+    # _bump_row for many keys at once, with deltas {(user_id, *key): (amount,
+    # count)}: one read finds the existing rows, which are incremented in
+    # place by a single executemany (bulk_update's CASE expressions cost far
+    # more to build than the statements take to run), and the new ones are
+    # inserted together.
+    if len(deltas) <= ROW_BY_ROW_MAX:
+        for key, (amount, count) in deltas.items():
+            _bump_row(model, amount, count, user_id=key[0], **dict(zip(key_fields, key[1:])))
+        return
+
+    lookup = {'user_id__in': {key[0] for key in deltas}}
+    for index, field in enumerate(key_fields, 1):
+        lookup[f'{field}__in'] = {key[index] for key in deltas}
+    existing = {
+        tuple(row[1:]): row[0]
+        for row in model.objects.filter(**lookup).values_list('pk', 'user_id', *key_fields)
+    }
+
+    updates = []
+    creates = []
+    for key, (amount, count) in deltas.items():
+        pk = existing.get(key)
+        if pk is None:
+            creates.append(model(user_id=key[0], total=amount, count=count, **dict(zip(key_fields, key[1:]))))
+        else:
+            updates.append((amount, count, pk))
+    if updates:
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"UPDATE {quote(model._meta.db_table)} "
+                f"SET {quote('total')} = {quote('total')} + %s, {quote('count')} = {quote('count')} + %s "
+                f"WHERE {quote('id')} = %s",
+                updates,
+            )
+    try:
+        with transaction.atomic():
+            model.objects.bulk_create(creates, batch_size=BULK_BATCH_SIZE)
+    except IntegrityError:
+        # A concurrent write created some of them first
+        for row in creates:
+            _bump_row(
+                model, row.total, row.count, user_id=row.user_id,
+                **{field: getattr(row, field) for field in key_fields},
+            )
+
+
+def _add_converted(daily_deltas):
+    # Adds each day's amount at that day's rate to the converted CategorySpend
+    # totals, in one executemany. The rows exist, as the totals are bumped first.
+    table = connection.ops.quote_name(CategorySpend._meta.db_table)
+    sql = None
+    params = []
+    for (user_id, day, category, paid_in), (amount, _) in daily_deltas.items():
+        converted = currency.converted_amount(user_id, paid_in, day, amount)
+        sql = converted.sql
+        params.append((*converted.params, user_id, category, paid_in))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {table} SET converted = converted + {sql} "
+            f"WHERE user_id = %s AND category = %s AND currency = %s",
+            params,
+        )
+
+
+def _apply_delta(user_id, category, paid_in, day, amount, count):
+    _bump_row(
+        CategorySpend, amount, count, converted=currency.converted_amount(user_id, paid_in, day, amount),
+        user_id=user_id, category=category, currency=paid_in,
+    )
+    _bump_row(DailySpend, amount, count, user_id=user_id, day=day, category=category, currency=paid_in)
+
+
+# The hooks below run inside the expense write's transaction; each one also
+# bumps the user's data version so cached results keyed on it go stale,
+# reports budget status changes to any live alert listeners and, once the
+# transaction commits, counts the write in the expense_writes_total metric.
+# Listeners are told about status changes, so the converted totals are read
+# before and after the write.
+
+def _count_writes(operation, count=1):
+    # A rolled-back write is never counted
+    transaction.on_commit(lambda: metrics.count_expense_writes(operation, count))
+
+
+def expense_added(expense):
+    before = alerting.spent_before(expense.user_id, [expense.category])
+    _apply_delta(expense.user_id, expense.category, expense.currency, expense.date, expense.amount, 1)
+    versioning.bump(expense.user_id)
+    _count_writes('create')
+    alerting.publish_status_changes(expense.user_id, before)
+
+
+def expenses_added(expenses):
+    # One delta per summary row for a batch of freshly inserted rows, applied
+    # in bulk
+    category_deltas = {}
+    daily_deltas = {}
+    for expense in expenses:
+        for deltas, key in (
+            (category_deltas, (expense.user_id, expense.category, expense.currency)),
+            (daily_deltas, (expense.user_id, expense.date, expense.category, expense.currency)),
+        ):
+            amount, count = deltas.get(key, (0, 0))
+            deltas[key] = (amount + expense.amount, count + 1)
+
+    if not category_deltas:
+        return
+    user_ids = {user_id for user_id, _, _ in category_deltas}
+    before = {
+        user_id: alerting.spent_before(user_id, {
+            category for delta_user_id, category, _ in category_deltas if delta_user_id == user_id
+        })
+        for user_id in user_ids
+    }
+    _bump_rows(CategorySpend, ('category', 'currency'), category_deltas)
+    _add_converted(daily_deltas)
+    _bump_rows(DailySpend, ('day', 'category', 'currency'), daily_deltas)
+    versioning.bump_many(user_ids)
+    _count_writes('create', len(expenses))
+    for user_id in user_ids:
+        alerting.publish_status_changes(user_id, before[user_id])
+
+
+def expense_removed(expense):
+    before = alerting.spent_before(expense.user_id, [expense.category])
+    _apply_delta(expense.user_id, expense.category, expense.currency, expense.date, -expense.amount, -1)
+    versioning.bump(expense.user_id)
+    _count_writes('delete')
+    alerting.publish_status_changes(expense.user_id, before)
+
+
+def expense_changed(expense, old_category, old_amount, old_date, old_currency):
+    before = alerting.spent_before(expense.user_id, {old_category, expense.category})
+    if (expense.category, expense.date, expense.currency) == (old_category, old_date, old_currency):
+        if expense.amount != old_amount:
+            _apply_delta(
+                expense.user_id, expense.category, expense.currency, expense.date, expense.amount - old_amount, 0,
+            )
+    else:
+        _apply_delta(expense.user_id, old_category, old_currency, old_date, -old_amount, -1)
+        _apply_delta(expense.user_id, expense.category, expense.currency, expense.date, expense.amount, 1)
+    versioning.bump(expense.user_id)
+    _count_writes('update')
+    alerting.publish_status_changes(expense.user_id, before)
+
+
+def get_category_totals(user):
+    # Returns {category: total} for every one of the user's categories, zero-filled
+    return {category: spent for category, _, spent in budgets.get_budget_lines(user)}
+
+
+def get_category_breakdown(user):
+    # Categories the user has spent in, with their totals in the user's base
+    # currency, for the charts. Spend without a rate is left out; see
+    # currency.get_unconverted_currencies.
+    return list(
+        CategorySpend.objects.filter(user=user, count__gt=0)
+        .values('category')
+        .annotate(total=Coalesce(Sum('converted'), Value(Decimal('0.00')), output_field=currency.AMOUNT_FIELD))
+        .order_by('category')
+        .values_list('category', 'total')
+    )
+
+
+def get_active_day_count(user):
+    # Number of distinct days with at least one expense
+    return DailySpend.objects.filter(user=user, count__gt=0).values('day').distinct().count()
+
+
+def get_spend_series(user, bucket='day', start_date=None, end_date=None, category=None):
+    # Spend per day, week (starting Monday) or month in the user's base
+    # currency, rolled up from the daily summary rows: a year of weekly
+    # buckets reads at most 365 x 4 rows per currency spent in. The total of
+    # a period with spend that has no rate is None rather than a part sum.
+    rows = DailySpend.objects.filter(user=user, count__gt=0)
+    if category:
+        rows = rows.filter(category=category)
+    if start_date:
+        rows = rows.filter(day__gte=start_date)
+    if end_date:
+        rows = rows.filter(day__lte=end_date)
+
+    trunc = SPEND_BUCKETS[bucket]
+    if trunc is not None:
+        rows = rows.annotate(period=trunc('day'))
+    else:
+        rows = rows.annotate(period=F('day'))
+    # Written as SQL, which the ORM would take longer to build than the
+    # database takes to run
+    table = connection.ops.quote_name(DailySpend._meta.db_table)
+    converted = RawSQL(
+        currency.convert_sql(f'{table}.total', f'{table}.currency', f'{table}.day', currency.base_currency_sql('%s')),
+        (user.pk, user.pk), output_field=currency.AMOUNT_FIELD,
+    )
+    rows = (
+        rows.values('period')
+        .annotate(total=Sum(converted), count=Sum('count'), rows=Count('pk'), converted_rows=Count(converted))
+        .order_by('period')
+        .values_list('period', 'total', 'count', 'rows', 'converted_rows')
+    )
+    return [
+        (period, total if converted_rows == row_count else None, count)
+        for period, total, count, row_count, converted_rows in rows
+    ]
+
+
+def _user_id_chunks(user_ids):
+    if user_ids:
+        yield list(user_ids)
+        return
+    all_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+    for i in range(0, len(all_ids), REBUILD_USER_CHUNK):
+        yield all_ids[i:i + REBUILD_USER_CHUNK]
+
+
+def compute_rollups(model, key_fields, user_ids):
+    # The expected summary rows, straight from the Expense table
+    rows = (
+        Expense.objects.filter(user_id__in=user_ids)
+        .values('user_id', *key_fields.values())
+        .annotate(total=Sum('amount'), count=Count('id'))
+        .order_by()
+    )
+    return {
+        (row['user_id'], *(row[field] for field in key_fields.values())): (row['total'], row['count'])
+        for row in rows
+    }
+
+
+def _stored_rollups(model, key_fields, user_ids):
+    rows = model.objects.filter(user_id__in=user_ids).values_list('user_id', *key_fields, 'total', 'count')
+    return {tuple(row[:-2]): tuple(row[-2:]) for row in rows}
+
+
+def find_mismatches(user_ids=None):
+    mismatches = []
+    for chunk in _user_id_chunks(user_ids):
+        for model, key_fields in ROLLUP_TABLES:
+            expected = compute_rollups(model, key_fields, chunk)
+            stored = _stored_rollups(model, key_fields, chunk)
+            for key in expected.keys() | stored.keys():
+                expected_value = expected.get(key, (Decimal('0.00'), 0))
+                stored_value = stored.get(key, (Decimal('0.00'), 0))
+                if expected_value != stored_value:
+                    mismatches.append((model.__name__, key, expected_value, stored_value))
+    return sorted(mismatches)
+
+
+def rebuild_rollups(user_ids=None):
+    rebuilt = 0
+    for chunk in _user_id_chunks(user_ids):
+        with transaction.atomic():
+            for model, key_fields in ROLLUP_TABLES:
+                expected = compute_rollups(model, key_fields, chunk)
+                model.objects.filter(user_id__in=chunk).delete()
+                model.objects.bulk_create(
+                    [
+                        model(user_id=key[0], total=total, count=count, **dict(zip(key_fields, key[1:])))
+                        for key, (total, count) in expected.items()
+                    ],
+                    batch_size=1000,
+                )
+                rebuilt += len(expected)
+            currency.refresh_converted(chunk)
+    return rebuilt
@@ -0,0 +1,124 @@
+import re
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from .models import Expense
+
+# Full-text search over expense descriptions.
+#
+# MySQL uses a FULLTEXT index on accounts_expense.description. SQLite uses an
+# FTS5 table kept in step with accounts_expense by triggers; it indexes the
+# owner's id as well, so a search only walks the matching user's postings
+# instead of every user's. Other databases fall back to a LIKE scan.
+
+EXPENSE_TABLE = Expense._meta.db_table
+FTS_TABLE = f'{EXPENSE_TABLE}_fts'
+MYSQL_INDEX = 'expense_description_ft'
+# Only the leading words of a query are searched for
+MAX_TERMS = 8
+# Ranked results are paged by offset, so deep pages are cut off
+MAX_OFFSET = 1000
+
+_SQLITE_TRIGGERS = {
+    f'{FTS_TABLE}_ai': f"""
+        AFTER INSERT ON {EXPENSE_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, description, user_id) VALUES (new.id, new.description, new.user_id);
+        END""",
+    f'{FTS_TABLE}_ad': f"""
+        AFTER DELETE ON {EXPENSE_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description, user_id)
+            VALUES ('delete', old.id, old.description, old.user_id);
+        END""",
+    f'{FTS_TABLE}_au': f"""
+        AFTER UPDATE OF description, user_id ON {EXPENSE_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description, user_id)
+            VALUES ('delete', old.id, old.description, old.user_id);
+            INSERT INTO {FTS_TABLE}(rowid, description, user_id) VALUES (new.id, new.description, new.user_id);
+        END""",
+}
+
+
+def install_index(conn=connection):
+    # Idempotent; repairs a missing index outside of migrations. SQLite drops
+    # a table's triggers when a migration rebuilds it, so migrations that
+    # alter Expense must recreate them, with their own copy of the DDL
+    # (see migration 0012) rather than by calling this.
+    with conn.cursor() as cursor:
+        if conn.vendor == 'mysql':
+            cursor.execute(
+                "SELECT COUNT(*) FROM information_schema.statistics "
+                "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+                [EXPENSE_TABLE, MYSQL_INDEX],
+            )
+            if not cursor.fetchone()[0]:
+                cursor.execute(f"CREATE FULLTEXT INDEX {MYSQL_INDEX} ON {EXPENSE_TABLE} (description)")
+        elif conn.vendor == 'sqlite':
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                f"description, user_id, content='{EXPENSE_TABLE}', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+            for name, body in _SQLITE_TRIGGERS.items():
+                cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+            # Re-read the whole content table so rows written without triggers are indexed
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def drop_index(conn=connection):
+    with conn.cursor() as cursor:
+        if conn.vendor == 'mysql':
+            cursor.execute(f"DROP INDEX {MYSQL_INDEX} ON {EXPENSE_TABLE}")
+        elif conn.vendor == 'sqlite':
+            for name in _SQLITE_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def search_terms(query):
+    # Words of the query, lower-cased; punctuation and search operators are dropped
+    return re.findall(r'\w+', (query or '').lower())[:MAX_TERMS]
+
+
+def search(queryset, user, terms, fields, offset, limit):
+    # Rows of an Expense queryset (already filtered to `user`) whose
+    # description contains every term as a word prefix, best match first and
+    # then newest first. Returns `fields` plus a `rank`, higher is better.
+    if connection.vendor == 'sqlite':
+        return _sqlite_search(queryset, user, terms, fields, offset, limit)
+
+    if connection.vendor == 'mysql':
+        against = ' '.join(f'+{term}*' for term in terms)
+        rank = RawSQL(
+            f"MATCH ({EXPENSE_TABLE}.description) AGAINST (%s IN BOOLEAN MODE)",
+            [against],
+            output_field=FloatField(),
+        )
+        queryset = queryset.annotate(rank=rank).filter(rank__gt=0)
+    else:
+        condition = Q()
+        for term in terms:
+            condition &= Q(description__icontains=term)
+        queryset = queryset.filter(condition).annotate(rank=Value(1.0, output_field=FloatField()))
+    queryset = queryset.order_by(F('rank').desc(), '-date', '-id')
+    return list(queryset.values(*fields, 'rank')[offset:offset + limit])
+
+
+def _sqlite_search(queryset, user, terms, fields, offset, limit):
+    # Join the FTS table to the filtered rows so the match, and its bm25
+    # score, is evaluated once for the whole query rather than once per row
+    match = 'description : (' + ' AND '.join(f'"{term}"*' for term in terms) + f') AND user_id : "{user.pk}"'
+    filtered_sql, filtered_params = queryset.order_by().values('id', 'date').query.sql_with_params()
+    sql = (
+        # bm25 scores better matches lower; the user_id column gets no weight
+        f"SELECT e.id, -bm25({FTS_TABLE}, 1.0, 0.0) AS rank "
+        f"FROM {FTS_TABLE} JOIN ({filtered_sql}) e ON e.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH %s "
+        f"ORDER BY rank DESC, e.date DESC, e.id DESC LIMIT %s OFFSET %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*filtered_params, match, limit, offset])
+        ranked = cursor.fetchall()
+
+    # Then the page's rows themselves, by primary key
+    rows = {row['id']: row for row in queryset.filter(id__in=[id for id, _ in ranked]).values('id', *fields)}
+    return [{**rows[id], 'rank': rank} for id, rank in ranked]
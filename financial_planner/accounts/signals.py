@@ -2,12 +2,19 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from .models import Profile
+from .budgets import create_default_categories
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance)
+        create_default_categories(instance)
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
+def save_user_profile(sender, instance, created, update_fields=None, **kwargs):
+    # Only a full save of a user whose profile was loaded through it can carry
+    # profile changes; partial saves such as the last_login update on every
+    # login skip the extra profile read and write
+    if created or update_fields is not None or not User.profile.is_cached(instance):
+        return
     instance.profile.save()
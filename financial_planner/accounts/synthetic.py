@@ -0,0 +1,177 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from .models import DEFAULT_CATEGORIES, DEFAULT_CURRENCY, BudgetLine, Category, Expense, FxRate, Profile, RecurringExpense
+from . import currency, rollups
+
+# Realistic-looking users and expense histories for load testing. Everything
+# is written with bulk inserts, so signals don't run: profiles, categories and
+# rollups are created here instead.
+
+BATCH_SIZE = 5000
+USER_CHUNK = 500
+DEFAULT_DAYS = 365
+DEFAULT_PASSWORD = 'synthetic-pass-123'
+DESCRIPTION_WORDS = {
+    'Food': ['groceries', 'lunch', 'dinner', 'coffee', 'bakery', 'takeaway', 'market', 'snacks'],
+    'Utilities': ['electricity', 'water', 'internet', 'phone', 'gas', 'rent', 'maintenance'],
+    'Entertainment': ['movie', 'concert', 'streaming', 'games', 'books', 'museum', 'match'],
+    'Others': ['taxi', 'uber', 'airport', 'pharmacy', 'gift', 'repairs', 'stationery', 'parking'],
+}
+# Spend per expense in paise, by category
+AMOUNT_RANGES = {
+    'Food': (5000, 150000),
+    'Utilities': (50000, 500000),
+    'Entertainment': (10000, 300000),
+}
+OTHER_AMOUNT_RANGE = (1000, 200000)
+# Travel spend: the currencies paid in and roughly what one unit costs in the
+# base currency; the daily rates wander a few percent around it
+FOREIGN_CURRENCIES = {'USD': Decimal('83.00'), 'EUR': Decimal('90.00'), 'THB': Decimal('2.30')}
+RATE_WANDER = 0.03
+# Recurring schedules: (description, category, cadence)
+RECURRING_KINDS = [
+    ('rent', 'Utilities', 'monthly'),
+    ('internet', 'Utilities', 'monthly'),
+    ('streaming', 'Entertainment', 'monthly'),
+    ('gym', 'Others', 'monthly'),
+    ('groceries delivery', 'Food', 'weekly'),
+    ('insurance', 'Others', 'yearly'),
+]
+
+
+def _description(rng, category):
+    words = DESCRIPTION_WORDS.get(category, DESCRIPTION_WORDS['Others'])
+    return ' '.join(rng.sample(words, 2))
+
+
+def _amount(rng, category):
+    low, high = AMOUNT_RANGES.get(category, OTHER_AMOUNT_RANGE)
+    return Decimal(rng.randrange(low, high)) / 100
+
+
+def _foreign_amount(rng, category, paid_in):
+    # About what the same expense would cost at home, in `paid_in`
+    return (_amount(rng, category) / FOREIGN_CURRENCIES[paid_in]).quantize(Decimal('0.01')) or Decimal('0.01')
+
+
+def _load_rates(rng, start_date, days):
+    # Rates for the days in the range that have none yet, so real rates are never replaced
+    have = set(FxRate.objects.filter(
+        day__gte=start_date, day__lt=start_date + timedelta(days=days), base=DEFAULT_CURRENCY,
+    ).values_list('day', flat=True))
+    currency.load_rates(
+        (day, paid_in, (nominal * Decimal(1 + rng.uniform(-RATE_WANDER, RATE_WANDER))).quantize(Decimal('0.0001')))
+        for day in (start_date + timedelta(days=offset) for offset in range(days)) if day not in have
+        for paid_in, nominal in FOREIGN_CURRENCIES.items()
+    )
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _create_users(rng, usernames, password_hash, category_names, expenses_per_user, recurring_per_user,
+                  foreign_share, start_date, days, batch_size):
+    User.objects.bulk_create([
+        User(username=username, email=f'{username}@example.com', password=password_hash) for username in usernames
+    ])
+    user_ids = list(User.objects.filter(username__in=usernames).order_by('id').values_list('id', flat=True))
+
+    Profile.objects.bulk_create([Profile(user_id=user_id) for user_id in user_ids])
+    Category.objects.bulk_create([Category(user_id=user_id, name=name) for user_id in user_ids for name in category_names])
+    BudgetLine.objects.bulk_create([
+        BudgetLine(category_id=category_id, amount=_amount(rng, name) * rng.randrange(20, 60))
+        for category_id, name in Category.objects.filter(user_id__in=user_ids).values_list('id', 'name')
+    ], batch_size=batch_size)
+
+    expenses = (
+        Expense(
+            user_id=user_id,
+            date=start_date + timedelta(days=rng.randrange(days)),
+            description=_description(rng, category),
+            amount=_amount(rng, category) if paid_in == DEFAULT_CURRENCY else _foreign_amount(rng, category, paid_in),
+            currency=paid_in,
+            category=category,
+        )
+        for user_id in user_ids
+        for category in (rng.choice(category_names) for _ in range(expenses_per_user))
+        for paid_in in [
+            rng.choice(list(FOREIGN_CURRENCIES)) if foreign_share and rng.random() < foreign_share
+            else DEFAULT_CURRENCY
+        ]
+    )
+    for batch in _batches(expenses, batch_size):
+        Expense.objects.bulk_create(batch)
+
+    # Schedules start somewhere in the date range and have nothing materialized yet
+    schedules = (
+        RecurringExpense(
+            user_id=user_id,
+            description=description,
+            amount=_amount(rng, category),
+            category=category,
+            cadence=cadence,
+            start_date=start,
+            next_due=start,
+        )
+        for user_id in user_ids
+        for description, category, cadence in (rng.choice(RECURRING_KINDS) for _ in range(recurring_per_user))
+        for start in [start_date + timedelta(days=rng.randrange(days))]
+    )
+    for batch in _batches(schedules, batch_size):
+        RecurringExpense.objects.bulk_create(batch)
+    return user_ids
+
+
+def _last_number(prefix):
+    usernames = User.objects.filter(username__startswith=f'{prefix}-').values_list('username', flat=True)
+    suffixes = (username[len(prefix) + 1:] for username in usernames)
+    return max((int(suffix) for suffix in suffixes if suffix.isdigit()), default=0)
+
+
+def generate(users, expenses_per_user, start_date=None, end_date=None, extra_categories=0,
+             prefix='synthetic', password=DEFAULT_PASSWORD, seed=None, batch_size=BATCH_SIZE, recurring_per_user=0,
+             foreign_share=0.0):
+    # Creates `users` users, each with the default categories plus
+    # `extra_categories` of their own, a random budget per category,
+    # `expenses_per_user` expenses spread uniformly over the date range and
+    # `recurring_per_user` recurring schedules starting in it. A
+    # `foreign_share` of the expenses is paid in FOREIGN_CURRENCIES, with
+    # daily rates loaded for the range where there are none.
+    # Users are written USER_CHUNK at a time, one transaction each, and
+    # their rollups rebuilt. Returns the new users' ids.
+    rng = random.Random(seed)
+    end_date = end_date or date.today()
+    start_date = start_date or end_date - timedelta(days=DEFAULT_DAYS - 1)
+    days = (end_date - start_date).days + 1
+    category_names = DEFAULT_CATEGORIES + [f'Extra {i + 1}' for i in range(extra_categories)]
+    password_hash = make_password(password)  # hashing is slow, so every user shares one
+
+    if foreign_share:
+        _load_rates(rng, start_date, days)
+
+    # Numbering carries on after the highest number an earlier run with the
+    # same prefix used; counting them would clash once any was deleted
+    first = _last_number(prefix) + 1
+    user_ids = []
+    for chunk_start in range(first, first + users, USER_CHUNK):
+        usernames = [f'{prefix}-{n}' for n in range(chunk_start, min(chunk_start + USER_CHUNK, first + users))]
+        with transaction.atomic():
+            chunk_ids = _create_users(
+                rng, usernames, password_hash, category_names, expenses_per_user, recurring_per_user,
+                foreign_share, start_date, days, batch_size,
+            )
+            rollups.rebuild_rollups(chunk_ids)
+        user_ids += chunk_ids
+    return user_ids
@@ -1,3 +1,1474 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+import asyncio
+import csv
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core import mail
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from .management.commands import benchmark_views
+from .models import (
+    DEFAULT_CATEGORIES, BudgetAlertState, BudgetLine, Category, CategorySpend, DailyRate, Expense, FxRate, Profile,
+    RecurringExpense,
+)
+from . import (
+    alert_sweep, alerting, analytics, async_views, budgets, caching, currency, exporters, forecasting, ledger, metrics,
+    profiling, recurring, reports, rollups, search, synthetic, views,
+)
 
-# Create your tests here.
+
+class CategorySpendRollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ledger.clear_cache()
+        self.user = User.objects.create_user(username='alice', password='secret-pass-123')
+        self.client.force_login(self.user)
+
+    def add_expense(self, amount, category, day=1):
+        return self.client.post(reverse('add_expenses'), {
+            'date': date(2024, 1, day).isoformat(),
+            'description': f'{category} {amount}',
+            'amount': amount,
+            'category': category,
+        })
+
+    def test_add_edit_delete_keep_rollups_in_step(self):
+        self.add_expense('10.00', 'Food')
+        self.add_expense('5.50', 'Food')
+        self.add_expense('20.00', 'Utilities')
+        totals = rollups.get_category_totals(self.user)
+        self.assertEqual(totals['Food'], Decimal('15.50'))
+        self.assertEqual(totals['Utilities'], Decimal('20.00'))
+
+        expense = Expense.objects.get(user=self.user, amount=Decimal('5.50'))
+        self.client.post(reverse('edit_expense', args=[expense.id]), {
+            'date': '2024-01-02',
+            'description': 'moved',
+            'amount': '7.00',
+            'category': 'Entertainment',
+        })
+        totals = rollups.get_category_totals(self.user)
+        self.assertEqual(totals['Food'], Decimal('10.00'))
+        self.assertEqual(totals['Entertainment'], Decimal('7.00'))
+
+        self.client.post(reverse('delete_expense', args=[expense.id]))
+        totals = rollups.get_category_totals(self.user)
+        self.assertEqual(totals['Entertainment'], Decimal('0.00'))
+        self.assertEqual(rollups.find_mismatches(), [])
+
+    def test_summary_views_do_not_aggregate_the_ledger(self):
+        self.add_expense('10.00', 'Food')
+        # session, user, data version, one read of the budgets joined to the
+        # rollups, the base currency and the recent daily rollups for the
+        # forecast, and the currencies without rates
+        with self.assertNumQueries(7):
+            response = self.client.get(reverse('notification'))
+        self.assertEqual(response.context['categories'][0]['expenses'], Decimal('10.00'))
+        self.assertEqual(response.context['total_expenses'], Decimal('10.00'))
+
+    def test_rebuild_command_repairs_drift(self):
+        self.add_expense('10.00', 'Food')
+        CategorySpend.objects.filter(user=self.user).update(total=Decimal('99.00'))
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rollups', '--check', stdout=StringIO())
+        call_command('rebuild_rollups', stdout=StringIO())
+        call_command('rebuild_rollups', '--check', stdout=StringIO())
+        self.assertEqual(rollups.get_category_totals(self.user)['Food'], Decimal('10.00'))
+
+
+class ExpenseQueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(username=f'user{i}') for i in range(20)]
+        categories = DEFAULT_CATEGORIES
+        start = date(2023, 1, 1)
+        Expense.objects.bulk_create(
+            [
+                Expense(
+                    user=user,
+                    date=start + timedelta(days=i % 365),
+                    description=f'expense {i}',
+                    amount=Decimal(i % 500) + Decimal('0.99'),
+                    category=categories[i % len(categories)],
+                )
+                for user in cls.users
+                for i in range(250)
+            ],
+            batch_size=1000,
+        )
+        # Give the planner fresh statistics for the seeded rows
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute(f'ANALYZE TABLE {Expense._meta.db_table}')
+            else:
+                cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset, index):
+        # The plan must read the rows through `index` and return them in
+        # index order; the plain user_id foreign-key index would also avoid
+        # a full scan, but not a sort or a pass over every row of the user
+        if connection.vendor == 'mysql':
+            plan = queryset.explain(format='json')
+            self.assertIn(f'"key": "{index}"', plan, plan)
+            self.assertNotIn('"using_filesort": true', plan, plan)
+        else:
+            plan = queryset.explain()
+            self.assertIn(f'INDEX {index} ', plan, plan)
+            self.assertNotIn(f'SCAN {Expense._meta.db_table}', plan, plan)
+            self.assertNotIn('USE TEMP B-TREE', plan, plan)
+
+    def test_hot_expense_queries_use_an_index(self):
+        user = self.users[3]
+        user_expenses = Expense.objects.filter(user=user)
+        hot_queries = {
+            'dashboard latest 5': (user_expenses.order_by('-date')[:5], 'expense_user_date_idx'),
+            'newest-first page': (user_expenses.order_by('-date', '-id')[:20], 'expense_user_date_idx'),
+            'distinct dates': (user_expenses.values('date').distinct(), 'expense_user_date_idx'),
+            'filter by category': (user_expenses.filter(category='Food'), 'expense_user_cat_date_idx'),
+            'filter by date range': (
+                user_expenses.filter(date__gte=date(2023, 3, 1), date__lte=date(2023, 4, 1)),
+                'expense_user_date_idx',
+            ),
+            'filter by category and date range': (
+                user_expenses.filter(category='Utilities', date__gte=date(2023, 3, 1), date__lte=date(2023, 4, 1)),
+                'expense_user_cat_date_idx',
+            ),
+        }
+        for name, (queryset, index) in hot_queries.items():
+            with self.subTest(name):
+                self.assertUsesIndex(queryset, index)
+
+
+class FilterExpensesPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='bob', password='secret-pass-123')
+        self.client.force_login(self.user)
+        # Several rows share a date so the id tiebreak is exercised
+        Expense.objects.bulk_create([
+            Expense(user=self.user, date=date(2024, 1, 1 + i // 3), description=f'row {i}',
+                    amount=Decimal('1.00'), category='Food' if i % 2 else 'Others')
+            for i in range(25)
+        ])
+
+    def test_pages_walk_the_whole_result_newest_first(self):
+        seen = []
+        params = {'page_size': 10}
+        while True:
+            data = self.client.get(reverse('filter_expenses'), params).json()
+            self.assertLessEqual(len(data['expenses']), 10)
+            seen.extend(row['id'] for row in data['expenses'])
+            if not data['next']:
+                break
+            params['cursor'] = data['next']
+
+        expected = list(Expense.objects.filter(user=self.user).order_by('-date', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_filters_apply_across_pages(self):
+        data = self.client.get(reverse('filter_expenses'), {'category': 'Food', 'page_size': 200}).json()
+        self.assertEqual(len(data['expenses']), 12)
+        self.assertIsNone(data['next'])
+
+    def test_bad_cursor_is_rejected(self):
+        response = self.client.get(reverse('filter_expenses'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ViewExpensesPageTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='carol', password='secret-pass-123')
+        self.client.force_login(self.user)
+        Expense.objects.bulk_create([
+            Expense(user=self.user, date=date(2024, 1, 1) + timedelta(days=i), description=f'row {i}',
+                    amount=Decimal('2.00'), category='Food')
+            for i in range(30)
+        ])
+
+    def test_first_paint_renders_only_the_newest_page(self):
+        response = self.client.get(reverse('view_expenses'), {'page_size': 10})
+        expenses = response.context['expenses']
+        self.assertEqual(len(expenses), 10)
+        self.assertEqual(expenses[0]['description'], 'row 29')
+        self.assertTrue(response.context['next_cursor'])
+
+        data = self.client.get(reverse('filter_expenses'), {
+            'page_size': 10, 'cursor': response.context['next_cursor'],
+        }).json()
+        self.assertEqual(data['expenses'][0]['description'], 'row 19')
+
+
+class ImportExpensesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='dave', password='secret-pass-123')
+        self.client.force_login(self.user)
+
+    def test_upload_imports_valid_rows_and_reports_bad_ones(self):
+        csv_file = SimpleUploadedFile('expenses.csv', (
+            'date,description,amount,category\n'
+            '2024-02-01,Groceries,12.50,Food\n'
+            '2024-02-02,"Power, February",40.00,Utilities\n'
+            'not-a-date,Cinema,9.00,Entertainment\n'
+            '2024-02-04,Mystery,3.00,Travel\n'
+            '2024-02-05,Snacks,2.25,Food\n'
+        ).encode())
+        data = self.client.post(reverse('import_expenses'), {'file': csv_file}).json()
+
+        self.assertTrue(data['success'])
+        self.assertEqual(data['imported'], 3)
+        self.assertEqual(data['failed'], 2)
+        self.assertEqual([error['row'] for error in data['errors']], [4, 5])
+        self.assertIn('date', data['errors'][0]['errors'])
+        self.assertIn('category', data['errors'][1]['errors'])
+        self.assertEqual(rollups.get_category_totals(self.user)['Food'], Decimal('14.75'))
+        self.assertEqual(rollups.find_mismatches(), [])
+
+    def test_upload_without_required_columns_is_rejected(self):
+        csv_file = SimpleUploadedFile('expenses.csv', b'when,what\n2024-02-01,Groceries\n')
+        response = self.client.post(reverse('import_expenses'), {'file': csv_file})
+        self.assertEqual(response.status_code, 400)
+
+    def test_encoding_error_reports_the_rows_already_imported(self):
+        csv_file = SimpleUploadedFile('expenses.csv', (
+            b'date,description,amount,category\n'
+            b'2024-02-01,Groceries,12.50,Food\n'
+            b'2024-02-02,Bread,2.50,Food\n'
+            b'2024-02-03,Caf\xe9,3.00,Food\n'
+            b'2024-02-04,Snacks,2.25,Food\n'
+        ))
+        response = self.client.post(reverse('import_expenses'), {'file': csv_file})
+        self.assertEqual(response.status_code, 400)
+        data = response.json()
+        self.assertFalse(data['success'])
+        self.assertEqual(data['imported'], 2)
+        self.assertIn('UTF-8', data['message'])
+        self.assertEqual(Expense.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(rollups.get_category_totals(self.user)['Food'], Decimal('15.00'))
+
+    def test_command_imports_in_batches(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as csv_file:
+            csv_file.write('date,description,amount,category\n')
+            for i in range(25):
+                csv_file.write(f'2024-03-{i % 28 + 1:02d},Item {i},1.00,Others\n')
+        self.addCleanup(os.remove, csv_file.name)
+
+        call_command('import_expenses', 'dave', csv_file.name, '--batch-size', '10', stdout=StringIO())
+        self.assertEqual(Expense.objects.filter(user=self.user).count(), 25)
+        self.assertEqual(rollups.get_category_totals(self.user)['Others'], Decimal('25.00'))
+
+
+class ExportExpensesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='erin', password='secret-pass-123')
+        self.client.force_login(self.user)
+        Expense.objects.bulk_create([
+            Expense(user=self.user, date=date(2024, 4, 1) + timedelta(days=i % 10), description=f'item, {i}',
+                    amount=Decimal('3.00'), category='Food' if i % 2 else 'Utilities')
+            for i in range(45)
+        ])
+
+    def read_streaming(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_csv_export_streams_every_filtered_row(self):
+        response = self.client.get(reverse('export_expenses'), {'category': 'Food'})
+        body = self.read_streaming(response).decode()
+        rows = list(csv.reader(body.splitlines()))
+        self.assertEqual(rows[0], ['id', 'date', 'description', 'amount', 'category', 'currency'])
+        self.assertEqual(len(rows) - 1, 22)
+        self.assertEqual({row[4] for row in rows[1:]}, {'Food'})
+        self.assertEqual(len({row[0] for row in rows[1:]}), 22)
+
+    def test_rows_are_walked_in_keyset_chunks(self):
+        rows = list(exporters.iter_rows(Expense.objects.filter(user=self.user), chunk_size=7))
+        expected = list(
+            Expense.objects.filter(user=self.user).order_by('-date', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual([row['id'] for row in rows], expected)
+
+    def test_gzipped_jsonl_export(self):
+        response = self.client.get(reverse('export_expenses'), {'format': 'jsonl', 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = gzip.decompress(self.read_streaming(response)).decode().splitlines()
+        self.assertEqual(len(lines), 45)
+        self.assertEqual(json.loads(lines[0])['amount'], '3.00')
+
+    def test_gzip_flag_is_parsed(self):
+        response = self.client.get(reverse('export_expenses'), {'format': 'jsonl', 'gzip': 'false'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(len(self.read_streaming(response).decode().splitlines()), 45)
+        response = self.client.get(reverse('export_expenses'), {'gzip': 'maybe'})
+        self.assertEqual(response.status_code, 400)
+
+
+class FinancialReportPdfTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ledger.clear_cache()
+        self.user = User.objects.create_user(username='frank', password='secret-pass-123')
+        self.client.force_login(self.user)
+        self.client.post(reverse('add_expenses'), {
+            'date': '2024-05-01', 'description': 'Lunch', 'amount': '12.00', 'category': 'Food',
+        })
+
+    def test_pdf_is_cached_until_the_data_version_changes(self):
+        with mock.patch('accounts.reports.render_report_pdf', wraps=reports.render_report_pdf) as render_pdf:
+            first = self.client.get(reverse('financial_report_pdf'))
+            self.assertEqual(first['Content-Type'], 'application/pdf')
+            self.assertTrue(first.content.startswith(b'%PDF'))
+            self.client.get(reverse('financial_report_pdf'))
+            self.assertEqual(render_pdf.call_count, 1)
+
+            self.client.post(reverse('set-budget'), json.dumps({'Food': 100}), content_type='application/json')
+            self.client.get(reverse('financial_report_pdf'))
+            self.assertEqual(render_pdf.call_count, 2)
+
+            self.client.post(reverse('add_expenses'), {
+                'date': '2024-05-02', 'description': 'Dinner', 'amount': '20.00', 'category': 'Food',
+            })
+            self.client.get(reverse('financial_report_pdf'))
+            self.assertEqual(render_pdf.call_count, 3)
+
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ledger.clear_cache()
+        self.user = User.objects.create_user(username='grace', password='secret-pass-123')
+        self.client.force_login(self.user)
+        Expense.objects.bulk_create([
+            Expense(user=self.user, date=date(2024, 1, 10), description='a', amount=Decimal('100.00'), category='Food'),
+            Expense(user=self.user, date=date(2024, 1, 20), description='b', amount=Decimal('50.00'), category='Utilities'),
+            Expense(user=self.user, date=date(2024, 2, 5), description='c', amount=Decimal('150.00'), category='Food'),
+            Expense(user=self.user, date=date(2024, 2, 6), description='d', amount=Decimal('10.00'), category='Others'),
+        ])
+
+    def test_trends_deltas_and_percentiles(self):
+        result = analytics.compute_analytics(self.user)
+        self.assertEqual(result['monthly_trend'], [
+            {'month': '2024-01', 'total': 150.0},
+            {'month': '2024-02', 'total': 160.0},
+        ])
+        self.assertEqual(result['latest_month'], '2024-02')
+        food = next(row for row in result['category_deltas'] if row['category'] == 'Food')
+        self.assertEqual((food['last_month'], food['this_month'], food['delta'], food['delta_pct']),
+                         (100.0, 150.0, 50.0, 50.0))
+        others = next(row for row in result['category_deltas'] if row['category'] == 'Others')
+        self.assertIsNone(others['delta_pct'])
+        # Last day is 2024-02-06: the 7-day window covers Jan 31 - Feb 6
+        self.assertEqual(result['rolling']['avg_7'], round(160 / 7, 2))
+        self.assertEqual(result['expense_percentiles'][0], {'percentile': 50, 'value': 75.0})
+
+    def test_report_page_exposes_analytics(self):
+        response = self.client.get(reverse('financial_reports'))
+        self.assertEqual(len(response.context['analytics']['monthly_trend']), 2)
+
+    def test_empty_ledger(self):
+        other = User.objects.create_user(username='heidi')
+        self.assertEqual(analytics.compute_analytics(other)['monthly_trend'], [])
+
+
+class CompactLedgerTests(TestCase):
+    def setUp(self):
+        ledger.clear_cache()
+        self.user = User.objects.create_user(username='olivia', password='secret-pass-123')
+        self.client.force_login(self.user)
+        for day, amount, category in [
+            ('2024-03-02', '19.99', 'Food'),
+            ('2024-03-01', '0.10', 'Utilities'),
+            ('2024-03-02', '1234.56', 'Food'),
+            ('2024-04-15', '7.35', 'Others'),
+        ]:
+            self.add_expense(day, amount, category)
+
+    def add_expense(self, day, amount, category):
+        self.client.post(reverse('add_expenses'), {
+            'date': day, 'description': 'x', 'amount': amount, 'category': category,
+        })
+
+    def test_matches_the_rollups(self):
+        user_ledger = ledger.load_ledger(self.user)
+        self.assertEqual(len(user_ledger), 4)
+        self.assertEqual(user_ledger.category_breakdown(), rollups.get_category_breakdown(self.user))
+        self.assertEqual(user_ledger.category_breakdown()[0], ('Food', Decimal('1254.55')))
+        self.assertEqual(user_ledger.active_day_count(), rollups.get_active_day_count(self.user))
+
+        frame = user_ledger.to_frame()
+        self.assertEqual(str(frame['date'].iat[0].date()), '2024-03-01')
+        self.assertEqual(list(frame['amount']), [0.10, 19.99, 1234.56, 7.35])
+        self.assertEqual(list(frame['category']), ['Utilities', 'Food', 'Food', 'Others'])
+
+    def test_cached_until_the_data_changes(self):
+        first = ledger.get_ledger(self.user)
+        # Only the data version is read
+        with self.assertNumQueries(1):
+            self.assertIs(ledger.get_ledger(self.user), first)
+
+        self.add_expense('2024-05-01', '3.00', 'Food')
+        self.assertEqual(len(ledger.get_ledger(self.user)), 5)
+        self.assertEqual(ledger.cache_info()['entries'], 1)
+
+    def test_evicts_least_recently_used_by_size(self):
+        other = User.objects.create_user(username='peggy')
+        Expense.objects.create(user=other, date=date(2024, 1, 1), description='x', amount=Decimal('1.00'))
+        limit = ledger.load_ledger(self.user).nbytes + ledger.load_ledger(other).nbytes - 1
+        with self.settings(LEDGER_CACHE_MAX_BYTES=limit):
+            ledger.get_ledger(self.user)
+            ledger.get_ledger(other)
+            info = ledger.cache_info()
+            self.assertEqual(info['entries'], 1)
+            self.assertLessEqual(info['bytes'], limit)
+            # The user's ledger was evicted, so it is read again
+            with self.assertNumQueries(3):
+                ledger.get_ledger(self.user)
+
+
+class DailySpendSummaryTests(TestCase):
+    def setUp(self):
+        ledger.clear_cache()
+        self.user = User.objects.create_user(username='ivan', password='secret-pass-123')
+        self.client.force_login(self.user)
+        for day, amount, category in [
+            ('2024-01-01', '10.00', 'Food'),      # Monday
+            ('2024-01-01', '5.00', 'Utilities'),
+            ('2024-01-03', '7.00', 'Food'),
+            ('2024-01-08', '20.00', 'Food'),      # next week
+            ('2024-02-02', '1.00', 'Others'),
+        ]:
+            self.client.post(reverse('add_expenses'), {
+                'date': day, 'description': 'x', 'amount': amount, 'category': category,
+            })
+
+    def series(self, **params):
+        return self.client.get(reverse('spend_summary'), params).json()['series']
+
+    def test_day_week_and_month_buckets(self):
+        self.assertEqual(self.series(bucket='week', end_date='2024-01-31'), [
+            {'period': '2024-01-01', 'total': '22.00', 'count': 3},
+            {'period': '2024-01-08', 'total': '20.00', 'count': 1},
+        ])
+        self.assertEqual([row['total'] for row in self.series(bucket='month')], ['42.00', '1.00'])
+        self.assertEqual(len(self.series(bucket='day', category='Food')), 3)
+
+    def test_edit_moves_spend_between_days(self):
+        expense = Expense.objects.get(user=self.user, amount=Decimal('20.00'))
+        self.client.post(reverse('edit_expense', args=[expense.id]), {
+            'date': '2024-01-03', 'description': 'x', 'amount': '20.00', 'category': 'Food',
+        })
+        self.assertEqual(self.series(bucket='day', category='Food')[1],
+                         {'period': '2024-01-03', 'total': '27.00', 'count': 2})
+        self.assertEqual(rollups.find_mismatches(), [])
+
+    def test_average_daily_expense_uses_active_days(self):
+        response = self.client.get(reverse('financial_reports'))
+        self.assertEqual(response.context['average_daily_expense'], Decimal('43.00') / 4)
+
+
+class PageContextCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ledger.clear_cache()
+        caching.reset_stats()
+        self.user = User.objects.create_user(username='judy', password='secret-pass-123')
+        self.client.force_login(self.user)
+
+    def test_context_is_served_from_cache_until_data_changes(self):
+        self.client.get(reverse('dashboard'))
+        # session, user and the data version only
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['total_expenses'], 0)
+
+        self.client.post(reverse('add_expenses'), {
+            'date': '2024-06-01', 'description': 'Tea', 'amount': '4.00', 'category': 'Food',
+        })
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['total_expenses'], Decimal('4.00'))
+
+        self.client.get(reverse('notification'))
+        self.client.post(reverse('set-budget'), json.dumps({'Food': 10}), content_type='application/json')
+        response = self.client.get(reverse('notification'))
+        self.assertEqual(response.context['categories'][0]['progress_bar_width'], Decimal('40.00'))
+
+        stats = caching.get_stats()
+        self.assertEqual(stats['dashboard'], {'hits': 1, 'misses': 2, 'hit_ratio': 0.3333})
+        self.assertEqual(stats['notification']['misses'], 2)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ken', password='secret-pass-123')
+        self.client.force_login(self.user)
+        self.client.post(reverse('add_expenses'), {
+            'date': '2024-07-01', 'description': 'Bus', 'amount': '2.00', 'category': 'Others',
+        })
+
+    def test_matching_etag_gets_304_without_querying_expenses(self):
+        for url in (reverse('filter_expenses'), reverse('get_categories'), reverse('set-budget')):
+            with self.subTest(url):
+                first = self.client.get(url)
+                self.assertEqual(first.status_code, 200)
+                # session, user and the data version only
+                with self.assertNumQueries(3):
+                    second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+                self.assertEqual(second.status_code, 304)
+                self.assertEqual(second.content, b'')
+
+    def test_etag_changes_with_data_and_parameters(self):
+        url = reverse('filter_expenses')
+        etag = self.client.get(url)['ETag']
+        self.assertNotEqual(self.client.get(url, {'category': 'Food'})['ETag'], etag)
+
+        self.client.post(reverse('add_expenses'), {
+            'date': '2024-07-02', 'description': 'Taxi', 'amount': '9.00', 'category': 'Others',
+        })
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['expenses']), 2)
+
+
+class AsyncSummaryViewTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        ledger.clear_cache()
+        self.user = User.objects.create_user(username='liam', password='secret-pass-123')
+        budgets.set_budgets(self.user, {'Food': Decimal('50.00')})
+        self.client.force_login(self.user)
+        for amount, category in [('40.00', 'Food'), ('12.00', 'Utilities')]:
+            self.client.post(reverse('add_expenses'), {
+                'date': '2024-08-01', 'description': 'x', 'amount': amount, 'category': category,
+            })
+
+    def assertSameContext(self, sync_name, async_name, keys):
+        sync_response = self.client.get(reverse(sync_name))
+        # Make the async view build its own context rather than reuse the cached one
+        cache.clear()
+        ledger.clear_cache()
+        async_response = self.client.get(reverse(async_name))
+        self.assertEqual(async_response.status_code, 200)
+        for key in keys:
+            self.assertEqual(async_response.context[key], sync_response.context[key], key)
+
+    def test_async_views_match_sync_views(self):
+        for parallel in (True, False):
+            with self.subTest(parallel=parallel), self.settings(ASYNC_VIEWS_PARALLEL_QUERIES=parallel):
+                self.assertSameContext('notification_async', 'notification',
+                                       ['total_expenses', 'total_budget', 'categories', 'overshoots'])
+                self.assertSameContext('alerts_async', 'alerts',
+                                       ['categories', 'warnings', 'alerts', 'forecast_warnings'])
+                self.assertSameContext('dashboard_async', 'dashboard', ['categories', 'amounts', 'total_budget'])
+                self.assertSameContext('financial_reports_async', 'financial_reports',
+                                       ['total_expense', 'average_daily_expense', 'monthly_trend'])
+
+    def test_financial_reports_load_the_ledger_once(self):
+        with mock.patch.object(ledger, 'load_ledger', wraps=ledger.load_ledger) as load:
+            response = self.client.get(reverse('financial_reports_async'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(load.call_count, 1)
+
+        # Also when there is nothing in it
+        self.client.force_login(User.objects.create_user(username='lena', password='secret-pass-123'))
+        with mock.patch.object(ledger, 'get_ledger', wraps=ledger.get_ledger) as get:
+            response = self.client.get(reverse('financial_reports_async'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get.call_count, 1)
+
+    def test_query_threads_keep_their_connections(self):
+        def connection_id():
+            connection.ensure_connection()
+            return id(connection.connection)
+
+        async def gather_twice():
+            first = await async_views.gather_queries(connection_id)
+            return first + await async_views.gather_queries(connection_id)
+
+        with self.settings(ASYNC_VIEWS_QUERY_THREADS=1):
+            async_views._executor = None
+            first, second = asyncio.run(gather_twice())
+            async_views._executor.shutdown()
+            async_views._executor = None
+        self.assertEqual(first, second)
+
+    def test_async_views_require_login(self):
+        self.client.logout()
+        response = self.client.get(reverse('dashboard_async'))
+        self.assertEqual(response.status_code, 302)
+
+
+class BudgetAlertStreamTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='mia', password='secret-pass-123')
+        self.client.force_login(self.user)
+        budgets.set_budgets(self.user, {'Food': Decimal('50.00')})
+        self.events = []
+        alerting.subscribe(self.user.pk, self.events.append)
+        self.addCleanup(alerting.unsubscribe, self.user.pk, self.events.append)
+
+    def add_expense(self, amount, category='Food'):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('add_expenses'), {
+                'date': '2024-09-01', 'description': 'x', 'amount': amount, 'category': category,
+            })
+        return Expense.objects.latest('id')
+
+    def test_events_only_on_threshold_crossings(self):
+        self.add_expense('30.00')  # 60% -> warning
+        self.add_expense('10.00')  # still a warning
+        expense = self.add_expense('15.00')  # 110% -> alert
+        self.assertEqual([(e['category'], e['previous_status'], e['status']) for e in self.events], [
+            ('Food', '', 'warning'),
+            ('Food', 'warning', 'alert'),
+        ])
+        self.assertEqual(self.events[-1]['expenses'], 55.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('delete_expense', args=[expense.id]))
+        self.assertEqual(self.events[-1]['status'], 'warning')
+
+    def test_no_lookups_without_listeners(self):
+        alerting.unsubscribe(self.user.pk, self.events.append)
+        with self.assertNumQueries(0):
+            alerting.publish_status_changes(self.user.pk, {'Food': Decimal('80.00')})
+
+    async def test_stream_delivers_published_events(self):
+        stream = async_views._alert_events(self.user.pk + 1000)
+        self.assertEqual(await stream.__anext__(), 'retry: 5000\n\n')
+        pending = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+        self.assertTrue(alerting.has_subscribers(self.user.pk + 1000))
+
+        alerting.publish(self.user.pk + 1000, {'category': 'Food', 'status': 'alert'})
+        message = await pending
+        self.assertEqual(message, 'event: budget\ndata: {"category": "Food", "status": "alert"}\n\n')
+
+        await stream.aclose()
+        self.assertFalse(alerting.has_subscribers(self.user.pk + 1000))
+
+
+class BudgetAlertSweepTests(TestCase):
+    def setUp(self):
+        self.users = []
+        for name, food_spent in [('noah', '55.00'), ('olga', '35.00'), ('pat', '5.00')]:
+            user = User.objects.create_user(username=name, email=f'{name}@example.com', password='secret-pass-123')
+            budgets.set_budgets(user, {'Food': Decimal('50.00'), 'Others': Decimal('10.00')})
+            expense = Expense.objects.create(user=user, date=date(2024, 10, 1), description='x',
+                                             amount=Decimal(food_spent), category='Food')
+            rollups.expense_added(expense)
+            self.users.append(user)
+
+    def statuses(self):
+        return dict(BudgetAlertState.objects.filter(category='Food').values_list('user__username', 'status'))
+
+    def test_sweep_matches_alerts_page_in_a_fixed_number_of_queries(self):
+        # Bounds, then one statement per chunk of users, whatever the user count
+        with self.assertNumQueries(3):
+            self.assertEqual(alert_sweep.evaluate_all(chunk_size=2), 3)
+        self.assertEqual(self.statuses(), {'noah': 'alert', 'olga': 'warning', 'pat': ''})
+        self.assertEqual(BudgetAlertState.objects.count(), 12)
+
+        for user in self.users:
+            statuses = {category['name']: category['status'] for category in views.build_alerts_context(user)['categories']}
+            for state in BudgetAlertState.objects.filter(user=user):
+                self.assertEqual(state.status, statuses[state.category], state)
+
+        alert_sweep.evaluate_all(from_expenses=True)
+        self.assertEqual(self.statuses(), {'noah': 'alert', 'olga': 'warning', 'pat': ''})
+
+    def test_digests_only_report_changes(self):
+        call_command('sweep_budget_alerts', stdout=StringIO())
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['noah@example.com', 'olga@example.com'])
+        self.assertIn('Food: over budget', mail.outbox[0].body)
+        # Others has a budget but no spending, so it is not reported
+        self.assertNotIn('Others', mail.outbox[0].body)
+
+        mail.outbox = []
+        call_command('sweep_budget_alerts', stdout=StringIO())
+        self.assertEqual(mail.outbox, [])
+
+        expense = Expense.objects.create(user=self.users[1], date=date(2024, 10, 2), description='x',
+                                         amount=Decimal('20.00'), category='Food')
+        rollups.expense_added(expense)
+        call_command('sweep_budget_alerts', stdout=StringIO())
+        self.assertEqual([message.to[0] for message in mail.outbox], ['olga@example.com'])
+
+
+class CustomCategoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ledger.clear_cache()
+        self.user = User.objects.create_user(username='quinn', password='secret-pass-123')
+        self.client.force_login(self.user)
+
+    def post_json(self, name, data):
+        return self.client.post(reverse(name), json.dumps(data), content_type='application/json')
+
+    def test_user_defined_categories_flow_through_the_summary_pages(self):
+        self.assertEqual(self.client.get(reverse('get_categories')).json()['categories'], DEFAULT_CATEGORIES)
+        for i in range(6):
+            response = self.post_json('add_category', {'name': f'Hobby {i}', 'budget': 10})
+            self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.post_json('add_category', {'name': 'Hobby 0'}).status_code, 400)
+
+        self.client.post(reverse('add_expenses'), {
+            'date': '2024-11-01', 'description': 'Paint', 'amount': '12.00', 'category': 'Hobby 3',
+        })
+        self.client.post(reverse('add_expenses'), {
+            'date': '2024-11-01', 'description': 'Nope', 'amount': '1.00', 'category': 'Unknown',
+        })
+        self.assertEqual(list(Expense.objects.values_list('category', flat=True)), ['Hobby 3'])
+
+        # Still one query for the budgets and totals, with ten categories
+        with self.assertNumQueries(7):
+            response = self.client.get(reverse('notification'))
+        self.assertEqual(len(response.context['categories']), 10)
+        self.assertEqual(response.context['total_budget'], Decimal('60.00'))
+        self.assertContains(response, 'Hobby 3 Expenses vs Hobby 3 Budget')
+
+        response = self.client.get(reverse('alerts'))
+        self.assertEqual([category['name'] for category in response.context['alerts']][-1], 'Hobby 3')
+
+    def test_set_budget_validates_categories_and_amounts(self):
+        self.assertEqual(self.post_json('set-budget', {'Food': 25, 'Others': '5.5'}).status_code, 200)
+        self.assertEqual(self.client.get(reverse('set-budget')).json()['data'], {
+            'Food': '25.00', 'Utilities': '0.00', 'Entertainment': '0.00', 'Others': '5.50',
+        })
+        for data in ({'Travel': 10}, {'Food': -1}, {'Food': 'lots'}, {}):
+            with self.subTest(data=data):
+                self.assertEqual(self.post_json('set-budget', data).status_code, 400)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('set-budget')).status_code, 302)
+        self.assertEqual(self.post_json('set-budget', {'Food': 1}).status_code, 302)
+        self.assertEqual(BudgetLine.objects.get(category__user=self.user, category__name='Food').amount, 25)
+
+
+class SearchExpensesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='rosa', password='secret-pass-123')
+        other = User.objects.create_user(username='sam', password='secret-pass-123')
+        self.client.force_login(self.user)
+        for owner, day, description, category in [
+            (self.user, 5, 'Uber ride to the airport', 'Others'),
+            (self.user, 6, 'Uber Eats dinner, then an uber home', 'Food'),
+            (self.user, 7, 'Groceries', 'Food'),
+            (self.user, 20, 'Uber to the office', 'Others'),
+            (other, 6, 'Uber ride', 'Others'),
+        ]:
+            Expense.objects.create(user=owner, date=date(2024, 3, day), description=description,
+                                   amount=Decimal('10.00'), category=category)
+
+    def search(self, **params):
+        return self.client.get(reverse('search_expenses'), params)
+
+    def test_ranked_matches_within_the_usual_filters(self):
+        results = self.search(q='UBER').json()['expenses']
+        # The description mentioning uber twice ranks first; only the user's own rows
+        self.assertEqual([row['description'] for row in results], [
+            'Uber Eats dinner, then an uber home', 'Uber to the office', 'Uber ride to the airport',
+        ])
+
+        results = self.search(q='ub air').json()['expenses']
+        self.assertEqual([row['description'] for row in results], ['Uber ride to the airport'])
+
+        results = self.search(q='uber', category='Others', end_date='2024-03-10').json()['expenses']
+        self.assertEqual([row['description'] for row in results], ['Uber ride to the airport'])
+
+        first = self.search(q='uber', page_size=2).json()
+        self.assertEqual(len(first['expenses']), 2)
+        rest = self.search(q='uber', page_size=2, cursor=first['next']).json()
+        self.assertEqual([row['description'] for row in rest['expenses']], ['Uber ride to the airport'])
+        self.assertIsNone(rest['next'])
+
+        self.assertEqual(self.search(q=' ?! ').status_code, 400)
+        self.assertEqual(self.search(q='uber', cursor='-1').status_code, 400)
+
+    def test_index_follows_edits_and_deletes(self):
+        expense = Expense.objects.get(description='Groceries')
+        expense.description = 'Groceries and an Uber back'
+        expense.save()
+        Expense.objects.filter(description='Uber to the office').delete()
+
+        results = self.search(q='uber').json()['expenses']
+        self.assertEqual(len(results), 3)
+        self.assertIn('Groceries and an Uber back', [row['description'] for row in results])
+        self.assertEqual(self.search(q='office').json()['expenses'], [])
+
+    def test_search_uses_the_full_text_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            search.search(Expense.objects.filter(user=self.user), self.user, ['uber'], ('description',), 0, 10)
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN {'FORMAT=JSON ' if connection.vendor == 'mysql' else 'QUERY PLAN '}"
+                           + queries[0]['sql'])
+            plan = '\n'.join(str(row) for row in cursor.fetchall())
+        if connection.vendor == 'mysql':
+            self.assertIn('fulltext', plan.lower(), plan)
+        elif connection.vendor == 'sqlite':
+            self.assertIn(f'{search.FTS_TABLE} VIRTUAL TABLE', plan)
+            self.assertNotIn(f"'SCAN {Expense._meta.db_table}'", plan)
+
+
+class LoginPathTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='quentin', password='secret-pass-123')
+
+    def login(self, username, password):
+        return self.client.post(reverse('login'), {'username': username, 'password': password}, follow=True)
+
+    def test_login_does_not_touch_the_profile(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('login'), {'username': 'quentin', 'password': 'secret-pass-123'})
+        self.assertRedirects(response, '/profile?first_login=true', fetch_redirect_response=False)
+        sql = [query['sql'] for query in queries]
+        self.assertFalse([statement for statement in sql if 'accounts_profile' in statement], sql)
+        # No separate username lookup before authenticating
+        self.assertEqual(len([statement for statement in sql if 'FROM "auth_user"' in statement]), 1, sql)
+
+    def test_failed_logins_say_which_field_was_wrong(self):
+        self.assertContains(self.login('nobody', 'secret-pass-123'), 'Username is incorrect')
+        self.assertContains(self.login('quentin', 'wrong'), 'Password is incorrect')
+
+    def test_profile_changes_are_still_saved_with_the_user(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.profile.additional_info = 'Saving for a bike'
+        user.save()
+        self.assertEqual(Profile.objects.get(user=user).additional_info, 'Saving for a bike')
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+    def test_sessions_are_read_from_the_cache_with_database_fallback(self):
+        # The test process is the only worker, so its local cache counts as shared
+        self.client.post(reverse('login'), {'username': 'quentin', 'password': 'secret-pass-123'})
+        # Just the user; the session comes from the cache
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(reverse('profile')).status_code, 200)
+
+        cache.clear()
+        self.assertEqual(self.client.get(reverse('profile')).status_code, 200)
+
+
+class SyntheticDataTests(TestCase):
+    def test_generate_data_command(self):
+        call_command('generate_data', '--users', '3', '--expenses', '40', '--extra-categories', '1', '--seed', '7',
+                     '--start-date', '2024-01-01', '--end-date', '2024-03-31', '--batch-size', '25', stdout=StringIO())
+        users = User.objects.filter(username__startswith='synthetic-')
+        self.assertEqual(sorted(users.values_list('username', flat=True)), ['synthetic-1', 'synthetic-2', 'synthetic-3'])
+        self.assertTrue(self.client.login(username='synthetic-2', password='synthetic-pass-123'))
+
+        expenses = Expense.objects.filter(user__in=users)
+        self.assertEqual(expenses.count(), 120)
+        self.assertEqual(set(expenses.values_list('category', flat=True)), {*DEFAULT_CATEGORIES, 'Extra 1'})
+        self.assertFalse(expenses.exclude(date__range=(date(2024, 1, 1), date(2024, 3, 31))).exists())
+        self.assertEqual(Category.objects.filter(user__in=users).count(), 15)
+        self.assertEqual(BudgetLine.objects.filter(category__user__in=users).count(), 15)
+        self.assertEqual(rollups.find_mismatches(list(users.values_list('id', flat=True))), [])
+
+        # A second run carries on the numbering
+        call_command('generate_data', '--users', '1', '--expenses', '0', stdout=StringIO())
+        self.assertTrue(User.objects.filter(username='synthetic-4').exists())
+
+        # ...after the highest number, even once an earlier user is deleted
+        User.objects.filter(username='synthetic-2').delete()
+        call_command('generate_data', '--users', '1', '--expenses', '0', stdout=StringIO())
+        self.assertTrue(User.objects.filter(username='synthetic-5').exists())
+
+
+class ViewBenchmarkTests(TestCase):
+    def test_every_view_has_a_scenario(self):
+        self.assertEqual(benchmark_views.check_coverage(), [])
+
+    def test_regressions_against_the_baseline(self):
+        baseline = {'100': {'dashboard': {'p50_ms': 10.0, 'p95_ms': 12.0, 'p99_ms': 15.0, 'queries': 3}}}
+
+        def result(p50, queries):
+            return {'100': {'dashboard': {'p50_ms': p50, 'p95_ms': 99.0, 'p99_ms': 99.0, 'queries': queries}}}
+
+        # Noise, even in the tail, is not a regression
+        self.assertEqual(benchmark_views.compare(result(12.0, 3), baseline, 0.5, 5.0), [])
+        self.assertEqual(len(benchmark_views.compare(result(20.0, 3), baseline, 0.5, 5.0)), 1)
+        self.assertEqual(benchmark_views.compare(result(10.0, 4), baseline, 0.5, 5.0),
+                         ['dashboard @ 100 rows: 3 -> 4 queries'])
+
+
+def setUpModule():
+    # Every request logs a timing line; the tests that check them capture the
+    # logger with assertLogs, and the rest keep the test output clean
+    timing_logger = logging.getLogger('accounts.timing')
+    setUpModule.level = timing_logger.level
+    timing_logger.setLevel(logging.CRITICAL)
+
+
+def tearDownModule():
+    logging.getLogger('accounts.timing').setLevel(setUpModule.level)
+
+
+class RequestTimingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='rupert', password='secret-pass-123')
+        self.client.force_login(self.user)
+
+    def server_timing(self, response):
+        metrics = {}
+        for metric in response['Server-Timing'].split(', '):
+            name, duration, *desc = metric.split(';')
+            metrics[name] = (float(duration.split('=')[1]), desc)
+        return metrics
+
+    def test_timing_lines_are_logged_by_default(self):
+        self.assertEqual(settings.LOGGING['loggers']['accounts.timing']['level'], 'INFO')
+        self.assertTrue(logging.getLogger('accounts.timing').handlers)
+
+    def test_header_and_log_line(self):
+        with self.assertLogs('accounts.timing', 'INFO') as logs, CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('notification'))
+        metrics = self.server_timing(response)
+        self.assertEqual(set(metrics), {'db', 'tpl', 'view'})
+        self.assertEqual(metrics['db'][1], [f'desc="{len(queries)} queries"'])
+        self.assertGreater(metrics['tpl'][0], 0)
+        self.assertGreaterEqual(metrics['view'][0], metrics['db'][0] + metrics['tpl'][0])
+
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual((line['path'], line['status'], line['user_id'], line['queries']),
+                         ('/notification/', 200, self.user.pk, len(queries)))
+        self.assertNotIn('slowest_queries', line)
+
+    def test_slow_requests_log_their_slowest_statements(self):
+        with self.settings(REQUEST_TIMING_SLOW_MS=0, REQUEST_TIMING_SLOW_QUERY_COUNT=2):
+            with self.assertLogs('accounts.timing', 'WARNING') as logs:
+                self.client.get(reverse('dashboard'))
+        slowest = json.loads(logs.records[-1].getMessage())['slowest_queries']
+        self.assertEqual(len(slowest), 2)
+        self.assertGreaterEqual(slowest[0]['ms'], slowest[1]['ms'])
+        self.assertTrue(slowest[0]['sql'].startswith('SELECT'))
+
+    def test_async_views_are_counted(self):
+        with self.settings(ASYNC_VIEWS_PARALLEL_QUERIES=False), self.assertLogs('accounts.timing', 'INFO') as logs:
+            response = self.client.get(reverse('notification_async'))
+        self.assertEqual(self.server_timing(response)['db'][1], ['desc="7 queries"'])
+        self.assertEqual(json.loads(logs.records[-1].getMessage())['queries'], 7)
+
+
+class RequestProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        settings_override = self.settings(REQUEST_PROFILING_DIR=self.directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(username='sybil', password='secret-pass-123', is_staff=True)
+        self.client.force_login(self.user)
+
+    def test_staff_request_is_captured_with_view_and_query_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('dashboard'), {'profile': 1})
+        captured, = profiling.list_profiles()
+        self.assertEqual((captured['view'], captured['path'], captured['status']), ('dashboard', '/dashboard/', 200))
+        # The session and user lookups for the staff check run before the capture starts
+        self.assertEqual(captured['queries'], len(queries) - 2)
+
+        response = self.client.get(reverse('request_profiles'))
+        self.assertContains(response, reverse('request_profile', args=[captured['id']]))
+        response = self.client.get(reverse('request_profile', args=[captured['id']]))
+        functions = [row['function'] for row in response.context['functions']]
+        self.assertTrue(any('build_dashboard_context' in function for function in functions), functions)
+        response = self.client.get(reverse('request_profile', args=[captured['id']]), {'download': 1})
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="{captured["id"]}.prof"')
+
+    def test_header_sampling_and_rotation(self):
+        with self.settings(REQUEST_PROFILING_MAX_FILES=2):
+            self.client.get(reverse('home'), HTTP_X_PROFILE='1')
+            with self.settings(REQUEST_PROFILING_SAMPLE_RATE=1.0):
+                self.client.get(reverse('notification'))
+                self.client.get(reverse('alerts'))
+        self.assertEqual([item['view'] for item in profiling.list_profiles()], ['alerts', 'notification'])
+        self.assertEqual(len(os.listdir(self.directory.name)), 4)
+
+    def test_only_staff_requests_are_profiled(self):
+        self.user.is_staff = False
+        self.user.save()
+        self.client.get(reverse('dashboard'), {'profile': 1})
+        self.assertEqual(profiling.list_profiles(), [])
+        self.assertEqual(self.client.get(reverse('request_profiles')).status_code, 302)
+
+    def test_unknown_profiles_are_not_found(self):
+        for profile_id in ['20240101T000000000000-' + '0' * 32, '..', 'x' * 10]:
+            self.assertEqual(self.client.get(reverse('request_profile', args=[profile_id])).status_code, 404)
+
+    def test_corrupt_profiles_are_not_found(self):
+        self.client.get(reverse('dashboard'), {'profile': 1})
+        captured, = profiling.list_profiles()
+        with open(os.path.join(self.directory.name, f"{captured['id']}.prof"), 'r+b') as dump:
+            dump.truncate(10)
+        with open(os.path.join(self.directory.name, '20000101T000000000000-' + '0' * 32 + '.json'), 'w') as meta:
+            meta.write('{"id": ')
+        self.assertEqual([item['id'] for item in profiling.list_profiles()], [captured['id']])
+        self.assertEqual(self.client.get(reverse('request_profile', args=[captured['id']])).status_code, 404)
+
+    def test_asgi_requests_are_not_profiled(self):
+        self.async_client.cookies = self.client.cookies
+        # Worker threads would need their own connection, outside the test's transaction
+        with self.settings(ASYNC_VIEWS_PARALLEL_QUERIES=False):
+            response = async_to_sync(self.async_client.get)(reverse('dashboard_async'), {'profile': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['X-Profile'].startswith('skipped'))
+        self.assertEqual(os.listdir(self.directory.name) if os.path.isdir(self.directory.name) else [], [])
+
+
+def record_worker_metrics():
+    # Runs in a forked child, standing in for another WSGI worker
+    metrics.count_expense_writes('create', 5)
+    metrics.flush()
+
+
+class MetricsEndpointTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.user = User.objects.create_user(username='tycho', password='secret-pass-123', is_staff=True)
+        self.client.force_login(self.user)
+
+    def scrape(self, **headers):
+        response = self.client.get(reverse('metrics'), **headers)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        return response.content.decode().splitlines()
+
+    def test_request_cache_and_write_metrics(self):
+        self.client.get(reverse('dashboard'))
+        self.client.get(reverse('dashboard'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('add_expenses'), {
+                'date': '2024-03-01', 'description': 'Lunch', 'amount': '45.00', 'category': 'Food',
+            })
+        self.client.get('/no-such-page/')
+        lines = self.scrape()
+
+        self.assertIn('http_requests_total{view="dashboard",method="GET",status="200"} 2', lines)
+        self.assertIn('http_requests_total{view="unmatched",method="GET",status="404"} 1', lines)
+        self.assertIn('http_request_duration_seconds_count{view="dashboard"} 2', lines)
+        self.assertIn('http_request_db_queries_bucket{view="dashboard",le="+Inf"} 2', lines)
+        self.assertIn('cache_requests_total{cache="dashboard",result="hit"} 1', lines)
+        self.assertIn('cache_hit_ratio{cache="dashboard"} 0.5', lines)
+        self.assertIn('expense_writes_total{operation="create"} 1', lines)
+        # Routes that were never requested are reported with zero counts
+        self.assertIn('http_request_duration_seconds_count{view="spend_summary"} 0', lines)
+
+    def test_rolled_back_writes_are_not_counted(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                expense = Expense.objects.create(user=self.user, date=date(2024, 3, 1), description='x',
+                                                 amount=Decimal('5.00'), category='Food')
+                rollups.expense_added(expense)
+                raise IntegrityError('rolled back')
+        self.assertEqual(callbacks, [])
+        self.assertFalse([line for line in self.scrape() if line.startswith('expense_writes_total{')])
+
+    def test_workers_are_summed_through_the_shared_directory(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            metrics.count_expense_writes('create', 2)
+            for _ in range(2):
+                worker = multiprocessing.get_context('fork').Process(target=record_worker_metrics)
+                worker.start()
+                worker.join()
+            # The scrape flushes the answering process first
+            lines = self.scrape()
+            self.assertEqual(len(os.listdir(directory)), 3)
+        # The forked workers do not report the parent's two writes again
+        self.assertIn('expense_writes_total{operation="create"} 12', lines)
+
+    def test_a_restarted_pid_keeps_the_earlier_totals(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            metrics.count_expense_writes('delete', 3)
+            metrics.flush()
+            metrics.reset()
+            metrics.count_expense_writes('delete')
+            lines = self.scrape()
+        self.assertIn('expense_writes_total{operation="delete"} 4', lines)
+
+    def test_observations_are_flushed_in_the_background(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory,
+                                                                       METRICS_FLUSH_SECONDS=0.01):
+            with mock.patch.object(metrics, 'flush', wraps=metrics.flush) as flush:
+                self.client.get(reverse('dashboard'))
+                # The request itself never writes the file
+                self.assertEqual(flush.call_count, 0)
+                for _ in range(200):
+                    if os.listdir(directory):
+                        break
+                    time.sleep(0.01)
+            self.assertEqual(os.listdir(directory), [f'{os.getpid()}.json'])
+
+    def test_token_or_staff_login_is_required(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        with self.settings(METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+            self.assertTrue(self.scrape(HTTP_AUTHORIZATION='Bearer s3cret'))
+        with self.settings(METRICS_PUBLIC=True):
+            self.assertTrue(self.scrape())
+        self.client.force_login(User.objects.create_user(username='ursula'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+
+class RecurringExpenseTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='ursula', password='secret-pass-123')
+
+    def schedule(self, start_date, cadence='monthly', end_date=None, user=None, amount='1000.00'):
+        return RecurringExpense.objects.create(
+            user=user or self.user, description='Rent', amount=Decimal(amount), category='Utilities',
+            cadence=cadence, start_date=start_date, end_date=end_date,
+        )
+
+    def materialized_dates(self, schedule):
+        return list(schedule.expenses.order_by('date').values_list('date', flat=True))
+
+    def test_monthly_schedule_keeps_its_day_and_a_rerun_adds_nothing(self):
+        rent = self.schedule(date(2024, 1, 31))
+        self.assertEqual(recurring.materialize(date(2024, 4, 30)), (1, 4, 0))
+        self.assertEqual(
+            self.materialized_dates(rent),
+            [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30)],
+        )
+        rent.refresh_from_db()
+        self.assertEqual(rent.next_due, date(2024, 5, 31))
+        self.assertEqual(CategorySpend.objects.get(user=self.user, category='Utilities').total, Decimal('4000.00'))
+        self.assertEqual(rollups.find_mismatches([self.user.id]), [])
+
+        self.assertEqual(recurring.materialize(date(2024, 4, 30)), (0, 0, 0))
+        self.assertEqual(Expense.objects.filter(user=self.user).count(), 4)
+
+    def test_end_dates_and_cadences(self):
+        weekly = self.schedule(date(2024, 1, 1), cadence='weekly', end_date=date(2024, 1, 20))
+        yearly = self.schedule(date(2024, 2, 29), cadence='yearly')
+        daily = self.schedule(date(2025, 2, 27), cadence='daily')
+        recurring.materialize(date(2025, 3, 1))
+
+        self.assertEqual(self.materialized_dates(weekly), [date(2024, 1, 1), date(2024, 1, 8), date(2024, 1, 15)])
+        self.assertEqual(self.materialized_dates(yearly), [date(2024, 2, 29), date(2025, 2, 28)])
+        self.assertEqual(self.materialized_dates(daily), [date(2025, 2, 27), date(2025, 2, 28), date(2025, 3, 1)])
+        weekly.refresh_from_db()
+        self.assertIsNone(weekly.next_due)
+
+    def test_a_schedule_date_is_materialized_once(self):
+        rent = self.schedule(date(2024, 1, 1))
+        Expense.objects.create(user=self.user, date=date(2024, 1, 1), description='Rent', amount=1, recurring=rent)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Expense.objects.create(user=self.user, date=date(2024, 1, 1), description='Rent', amount=1, recurring=rent)
+
+    def test_a_rerun_after_an_interrupted_run_fills_in_the_rest(self):
+        rent = self.schedule(date(2024, 1, 1))
+        # Left behind by a run that wrote its rows but never moved next_due
+        expense = Expense.objects.create(user=self.user, date=date(2024, 2, 1), description='Rent',
+                                         amount=Decimal('1000.00'), category='Utilities', recurring=rent)
+        rollups.expense_added(expense)
+
+        self.assertEqual(recurring.materialize(date(2024, 3, 1)), (1, 2, 0))
+        self.assertEqual(self.materialized_dates(rent), [date(2024, 1, 1), date(2024, 2, 1), date(2024, 3, 1)])
+        self.assertEqual(CategorySpend.objects.get(user=self.user, category='Utilities').total, Decimal('3000.00'))
+        self.assertEqual(rollups.find_mismatches([self.user.id]), [])
+
+    def test_a_racing_duplicate_rolls_the_chunk_back(self):
+        rent = self.schedule(date(2024, 1, 1))
+        bulk_create = Expense.objects.bulk_create
+
+        def race_then_insert(expenses, **kwargs):
+            # Another run writes one of the occurrences after the existing check
+            Expense.objects.create(user=self.user, date=date(2024, 2, 1), description='Rent',
+                                   amount=Decimal('1000.00'), category='Utilities', recurring=rent)
+            return bulk_create(expenses, **kwargs)
+
+        with mock.patch.object(Expense.objects, 'bulk_create', side_effect=race_then_insert):
+            with self.assertRaises(IntegrityError):
+                recurring.materialize(date(2024, 3, 1))
+        self.assertFalse(Expense.objects.exists())
+        self.assertFalse(CategorySpend.objects.filter(user=self.user).exists())
+        rent.refresh_from_db()
+        self.assertEqual(rent.next_due, date(2024, 1, 1))
+
+    def test_schedules_without_a_category_or_rate_are_skipped_and_stay_due(self):
+        rent = self.schedule(date(2024, 1, 1))
+        Category.objects.filter(user=self.user, name='Utilities').delete()
+        abroad = RecurringExpense.objects.create(
+            user=self.user, description='Storage', amount=Decimal('10.00'), category='Others', currency='USD',
+            cadence='monthly', start_date=date(2024, 1, 1),
+        )
+        self.assertEqual(recurring.materialize(date(2024, 2, 1)), (0, 0, 2))
+        self.assertFalse(Expense.objects.exists())
+
+        Category.objects.create(user=self.user, name='Utilities')
+        currency.load_rates([(date(2023, 12, 1), 'USD', Decimal('80'))])
+        self.assertEqual(recurring.materialize(date(2024, 2, 1)), (2, 4, 0))
+        self.assertEqual(self.materialized_dates(abroad), [date(2024, 1, 1), date(2024, 2, 1)])
+        rent.refresh_from_db()
+        self.assertEqual(rent.next_due, date(2024, 3, 1))
+
+    def test_queries_do_not_grow_with_the_number_of_schedules(self):
+        def count_queries(per_user):
+            # Fresh users each time, so both runs start without rollup rows
+            for n in range(3):
+                user = User.objects.create_user(username=f'renter-{per_user}-{n}', password='secret-pass-123')
+                for _ in range(per_user):
+                    self.schedule(date(2024, 1, 1), user=user)
+            with CaptureQueriesContext(connection) as queries:
+                recurring.materialize(date(2024, 3, 1))
+            return len(queries)
+
+        self.assertEqual(count_queries(1), count_queries(10))
+
+    def test_materialize_recurring_command(self):
+        synthetic.generate(2, 0, start_date=date(2024, 1, 1), end_date=date(2024, 1, 31), seed=3, recurring_per_user=3)
+        out = StringIO()
+        call_command('materialize_recurring', '--as-of', '2024-02-29', '--chunk-size', '2', stdout=out)
+        created = Expense.objects.exclude(recurring=None).count()
+        self.assertGreaterEqual(created, 6)
+        self.assertIn(f'Created {created} expense(s) from 6 due schedule(s)', out.getvalue())
+        self.assertFalse(RecurringExpense.objects.filter(next_due__lte=date(2024, 2, 29)).exists())
+
+        # A later run bumps the summary rows the first one created
+        call_command('materialize_recurring', '--as-of', '2024-03-31', stdout=StringIO())
+        self.assertGreater(Expense.objects.exclude(recurring=None).count(), created)
+        self.assertEqual(rollups.find_mismatches(), [])
+
+        with self.assertRaises(CommandError):
+            call_command('materialize_recurring', '--as-of', 'soon', stdout=StringIO())
+
+
+class ForecastTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caching.reset_stats()
+        self.user = User.objects.create_user(username='vera', password='secret-pass-123')
+        self.client.force_login(self.user)
+
+    def test_flat_spend_is_projected_at_the_run_rate(self):
+        rows = [(date(2024, 2, 1) + timedelta(days=n), 'Food', Decimal('10.00')) for n in range(14)]
+        categories, remaining = forecasting.project(rows, date(2024, 2, 14))
+        # Feb 15 to 29
+        self.assertEqual(categories, ['Food'])
+        self.assertAlmostEqual(remaining[0], 150.0)
+
+    def test_weekday_profile(self):
+        # Only Saturdays, Aug 3 to 24; Aug 30 and 31 are a Friday and a Saturday
+        rows = [(date(2024, 8, day), 'Entertainment', Decimal('70.00')) for day in (3, 10, 17, 24)]
+        _, remaining = forecasting.project(rows, date(2024, 8, 29))
+        run_rate = 280 / 27
+        saturday = (280 + forecasting.PROFILE_PRIOR_DAYS * run_rate) / (4 + forecasting.PROFILE_PRIOR_DAYS)
+        friday = forecasting.PROFILE_PRIOR_DAYS * run_rate / (3 + forecasting.PROFILE_PRIOR_DAYS)
+        self.assertAlmostEqual(remaining[0], saturday + friday)
+        self.assertGreater(remaining[0], 2 * run_rate)
+
+    def test_projected_overshoot_is_shown_and_cached_until_expenses_change(self):
+        budgets.set_budgets(self.user, {'Food': Decimal('100.00')})
+        for day in range(1, 11):
+            expense = Expense.objects.create(user=self.user, date=date(2024, 6, day), description='Lunch',
+                                             amount=Decimal('4.00'), category='Food')
+            rollups.expense_added(expense)
+
+        with mock.patch('django.utils.timezone.localdate', return_value=date(2024, 6, 10)):
+            response = self.client.get(reverse('alerts'))
+            self.assertEqual(response.context['warnings'], [])
+            food, = response.context['forecast_warnings']
+            # 40 so far, then 4 a day for the twenty days left
+            self.assertEqual((food['name'], food['projected'], food['projected_overshoot']), ('Food', 120.0, 20.0))
+            self.assertContains(response, 'Forecast: Food On Track to Exceed Budget')
+
+            response = self.client.get(reverse('notification'))
+            self.assertEqual([category['name'] for category in response.context['overshoots']], ['Food'])
+            self.assertEqual(response.context['projected_total'], 120.0)
+            self.assertContains(response, 'Food is on track to exceed its budget by ₹20.0')
+
+            self.client.get(reverse('alerts'))
+            self.assertEqual(caching.get_stats()['forecast'], {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+            self.client.post(reverse('add_expenses'), {
+                'date': '2024-06-10', 'description': 'Dinner', 'amount': '40.00', 'category': 'Food',
+            })
+            response = self.client.get(reverse('alerts'))
+        self.assertEqual(caching.get_stats()['forecast']['misses'], 2)
+        self.assertGreater(response.context['forecast_warnings'][0]['projected'], 160.0)
+
+    def test_projection_starts_from_this_months_spend(self):
+        budgets.set_budgets(self.user, {'Food': Decimal('300.00')})
+        # 400 spent in May, then 2 a day from June 1 to 10
+        for day, amount in [(date(2024, 5, 1), '400.00')] + [(date(2024, 6, day), '2.00') for day in range(1, 11)]:
+            expense = Expense.objects.create(user=self.user, date=day, description='Lunch',
+                                             amount=Decimal(amount), category='Food')
+            rollups.expense_added(expense)
+
+        with mock.patch('django.utils.timezone.localdate', return_value=date(2024, 6, 10)):
+            forecast = forecasting.compute_forecast(self.user)
+            self.assertEqual(forecast['month_to_date'], {'Food': 20.0})
+            response = self.client.get(reverse('alerts'))
+        food, = [category for category in response.context['categories'] if category['name'] == 'Food']
+        # 20 this month plus the rest of June at the run rate, which the May
+        # spend raises; the all-time 420 plus that would overshoot the budget
+        self.assertEqual(food['projected'], round(20.0 + forecast['remaining']['Food'], 2))
+        self.assertGreater(float(food['expenses']) + forecast['remaining']['Food'], 300.0)
+        self.assertEqual(food['projected_overshoot'], 0.0)
+        self.assertEqual(response.context['forecast_warnings'], [])
+
+
+class CurrencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='wanda', email='wanda@example.com', password='secret-pass-123')
+        self.client.force_login(self.user)
+        budgets.set_budgets(self.user, {'Food': Decimal('1000.00')})
+        currency.load_rates([
+            (date(2024, 5, 1), 'USD', Decimal('80')),
+            (date(2024, 5, 1), 'EUR', Decimal('90')),
+            (date(2024, 5, 3), 'USD', Decimal('82')),
+        ])
+
+    def add_expense(self, day, amount, code, category='Food'):
+        expense = Expense.objects.create(user=self.user, date=day, description='x', amount=Decimal(amount),
+                                         category=category, currency=code)
+        rollups.expense_added(expense)
+        return expense
+
+    def test_every_pair_of_quoted_currencies_is_stored(self):
+        rate = FxRate.objects.get(day=date(2024, 5, 1), currency='EUR', base='USD').rate
+        self.assertEqual(rate, Decimal('1.125'))
+        self.assertEqual(FxRate.objects.get(day=date(2024, 5, 1), currency='INR', base='USD').rate, Decimal('0.0125'))
+        # Reloading a day replaces its rates
+        currency.load_rates([(date(2024, 5, 1), 'USD', Decimal('81'))])
+        self.assertEqual(FxRate.objects.filter(day=date(2024, 5, 1)).count(), 2)
+
+    def test_totals_are_converted_at_each_days_rate(self):
+        self.add_expense(date(2024, 5, 1), '500.00', 'INR')
+        self.add_expense(date(2024, 5, 2), '5.00', 'USD')  # No rate that day, so May 1's 80
+        self.add_expense(date(2024, 5, 4), '5.00', 'USD')  # May 3's 82
+        self.assertEqual(rollups.get_category_totals(self.user)['Food'], Decimal('1310.00'))
+
+        response = self.client.get(reverse('alerts'))
+        food = next(category for category in response.context['categories'] if category['name'] == 'Food')
+        self.assertEqual(food['expenses'], Decimal('1310.00'))
+        self.assertEqual(food['status'], 'alert')
+        self.assertEqual(ledger.load_ledger(self.user).category_totals(), {'Food': Decimal('1310.00')})
+        alert_sweep.evaluate_all()
+        self.assertEqual(BudgetAlertState.objects.get(user=self.user, category='Food').status, 'alert')
+
+    def test_base_currency_change_converts_and_needs_rates(self):
+        self.add_expense(date(2024, 5, 1), '160.00', 'INR')
+        response = self.client.post(reverse('edit_profile'), {'base_currency': 'USD'})
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(rollups.get_category_totals(self.user)['Food'], Decimal('2.00'))
+        self.assertContains(self.client.get(reverse('notification')), '$')
+
+        # No GBP rates were loaded
+        self.add_expense(date(2024, 5, 1), '1.00', 'EUR')
+        response = self.client.post(reverse('edit_profile'), {'base_currency': 'GBP'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Profile.objects.get(user=self.user).base_currency, 'USD')
+
+    def test_expenses_without_a_rate_are_rejected(self):
+        response = self.client.post(reverse('add_expenses'), {
+            'date': '2024-04-30', 'description': 'Too early', 'amount': '1.00', 'category': 'Food', 'currency': 'USD',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Expense.objects.exists())
+
+        csv_file = SimpleUploadedFile('expenses.csv', (
+            'date,description,amount,category,currency\n'
+            '2024-05-02,Coffee,3.00,Food,EUR\n'
+            '2024-05-02,Tea,2.00,Food,GBP\n'
+            '2024-05-02,Snacks,40.00,Food,\n'
+        ).encode())
+        data = self.client.post(reverse('import_expenses'), {'file': csv_file}).json()
+        self.assertEqual((data['imported'], data['failed']), (2, 1))
+        self.assertEqual(
+            sorted(Expense.objects.values_list('currency', flat=True)), ['EUR', 'INR'],
+        )
+        self.assertEqual(rollups.get_category_totals(self.user)['Food'], Decimal('310.00'))
+        self.assertEqual(rollups.find_mismatches(), [])
+
+    def test_rates_are_carried_forward_to_every_day(self):
+        usd = DailyRate.objects.filter(currency='USD', base='INR').order_by('day').values_list('day', 'rate')
+        self.assertEqual(list(usd), [
+            (date(2024, 5, 1), Decimal('80')), (date(2024, 5, 2), Decimal('80')), (date(2024, 5, 3), Decimal('82')),
+        ])
+        self.assertEqual(DailyRate.objects.filter(day=date(2024, 5, 3), currency='EUR', base='INR').get().rate, 90)
+
+        self.add_expense(date(2024, 5, 2), '5.00', 'USD')
+        self.add_expense(date(2024, 5, 10), '1.00', 'USD')  # After the last day loaded, so May 3's 82
+        spend = CategorySpend.objects.get(user=self.user, category='Food', currency='USD')
+        self.assertEqual(spend.converted, Decimal('482.00'))
+
+        # A new rate for May 2 is carried into the kept totals
+        currency.load_rates([(date(2024, 5, 2), 'USD', Decimal('81'))])
+        spend.refresh_from_db()
+        self.assertEqual(spend.converted, Decimal('487.00'))
+        self.assertEqual(rollups.get_category_totals(self.user)['Food'], Decimal('487.00'))
+        self.assertEqual(DailyRate.objects.get(day=date(2024, 5, 3), currency='USD', base='INR').rate, 82)
+
+    def test_spend_without_a_rate_is_reported_rather_than_dropped(self):
+        # Rates start on May 1; an expense from before is only possible if
+        # its rates were reloaded away, so it is written directly
+        self.add_expense(date(2024, 4, 30), '1.00', 'USD')
+        self.add_expense(date(2024, 5, 2), '5.00', 'USD')
+        self.assertIsNone(CategorySpend.objects.get(user=self.user, currency='USD').converted)
+        self.assertEqual(currency.get_unconverted_currencies(self.user), ['USD'])
+
+        warning = 'Spend in USD on days without an exchange rate to INR is left out of these totals.'
+        self.assertContains(self.client.get(reverse('alerts')), warning)
+        self.assertContains(self.client.get(reverse('notification')), warning)
+        self.assertContains(self.client.get(reverse('dashboard')), warning)
+        self.assertEqual(ledger.load_ledger(self.user).unconverted, 1)
+        self.assertContains(
+            self.client.get(reverse('financial_reports')),
+            '1 expense with no exchange rate to INR is left out of these figures.',
+        )
+        series = self.client.get(reverse('spend_summary')).json()['series']
+        self.assertEqual(
+            [(row['period'], row['total']) for row in series], [('2024-04-30', None), ('2024-05-02', '400.00')],
+        )
+
+        currency.load_rates([(date(2024, 4, 30), 'USD', Decimal('79'))])
+        self.assertEqual(currency.get_unconverted_currencies(self.user), [])
+        self.assertEqual(rollups.get_category_totals(self.user)['Food'], Decimal('479.00'))
+        self.assertNotContains(self.client.get(reverse('alerts')), warning)
+
+    def test_sweep_does_not_judge_a_partly_converted_total(self):
+        self.add_expense(date(2024, 4, 30), '1.00', 'USD')  # No rate yet
+        self.add_expense(date(2024, 5, 1), '1500.00', 'INR')
+        for from_expenses in (False, True):
+            with self.subTest(from_expenses=from_expenses):
+                alert_sweep.evaluate_all(from_expenses=from_expenses)
+                state = BudgetAlertState.objects.get(user=self.user, category='Food')
+                self.assertEqual((state.status, state.expenses), ('unknown', Decimal('1500.00')))
+        self.assertEqual(alert_sweep.send_digests(), 0)
+        self.assertEqual(BudgetAlertState.objects.get(user=self.user, category='Food').notified_status, '')
+
+        currency.load_rates([(date(2024, 4, 30), 'USD', Decimal('79'))])
+        for from_expenses in (False, True):
+            with self.subTest(from_expenses=from_expenses):
+                alert_sweep.evaluate_all(from_expenses=from_expenses)
+                state = BudgetAlertState.objects.get(user=self.user, category='Food')
+                self.assertEqual((state.status, state.expenses), ('alert', Decimal('1579.00')))
+        self.assertEqual(alert_sweep.send_digests(), 1)
+
+    def test_budget_lines_are_shown_in_the_base_currency(self):
+        line = BudgetLine.objects.get(category__user=self.user, category__name='Food')
+        self.assertEqual(str(line), 'wanda - Food: 1000.00 INR')
+        currency.set_base_currency(self.user, 'USD')
+        line = BudgetLine.objects.get(pk=line.pk)
+        self.assertEqual(str(line), 'wanda - Food: 1000.00 USD')
@@ -0,0 +1,181 @@
+import heapq
+import json
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.template.backends.django import DjangoTemplates
+from django.utils.decorators import sync_and_async_middleware
+
+# Per-request instrumentation: query count, database time, template render
+# time and view time, sent back as a Server-Timing header and logged as one
+# JSON line. Slow requests also log their slowest SQL statements.
+#
+# The running request's RequestTimings lives in a context variable, which
+# asgiref copies into the worker threads of the async views, so their
+# queries are counted too. Outside a request the hooks cost one lookup.
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLOW_REQUEST_MS = 500
+DEFAULT_SLOW_QUERY_COUNT = 5
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    def __init__(self, slow_query_count):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self._slowest = []  # min-heap of (seconds, n, sql), at most slow_query_count long
+        self._slow_query_count = slow_query_count
+        self._lock = threading.Lock()
+
+    def add_query(self, sql, seconds):
+        with self._lock:
+            self.queries += 1
+            self.db_seconds += seconds
+            entry = (seconds, self.queries, sql)
+            if len(self._slowest) < self._slow_query_count:
+                heapq.heappush(self._slowest, entry)
+            elif seconds > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def add_template(self, seconds):
+        with self._lock:
+            self.template_seconds += seconds
+
+    def slowest_queries(self):
+        # Statements only, without their parameters, slowest first
+        with self._lock:
+            return [
+                {'ms': round(seconds * 1000, 2), 'sql': sql}
+                for seconds, _, sql in sorted(self._slowest, reverse=True)
+            ]
+
+
+def get_current():
+    # The running request's RequestTimings, if the middleware is on
+    return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+    # Installed on every database connection (see AccountsConfig.ready)
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add_query(sql, time.perf_counter() - started)
+
+
+def install_query_hook(sender, connection, **kwargs):
+    # connection_created fires again on every reconnect of the same wrapper
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class TimedTemplate:
+    # Times the top-level render; included templates are part of it
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        timings = _current.get()
+        if timings is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            timings.add_template(time.perf_counter() - started)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    # The Django template backend, with render time recorded per request
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+def _user_id(request):
+    # Only if something already loaded the user; never costs a query
+    user = getattr(getattr(request, 'user', None), '_wrapped', None)
+    return getattr(user, 'pk', None)
+
+
+def _finish(request, response, timings, started):
+    view_ms = (time.perf_counter() - started) * 1000
+    db_ms = timings.db_seconds * 1000
+    template_ms = timings.template_seconds * 1000
+    response['Server-Timing'] = ', '.join([
+        f'db;dur={db_ms:.1f};desc="{timings.queries} queries"',
+        f'tpl;dur={template_ms:.1f}',
+        f'view;dur={view_ms:.1f}',
+    ])
+
+    slow = view_ms >= getattr(settings, 'REQUEST_TIMING_SLOW_MS', DEFAULT_SLOW_REQUEST_MS)
+    if not logger.isEnabledFor(logging.WARNING if slow else logging.INFO):
+        return
+    line = {
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'user_id': _user_id(request),
+        'view_ms': round(view_ms, 1),
+        'db_ms': round(db_ms, 1),
+        'queries': timings.queries,
+        'template_ms': round(template_ms, 1),
+    }
+    if slow:
+        line['slowest_queries'] = timings.slowest_queries()
+        logger.warning(json.dumps(line))
+    else:
+        logger.info(json.dumps(line))
+
+
+@sync_and_async_middleware
+def request_timing_middleware(get_response):
+    if not getattr(settings, 'REQUEST_TIMING_ENABLED', True):
+        raise MiddlewareNotUsed
+    slow_query_count = getattr(settings, 'REQUEST_TIMING_SLOW_QUERY_COUNT', DEFAULT_SLOW_QUERY_COUNT)
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            timings = RequestTimings(slow_query_count)
+            token = _current.set(timings)
+            started = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                _current.reset(token)
+            _finish(request, response, timings, started)
+            return response
+
+        markcoroutinefunction(middleware)
+        return middleware
+
+    def middleware(request):
+        timings = RequestTimings(slow_query_count)
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            response = get_response(request)
+        finally:
+            _current.reset(token)
+        _finish(request, response, timings, started)
+        return response
+
+    return middleware
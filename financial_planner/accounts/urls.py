@@ -1,6 +1,6 @@
 from django.urls import path
 from django.contrib.auth.views import LogoutView
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path('register/', views.register, name='register'),
@@ -14,13 +14,30 @@ urlpatterns = [
     path('profile/edit/', views.edit_profile, name='edit_profile'),
     path('change-password/', views.change_password, name='change_password'), 
     path('set-budget/', views.set_budget, name='set-budget'), 
+    path('add-category/', views.add_category, name='add_category'),
     path('alerts/', views.alerts, name='alerts'),
     path('add_expenses/', views.add_expenses, name='add_expenses'),
+    path('import_expenses/', views.import_expenses, name='import_expenses'),
     path('view_expenses/', views.view_expenses, name='view_expenses'),
     path('get_categories/', views.get_categories, name='get_categories'),
     path('filter_expenses/', views.filter_expenses, name='filter_expenses'),  # Add this line
+    path('search_expenses/', views.search_expenses, name='search_expenses'),
+    path('export_expenses/', views.export_expenses, name='export_expenses'),
+    path('spend_summary/', views.spend_summary, name='spend_summary'),
+    path('cache-stats/', views.cache_stats, name='cache_stats'),
+    path('metrics', views.metrics_view, name='metrics'),  # No trailing slash, Prometheus' default path
+    path('profiles/', views.request_profiles, name='request_profiles'),
+    path('profiles/<str:profile_id>/', views.request_profile, name='request_profile'),
 
     path('edit_expense/<int:expense_id>/', views.edit_expense, name='edit_expense'),  # New URL for editing an expense
     path('delete_expense/<int:expense_id>/', views.delete_expense, name='delete_expense'),
     path('financial_reports/', views.financial_reports, name='financial_reports'),
+    path('financial_reports/pdf/', views.financial_report_pdf, name='financial_report_pdf'),
+
+    # Async versions of the summary pages, for deployments behind an ASGI server
+    path('async/notification/', async_views.notification, name='notification_async'),
+    path('async/alerts/', async_views.alerts, name='alerts_async'),
+    path('async/dashboard/', async_views.dashboard, name='dashboard_async'),
+    path('async/financial_reports/', async_views.financial_reports, name='financial_reports_async'),
+    path('async/alerts/stream/', async_views.alert_stream, name='alert_stream'),
 ]
@@ -0,0 +1,54 @@
+import hashlib
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from .models import DataVersion
+
+
+def bump(user_id):
+    updated = DataVersion.objects.filter(user_id=user_id).update(version=F('version') + 1)
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            DataVersion.objects.create(user_id=user_id, version=1)
+    except IntegrityError:
+        DataVersion.objects.filter(user_id=user_id).update(version=F('version') + 1)
+
+
+def bump_many(user_ids):
+    # bump() for a batch of users: one read and one UPDATE, plus one INSERT
+    # for users that have no version row yet
+    user_ids = set(user_ids)
+    if len(user_ids) == 1:
+        bump(*user_ids)
+        return
+    existing = set(DataVersion.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True))
+    DataVersion.objects.filter(user_id__in=existing).update(version=F('version') + 1)
+    missing = user_ids - existing
+    if not missing:
+        return
+    try:
+        with transaction.atomic():
+            DataVersion.objects.bulk_create([DataVersion(user_id=user_id, version=1) for user_id in missing])
+    except IntegrityError:
+        for user_id in missing:
+            bump(user_id)
+
+
+def get_version(user):
+    return DataVersion.objects.filter(user=user).values_list('version', flat=True).first() or 0
+
+
+async def aget_version(user):
+    return await DataVersion.objects.filter(user=user).values_list('version', flat=True).afirst() or 0
+
+
+def request_etag(request, *args, **kwargs):
+    # Strong ETag for a user's JSON GET endpoints: the data version plus the
+    # URL and its parameters. Computing it is one indexed single-row lookup,
+    # so a matching If-None-Match is answered before any expense query runs.
+    if request.method not in ('GET', 'HEAD') or not request.user.is_authenticated:
+        return None
+    params = '&'.join(f'{key}={value}' for key, values in sorted(request.GET.lists()) for value in values)
+    raw = f'{request.user.pk}:{get_version(request.user)}:{request.path}?{params}'
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
@@ -2,18 +2,27 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.contrib.auth import update_session_auth_hash
 from django.contrib import messages
 from .forms import UserRegistrationForm, ExpenseForm, ProfileForm
-from .models import Expense, Profile
+from .models import CURRENCY_CHOICES, Expense, Profile
 from .models import Profile
+from . import (
+    alerting, analytics, budgets, caching, currency, exporters, forecasting, ledger, metrics, profiling, reports,
+    rollups, search, versioning,
+)
+from .pagination import InvalidCursor, get_page_size, keyset_page
+from .importers import ImportFormatError, import_expenses_csv
 import logging
 from django.contrib.auth.hashers import check_password
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import etag
 from django.utils.dateparse import parse_date  # Ensure this is imported
 from django.contrib.messages import get_messages
-from django.db.models import Sum
+from django.db import transaction
+import codecs
 import json
 
 # Helper function to clear stale messages
@@ -31,48 +40,15 @@ def profile(request):
         messages.success(request, f"Welcome back, {request.user.username}!")
     return render(request, 'accounts/profile.html')
 
-@login_required
-def notification(request):
-    # Fetch all expenses for the logged-in user
-    user_expenses = Expense.objects.filter(user=request.user)
-
-    # Calculate total expenses
-    total_expenses = user_expenses.aggregate(Sum('amount'))['amount__sum'] or 0
-
-    # Get the user's profile and calculate total budget
-    profile = getattr(request.user, 'profile', None)
-    total_budget = 0
-    total_food_budget = profile.food_budget or 0
-    total_utilities_budget = profile.utilities_budget or 0
-    total_entertainment_budget = profile.entertainment_budget or 0
-    total_others_budget = profile.others_budget or 0
-    
-    if profile:
-        total_budget = (
-            total_food_budget +
-            total_utilities_budget +
-            total_entertainment_budget +
-            total_others_budget
-        )
-
-    # Calculate total expenses for each category
-    total_food_expenses = user_expenses.filter(category='Food').aggregate(Sum('amount'))['amount__sum'] or 0
-    total_utilities_expenses = user_expenses.filter(category='Utilities').aggregate(Sum('amount'))['amount__sum'] or 0
-    total_entertainment_expenses = user_expenses.filter(category='Entertainment').aggregate(Sum('amount'))['amount__sum'] or 0
-    total_others_expenses = user_expenses.filter(category='Others').aggregate(Sum('amount'))['amount__sum'] or 0
+def notification_context(budget_lines, forecast, unconverted):
+    # budget_lines: [(category, budget, spent)] for each of the user's categories;
+    # forecast: the user's month-end projection from forecasting.get_forecast;
+    # unconverted: currencies whose spend the totals leave out for want of a rate
 
     # Calculate progress bar widths for each category
     def calculate_progress_bar_width(expenses, budget):
         return round((expenses / budget) * 100, 2) if budget > 0 else 0
 
-    progress_bar_width_food = calculate_progress_bar_width(total_food_expenses, total_food_budget)
-    progress_bar_width_utilities = calculate_progress_bar_width(total_utilities_expenses, total_utilities_budget)
-    progress_bar_width_entertainment = calculate_progress_bar_width(total_entertainment_expenses, total_entertainment_budget)
-    progress_bar_width_others = calculate_progress_bar_width(total_others_expenses, total_others_budget)
-
-    # Calculate overall progress for Expense vs Budget
-    overall_progress = calculate_progress_bar_width(total_expenses, total_budget)
-
     # Determine progress classes based on the widths
     def get_progress_class(progress_bar_width):
         if progress_bar_width < 50:
@@ -82,91 +58,96 @@ def notification(request):
         else:
             return 'progress-bar-high'
 
-    progress_class_food = get_progress_class(progress_bar_width_food)
-    progress_class_utilities = get_progress_class(progress_bar_width_utilities)
-    progress_class_entertainment = get_progress_class(progress_bar_width_entertainment)
-    progress_class_others = get_progress_class(progress_bar_width_others)
-    progress_class_overall = get_progress_class(overall_progress)
+    categories = []
+    for name, budget, expenses in budget_lines:
+        progress_bar_width = calculate_progress_bar_width(expenses, budget)
+        categories.append({
+            'name': name,
+            'budget': budget,
+            'expenses': expenses,
+            'progress_bar_width': progress_bar_width,
+            'progress_class': get_progress_class(progress_bar_width),
+        })
+    forecasting.with_projections(categories, forecast)
+
+    # Totals across all categories
+    total_expenses = sum(category['expenses'] for category in categories)
+    total_budget = sum(category['budget'] for category in categories)
+
+    # Calculate overall progress for Expense vs Budget
+    overall_progress = calculate_progress_bar_width(total_expenses, total_budget)
 
     # Pass data to the context
-    context = {
+    return {
         'total_budget': total_budget,
         'total_expenses': total_expenses,
-        'total_food_budget': total_food_budget,
-        'total_utilities_budget': total_utilities_budget,
-        'total_entertainment_budget': total_entertainment_budget,
-        'total_others_budget': total_others_budget,
-        'total_food_expenses': total_food_expenses,
-        'total_utilities_expenses': total_utilities_expenses,
-        'total_entertainment_expenses': total_entertainment_expenses,
-        'total_others_expenses': total_others_expenses,
-        'progress_bar_width_food': progress_bar_width_food,
-        'progress_bar_width_utilities': progress_bar_width_utilities,
-        'progress_bar_width_entertainment': progress_bar_width_entertainment,
-        'progress_bar_width_others': progress_bar_width_others,
+        'categories': categories,
         'progress_bar_width_overall': overall_progress,
-        'progress_class_food': progress_class_food,
-        'progress_class_utilities': progress_class_utilities,
-        'progress_class_entertainment': progress_class_entertainment,
-        'progress_class_others': progress_class_others,
-        'progress_class_overall': progress_class_overall,
+        'progress_class_overall': get_progress_class(overall_progress),
+        'projected_total': round(sum(category['projected'] for category in categories), 2),
+        'overshoots': [category for category in categories if category['projected_overshoot'] > 0],
+        'currency_symbol': currency.symbol(forecast['currency']),
+        'base_currency': forecast['currency'],
+        'unconverted_currencies': unconverted,
     }
 
-    # Render the template with context
-    return render(request, 'accounts/notification.html', context)
+def build_notification_context(user):
+    # Budgets and per-category totals in one query, however many categories the user
+    # has, two more for the forecast, which is cached along with the page, and one
+    # for the currencies without rates
+    return notification_context(
+        budgets.get_budget_lines(user), forecasting.compute_forecast(user), currency.get_unconverted_currencies(user),
+    )
 
 @login_required
-def alerts(request):
-    # Fetch all expenses for the logged-in user
-    user_expenses = Expense.objects.filter(user=request.user)
-
-    # Get the user's profile and calculate total budget
-    profile = getattr(request.user, 'profile', None)
-    total_food_budget = float(profile.food_budget) if profile and profile.food_budget else 0
-    total_utilities_budget = float(profile.utilities_budget) if profile and profile.utilities_budget else 0
-    total_entertainment_budget = float(profile.entertainment_budget) if profile and profile.entertainment_budget else 0
-    total_others_budget = float(profile.others_budget) if profile and profile.others_budget else 0
-    
-    # Calculate total expenses for each category
-    total_food_expenses = user_expenses.filter(category='Food').aggregate(Sum('amount'))['amount__sum'] or 0
-    total_utilities_expenses = user_expenses.filter(category='Utilities').aggregate(Sum('amount'))['amount__sum'] or 0
-    total_entertainment_expenses = user_expenses.filter(category='Entertainment').aggregate(Sum('amount'))['amount__sum'] or 0
-    total_others_expenses = user_expenses.filter(category='Others').aggregate(Sum('amount'))['amount__sum'] or 0
+def notification(request):
+    # Served from the per-user cache until the user's expenses or budgets change,
+    # or the day (and so the month-end projection) does
+    context = caching.get_user_data(
+        request.user, 'notification', lambda: build_notification_context(request.user),
+        timeout=forecasting.seconds_until_midnight(),
+    )
 
-    # Define thresholds for warning and alert status
-    warning_threshold_min = 0.60  # 70% of the budget
-    warning_threshold_max = 0.99  # 99% of the budget
-    alert_threshold = 1.0         # 100% of the budget
+    # Render the template with context
+    return render(request, 'accounts/notification.html', context)
 
+def alerts_context(budget_lines, forecast, unconverted):
     # Determine status for each category
-    def get_status(expenses, budget):
-        if expenses >= budget * alert_threshold:
-            return 'alert'
-        elif expenses >= budget * warning_threshold_min and expenses <= budget * warning_threshold_max:
-            return 'warning'
-        return ''
-
-    food_status = get_status(total_food_expenses, total_food_budget)
-    utilities_status = get_status(total_utilities_expenses, total_utilities_budget)
-    entertainment_status = get_status(total_entertainment_expenses, total_entertainment_budget)
-    others_status = get_status(total_others_expenses, total_others_budget)
+    categories = []
+    for name, budget, expenses in budget_lines:
+        categories.append({
+            'name': name,
+            'budget': float(budget),
+            'expenses': expenses,
+            'status': alerting.get_status(expenses, float(budget)),
+        })
+    forecasting.with_projections(categories, forecast)
 
     # Pass data to the context
-    context = {
-        'total_food_budget': total_food_budget,
-        'total_utilities_budget': total_utilities_budget,
-        'total_entertainment_budget': total_entertainment_budget,
-        'total_others_budget': total_others_budget,
-        'total_food_expenses': total_food_expenses,
-        'total_utilities_expenses': total_utilities_expenses,
-        'total_entertainment_expenses': total_entertainment_expenses,
-        'total_others_expenses': total_others_expenses,
-        'food_status': food_status,
-        'utilities_status': utilities_status,
-        'entertainment_status': entertainment_status,
-        'others_status': others_status,
+    return {
+        'categories': categories,
+        'warnings': [category for category in categories if category['status'] == 'warning'],
+        'alerts': [category for category in categories if category['status'] == 'alert'],
+        # Not over budget yet, but on track to be by the end of the month
+        'forecast_warnings': [
+            category for category in categories
+            if category['status'] != 'alert' and category['projected_overshoot'] > 0
+        ],
+        'currency_symbol': currency.symbol(forecast['currency']),
+        'base_currency': forecast['currency'],
+        'unconverted_currencies': unconverted,
     }
 
+def build_alerts_context(user):
+    # Budgets and per-category totals in one query, however many categories the user has
+    return alerts_context(
+        budgets.get_budget_lines(user), forecasting.get_forecast(user), currency.get_unconverted_currencies(user),
+    )
+
+@login_required
+def alerts(request):
+    context = build_alerts_context(request.user)
+
     # Render the template with context
     return render(request, 'accounts/alerts.html', context)
 
@@ -199,11 +180,6 @@ def login_view(request):
         password = request.POST.get('password')
 
         try:
-            # Check if username exists
-            if not User.objects.filter(username=username).exists():
-                messages.error(request, 'Username is incorrect. Please try again.')
-                return render(request, 'accounts/login.html')
-
             # Authenticate user
             user = authenticate(request, username=username, password=password)
 
@@ -212,6 +188,9 @@ def login_view(request):
                 login(request, user)
                 messages.success(request, f'Welcome back, {user.username}!')
                 return redirect('/profile?first_login=true')  # Redirect to profile page after login
+            # Only a failed login looks up whether the username exists
+            elif not User.objects.filter(username=username).exists():
+                messages.error(request, 'Username is incorrect. Please try again.')
             else:
                 messages.error(request, 'Password is incorrect. Please try again.')
 
@@ -226,6 +205,16 @@ def edit_profile(request):
     profile, created = Profile.objects.get_or_create(user=request.user)
 
     if request.method == 'POST':
+        base_currency = request.POST.get('base_currency')
+        if base_currency:
+            if base_currency not in dict(CURRENCY_CHOICES):
+                return JsonResponse({'success': False, 'message': 'Unsupported currency.'}, status=400)
+            try:
+                currency.set_base_currency(request.user, base_currency)
+            except currency.CurrencyError as e:
+                return JsonResponse({'success': False, 'message': str(e)}, status=400)
+            return JsonResponse({'success': True, 'message': 'Base currency updated successfully!'})
+
         username = request.POST.get('username')
         if username:
             request.user.username = username
@@ -236,45 +225,51 @@ def edit_profile(request):
 
         return JsonResponse({'success': False, 'message': 'Failed to update username.'})
 
-    return render(request, 'accounts/edit_profile.html', {'user': request.user, 'profile': profile})
-
-@login_required
-def dashboard(request):
-    # Fetch all expenses for the logged-in user
-    user_expenses = Expense.objects.filter(user=request.user)
-
-    # Get the latest 5 expenses for the tile
-    latest_expenses = user_expenses.order_by('-date')[:5]
-
-    # Aggregate total amounts per category for the bar graph
-    expenses_by_category = user_expenses.values('category').annotate(total=Sum('amount'))
+    return render(request, 'accounts/edit_profile.html', {
+        'user': request.user,
+        'profile': profile,
+        'budgets': budgets.get_budgets(request.user),
+        'currencies': CURRENCY_CHOICES,
+    })
 
+def dashboard_context(latest_expenses, expenses_by_category, total_budget, base_currency, unconverted):
     # Extract categories and amounts for Chart.js
-    categories = [item['category'] for item in expenses_by_category]
-    amounts = [float(item['total']) for item in expenses_by_category]
+    categories = [category for category, _ in expenses_by_category]
+    amounts = [float(total) for _, total in expenses_by_category]
 
     # Total expenses for the speedometer
-    total_expenses = user_expenses.aggregate(Sum('amount'))['amount__sum'] or 0
-
-    # Calculate total budget by summing the 4 fields
-    profile = getattr(request.user, 'profile', None)
-    total_budget = 0
-    if profile:
-        total_budget = (
-            (profile.food_budget or 0) +
-            (profile.entertainment_budget or 0) +
-            (profile.utilities_budget or 0) +
-            (profile.others_budget or 0)
-        )
+    total_expenses = sum(total for _, total in expenses_by_category)
 
-    context = {
+    return {
         'categories': json.dumps(categories),
         'amounts': json.dumps(amounts),
         'total_expenses': total_expenses,
         'total_budget': total_budget,
         'latest_expenses': latest_expenses,  # Only latest 5 for the table tile
+        'currency_symbol': currency.symbol(base_currency),
+        'base_currency': base_currency,
+        'unconverted_currencies': unconverted,
     }
 
+def get_latest_expenses(user):
+    # Get the latest 5 expenses for the tile
+    return list(Expense.objects.filter(user=user).order_by('-date')[:5])
+
+def build_dashboard_context(user):
+    # Per-category totals for the bar graph are read from the rollup table
+    return dashboard_context(
+        get_latest_expenses(user),
+        rollups.get_category_breakdown(user),
+        budgets.get_total_budget(user),
+        currency.get_base_currency(user),
+        currency.get_unconverted_currencies(user),
+    )
+
+@login_required
+def dashboard(request):
+    # Served from the per-user cache until the user's expenses or budgets change
+    context = caching.get_user_data(request.user, 'dashboard', lambda: build_dashboard_context(request.user))
+
     return render(request, 'accounts/dashboard.html', context)
 
 logger = logging.getLogger(__name__)
@@ -345,73 +340,131 @@ def change_password(request):
 
     return JsonResponse({'success': False, 'message': 'Invalid request method.'})
 
+@login_required
+@etag(versioning.request_etag)
 def set_budget(request):
     if request.method == 'GET':
-        try:
-            user_profile = request.user.profile
-            data = {
-                'food_budget': user_profile.food_budget,
-                'entertainment_budget': user_profile.entertainment_budget,
-                'utilities_budget': user_profile.utilities_budget,
-                'others_budget': user_profile.others_budget,
-            }
-            return JsonResponse({'success': True, 'data': data})
-        except Profile.DoesNotExist:
-            return JsonResponse({'success': False, 'message': 'Profile not found.'}, status=404)
+        # {category: budget} for each of the user's categories, in display order
+        return JsonResponse({'success': True, 'data': budgets.get_budgets(request.user)})
 
     elif request.method == 'POST':
         try:
             data = json.loads(request.body)
-            food_budget = data.get('food_budget')
-            entertainment_budget = data.get('entertainment_budget')
-            utilities_budget = data.get('utilities_budget')
-            others_budget = data.get('others_budget')
-
-            if not all([food_budget is not None, entertainment_budget is not None, utilities_budget is not None, others_budget is not None]):
-                return JsonResponse({'success': False, 'message': 'All budget fields are required.'}, status=400)
-
-            user_profile = request.user.profile
-            user_profile.food_budget = food_budget
-            user_profile.entertainment_budget = entertainment_budget
-            user_profile.utilities_budget = utilities_budget
-            user_profile.others_budget = others_budget
-            user_profile.save()
-
-            return JsonResponse({'success': True, 'message': 'Budgets set successfully.'})
         except json.JSONDecodeError:
             return JsonResponse({'success': False, 'message': 'Invalid data.'}, status=400)
+
+        # {category: budget}; categories left out keep their current budget
+        if not isinstance(data, dict) or not data:
+            return JsonResponse({'success': False, 'message': 'At least one budget is required.'}, status=400)
+
+        try:
+            budgets.set_budgets(request.user, data)
+        except budgets.BudgetError as e:
+            return JsonResponse({'success': False, 'message': str(e)}, status=400)
+
+        return JsonResponse({'success': True, 'message': 'Budgets set successfully.'})
     return JsonResponse({'success': False, 'message': 'Invalid request method.'}, status=405)
 
+@login_required
+def add_category(request):
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Invalid request method.'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'message': 'Invalid data.'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'success': False, 'message': 'Invalid data.'}, status=400)
+
+    try:
+        category = budgets.add_category(request.user, data.get('name'), data.get('budget'))
+    except budgets.BudgetError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+
+    return JsonResponse({'success': True, 'message': 'Category added successfully.', 'category': category.name})
+
 @login_required
 def add_expenses(request):
+    categories = budgets.get_category_names(request.user)
+    # Amounts in another currency need an exchange rate to the base currency
+    rates = currency.get_rate_coverage(request.user)
     if request.method == 'POST':
-        form = ExpenseForm(request.POST)
+        form = ExpenseForm(request.POST, categories=categories, rates=rates)
         if form.is_valid():
             expense = form.save(commit=False)
             expense.user = request.user
-            expense.save()
+            with transaction.atomic():
+                expense.save()
+                rollups.expense_added(expense)
             messages.success(request, 'Expense added successfully!')
             return redirect('add_expenses')
     else:
-        form = ExpenseForm()
+        form = ExpenseForm(categories=categories, rates=rates)
+
+    return render(request, 'accounts/add_expenses.html', {
+        'form': form,
+        'categories': categories,
+        'currencies': CURRENCY_CHOICES,
+        'base_currency': rates.base,
+    })
+
+@login_required
+def import_expenses(request):
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Invalid request method.'}, status=405)
+
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'success': False, 'message': 'No CSV file uploaded.'}, status=400)
+
+    # Decode the upload line by line so large files are never read into memory at once
+    try:
+        result = import_expenses_csv(request.user, codecs.iterdecode(upload, 'utf-8-sig'))
+    except ImportFormatError as e:
+        # Rows before a decoding error are kept, so say how many there were
+        return JsonResponse({'success': False, 'message': str(e), 'imported': e.imported}, status=400)
 
-    return render(request, 'accounts/add_expenses.html', {'form': form})
+    return JsonResponse({'success': True, **result})
 
 @login_required
 def view_expenses(request):
     clear_stale_messages(request)
-    expenses = Expense.objects.filter(user=request.user)
-    categories = [choice[0] for choice in Expense.CATEGORY_CHOICES]
-    return render(request, 'accounts/view_expenses.html', {'expenses': expenses, 'categories': categories})
+    # Only the newest page is rendered; the rest is fetched from filter_expenses as the user scrolls
+    expenses, next_cursor = keyset_page(
+        Expense.objects.filter(user=request.user),
+        ('id', 'date', 'description', 'amount', 'currency'),
+        cursor=None,
+        page_size=get_page_size(request.GET.get('page_size')),
+    )
+    categories = budgets.get_category_names(request.user)
+    return render(request, 'accounts/view_expenses.html', {
+        'expenses': expenses,
+        'categories': categories,
+        'next_cursor': next_cursor,
+    })
 
 
 @login_required
+@etag(versioning.request_etag)
 def get_categories(request):
-    categories = [choice[0] for choice in Expense.CATEGORY_CHOICES]
+    categories = budgets.get_category_names(request.user)
     return JsonResponse({'categories': categories})
 
 
-def filter_expenses(request):
+def expense_json(row):
+    return {
+        "id": row['id'],
+        "date": row['date'].strftime('%b %d %Y'),
+        "description": row['description'],
+        "amount": str(row['amount']),
+        "currency": row['currency'],
+        "category": row['category'],
+    }
+
+
+def get_filtered_expenses(request):
+    # The category/date filters shared by filter_expenses and export_expenses
     category = request.GET.get('category', 'All')
     start_date = request.GET.get('start_date', None)
     end_date = request.GET.get('end_date', None)
@@ -431,80 +484,225 @@ def filter_expenses(request):
         if end_date_parsed:
             filtered_expenses = filtered_expenses.filter(date__lte=end_date_parsed)
 
+    return filtered_expenses
+
+
+@login_required
+@etag(versioning.request_etag)
+def filter_expenses(request):
+    filtered_expenses = get_filtered_expenses(request)
+
+    # Fetch one keyset page of plain rows instead of every model instance
+    page_size = get_page_size(request.GET.get('page_size'))
+    try:
+        rows, next_cursor = keyset_page(
+            filtered_expenses,
+            ('id', 'date', 'description', 'amount', 'currency', 'category'),
+            cursor=request.GET.get('cursor'),
+            page_size=page_size,
+        )
+    except InvalidCursor:
+        return JsonResponse({'success': False, 'message': 'Invalid cursor.'}, status=400)
+
     # Prepare JSON response
+    expenses_data = [expense_json(row) for row in rows]
+
+    return JsonResponse({"expenses": expenses_data, "next": next_cursor})
+
+
+@login_required
+@etag(versioning.request_etag)
+def search_expenses(request):
+    terms = search.search_terms(request.GET.get('q'))
+    if not terms:
+        return JsonResponse({'success': False, 'message': 'Enter something to search for.'}, status=400)
+
+    # Results are ranked, so the cursor is simply the offset of the next page
+    cursor = request.GET.get('cursor') or '0'
+    if not cursor.isdigit() or int(cursor) > search.MAX_OFFSET:
+        return JsonResponse({'success': False, 'message': 'Invalid cursor.'}, status=400)
+    offset = int(cursor)
+    page_size = get_page_size(request.GET.get('page_size'))
+
+    # The same category/date filters as filter_expenses, narrowed by the full-text index
+    rows = search.search(
+        get_filtered_expenses(request), request.user, terms,
+        fields=('id', 'date', 'description', 'amount', 'currency', 'category'),
+        offset=offset, limit=page_size + 1,
+    )
+    next_cursor = str(offset + page_size) if len(rows) > page_size else None
+
     expenses_data = [
-        {
-            "id": expense.id,
-            "date": expense.date.strftime('%b %d %Y'),
-            "description": expense.description,
-            "amount": str(expense.amount),
-            "category": expense.category,
-        }
-        for expense in filtered_expenses
+        {**expense_json(row), "rank": row['rank']}
+        for row in rows[:page_size]
     ]
+    return JsonResponse({"expenses": expenses_data, "next": next_cursor})
 
-    return JsonResponse({"expenses": expenses_data})
 
+@staff_member_required
+def cache_stats(request):
+    # Per-process hit/miss counters of the per-user result cache
+    return JsonResponse({'success': True, 'stats': caching.get_stats()})
 
-@login_required
-def financial_reports(request):
-    # Filter expenses for the logged-in user
-    user_expenses = Expense.objects.filter(user=request.user)
 
-    # Aggregate total amounts per category
-    expenses_by_category = user_expenses.values('category').annotate(total=Sum('amount'))
+def metrics_view(request):
+    # Prometheus scrape target, summed over every worker process
+    if not metrics.is_authorized(request):
+        return JsonResponse({'success': False, 'message': 'A valid metrics token is required.'}, status=403)
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
-    # Extract categories and amounts
-    categories = []
-    amounts = []
 
-    for expense in expenses_by_category:
-        category = expense['category']
-        total = expense['total']
+@staff_member_required
+def request_profiles(request):
+    # Captured request profiles, newest first
+    return render(request, 'accounts/profiles.html', {'profiles': profiling.list_profiles()})
+
+
+@staff_member_required
+def request_profile(request, profile_id):
+    if request.GET.get('download'):
+        path = profiling.get_profile_path(profile_id)
+        if path is None:
+            raise Http404('Unknown profile.')
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'{profile_id}.prof')
+
+    # Top functions by cumulative time
+    found = profiling.get_profile(profile_id)
+    if found is None:
+        raise Http404('Unknown profile.')
+    meta, functions = found
+    return render(request, 'accounts/profiles.html', {'profile': meta, 'functions': functions})
+
 
-        # Include all valid categories; handle "Others" separately
-        if category in ['Food', 'Utilities', 'Entertainment', 'Others']:
-            categories.append(category)
-            amounts.append(float(total))  # Convert Decimal to float
+@login_required
+def spend_summary(request):
+    bucket = request.GET.get('bucket', 'day')
+    if bucket not in rollups.SPEND_BUCKETS:
+        return JsonResponse({'success': False, 'message': 'Bucket must be day, week or month.'}, status=400)
 
-    # Calculate totals and averages
-    total_expense = user_expenses.aggregate(Sum('amount'))['amount__sum'] or 0
+    category = request.GET.get('category', 'All')
+    start_date = parse_date(request.GET.get('start_date') or '')
+    end_date = parse_date(request.GET.get('end_date') or '')
+
+    # Served from the daily summary table, never the raw ledger
+    series = rollups.get_spend_series(
+        request.user,
+        bucket=bucket,
+        start_date=start_date,
+        end_date=end_date,
+        category=None if category == 'All' else category,
+    )
+    return JsonResponse({
+        'success': True,
+        'bucket': bucket,
+        'series': [
+            # A null total: some of the period's spend has no exchange rate
+            {'period': period.isoformat(), 'total': None if total is None else f'{total:.2f}', 'count': count}
+            for period, total, count in series
+        ],
+    })
 
-    # Get the count of unique dates
-    distinct_dates = user_expenses.values('date').distinct().count()
 
-    # Calculate average as sum of amounts / number of unique dates
-    average_daily_expense = total_expense / distinct_dates if distinct_dates > 0 else 0
+@login_required
+def export_expenses(request):
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in ('csv', 'jsonl'):
+        return JsonResponse({'success': False, 'message': 'Unsupported export format.'}, status=400)
+    compress = request.GET.get('gzip', '').lower()
+    if compress not in ('', '0', 'false', 'no', '1', 'true', 'yes'):
+        return JsonResponse({'success': False, 'message': 'gzip must be true or false.'}, status=400)
+
+    # Rows are fetched and written chunk by chunk, so memory stays flat however large the export
+    expenses = get_filtered_expenses(request)
+    if export_format == 'csv':
+        lines = exporters.csv_lines(expenses)
+        content_type = 'text/csv'
+    else:
+        lines = exporters.jsonl_lines(expenses)
+        content_type = 'application/x-ndjson'
 
-    context = {
-        'categories': json.dumps(categories),  # Serialize categories for JavaScript
-        'amounts': json.dumps(amounts),        # Serialize amounts for JavaScript
-        'total_expense': total_expense,
-        'average_daily_expense': average_daily_expense,
+    filename = f"{request.user.username}_expenses.{export_format}"
+    if compress in ('1', 'true', 'yes'):
+        response = StreamingHttpResponse(exporters.gzip_stream(lines), content_type='application/gzip')
+        filename += '.gz'
+    else:
+        response = StreamingHttpResponse(lines, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def financial_reports_context(report, trends):
+    return {
+        'categories': json.dumps(report['categories']),  # Serialize categories for JavaScript
+        'amounts': json.dumps(report['amounts']),        # Serialize amounts for JavaScript
+        'total_expense': report['total_expense'],
+        'average_daily_expense': report['average_daily_expense'],
+        'analytics': trends,
+        'monthly_trend': json.dumps(trends['monthly_trend']),
+        'daily_series': json.dumps(trends['daily_series']),
+        'percentile_rows': zip(trends['expense_percentiles'], trends['daily_percentiles']),
+        'currency_symbol': currency.symbol(report['currency']),
+        'base_currency': report['currency'],
+        'unconverted': report['unconverted'],
     }
+
+def build_financial_reports_context(user):
+    user_ledger = ledger.get_ledger(user)
+    # Trends, rolling averages, month-over-month deltas and percentiles, from the same ledger
+    trends = analytics.get_analytics(user, user_ledger)
+    return financial_reports_context(reports.ledger_report_data(user_ledger), trends)
+
+@login_required
+def financial_reports(request):
+    context = build_financial_reports_context(request.user)
     return render(request, 'accounts/financial_reports.html', context)
 
+@login_required
+def financial_report_pdf(request):
+    # Rendered on the server and cached until the user's expenses or budgets change
+    response = HttpResponse(reports.get_report_pdf(request.user), content_type='application/pdf')
+    response['Content-Disposition'] = 'attachment; filename="financial_report.pdf"'
+    return response
+
 @login_required
 def edit_expense(request, expense_id):
     expense = get_object_or_404(Expense, id=expense_id, user=request.user)
+    categories = budgets.get_category_names(request.user)
 
     if request.method == 'POST':
-        form = ExpenseForm(request.POST, instance=expense)
+        form = ExpenseForm(
+            request.POST, instance=expense, categories=categories, rates=currency.get_rate_coverage(request.user),
+        )
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                # Lock the stored row so the rollup delta is taken against its committed values
+                old = (
+                    Expense.objects.select_for_update()
+                    .values('category', 'amount', 'date', 'currency')
+                    .get(id=expense.id)
+                )
+                form.save()
+                rollups.expense_changed(expense, old['category'], old['amount'], old['date'], old['currency'])
             messages.success(request, "Expense updated successfully!")
             return redirect('view_expenses')
     else:
-        form = ExpenseForm(instance=expense)
+        form = ExpenseForm(instance=expense, categories=categories)
 
-    return render(request, 'accounts/edit_expense.html', {'form': form, 'expense': expense})
+    return render(request, 'accounts/edit_expense.html', {
+        'form': form,
+        'expense': expense,
+        'categories': categories,
+        'currencies': CURRENCY_CHOICES,
+    })
 
 @login_required
 @csrf_exempt
 def delete_expense(request, expense_id):
     try:
-        expense = Expense.objects.get(id=expense_id, user=request.user)
-        expense.delete()
+        with transaction.atomic():
+            expense = Expense.objects.select_for_update().get(id=expense_id, user=request.user)
+            expense.delete()
+            rollups.expense_removed(expense)
         return JsonResponse({"success": True}, status=200)
     except Expense.DoesNotExist:
         return JsonResponse({"success": False, "error": "Expense not found"}, status=404)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,11 +42,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'accounts.timing.request_timing_middleware',  # First, so it times everything below it
+    'accounts.metrics.request_metrics_middleware',  # Reads the query count from the timing middleware
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.profiling.request_profiling_middleware',  # Needs request.user
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -54,7 +58,7 @@ ROOT_URLCONF = 'financial_planner.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'accounts.timing.TimedDjangoTemplates',  # DjangoTemplates, with render time per request
         'DIRS': [
             BASE_DIR / 'templates',  # Add this line to include a global templates directory
         ],
@@ -129,7 +133,92 @@ X_FRAME_OPTIONS = 'ALLOWALL'  # Allow embedding the site in an iframe
 LOGIN_REDIRECT_URL = 'profile'  # Redirect to the profile page after login
 
 LOGOUT_REDIRECT_URL = 'login'  # Redirect to the login page after logout
+
+# A cache shared by every worker process, e.g. SHARED_CACHE_URL=redis://127.0.0.1:6379/1
+# (needs the redis package). With one configured, sessions are read from it and
+# written through to the database, which stays the fallback when an entry is
+# evicted. Without one the default cache is per process, where a logout or
+# password change in one worker would leave the session cached in the others,
+# so sessions stay in the database.
+SHARED_CACHE_URL = os.environ.get('SHARED_CACHE_URL')
+if SHARED_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': SHARED_CACHE_URL,
+        },
+    }
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Expense list pagination (filter_expenses and the view_expenses page)
+EXPENSES_PAGE_SIZE = 50
+EXPENSES_MAX_PAGE_SIZE = 200
+
+# Run the independent queries of the async summary views in parallel worker threads
+ASYNC_VIEWS_PARALLEL_QUERIES = True
+# Size of that thread pool; each thread keeps one database connection open
+ASYNC_VIEWS_QUERY_THREADS = 4
+
+# Seconds between keepalive comments on idle budget alert streams
+ALERT_STREAM_KEEPALIVE_SECONDS = 15
+
+# Per-process memory budget for the compact per-user ledgers behind the reports
+LEDGER_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Per-request query count, DB, template and view time as a Server-Timing header
+# and a JSON line on the accounts.timing logger (INFO; slow requests at WARNING,
+# with their slowest SQL statements)
+REQUEST_TIMING_ENABLED = True
+REQUEST_TIMING_SLOW_MS = 500
+REQUEST_TIMING_SLOW_QUERY_COUNT = 5
+
+# The request timing lines go to stderr as they are, one JSON object a line;
+# REQUEST_TIMING_LOG_LEVEL=WARNING keeps only the slow requests
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'request_timing': {'class': 'logging.StreamHandler', 'formatter': 'message'},
+    },
+    'loggers': {
+        'accounts.timing': {
+            'handlers': ['request_timing'],
+            'level': os.environ.get('REQUEST_TIMING_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# Staff can have a request wrapped in cProfile with an X-Profile header or a
+# ?profile query flag; a fraction of staff requests can also be sampled. The
+# newest captures are kept here and listed at /profiles/. Requests served over
+# ASGI are never profiled.
+REQUEST_PROFILING_ENABLED = True
+REQUEST_PROFILING_SAMPLE_RATE = 0.0
+REQUEST_PROFILING_DIR = BASE_DIR / 'profiles'
+REQUEST_PROFILING_MAX_FILES = 50
+
+# Prometheus metrics at /metrics. Under a server with several worker processes
+# point METRICS_DIR at a directory they share (emptied when the service starts)
+# so that every scrape reports all of them; otherwise each scrape only sees the
+# process that answers it. Scrapes need METRICS_TOKEN as a bearer token or a
+# staff login; set METRICS_PUBLIC to open the endpoint to anyone.
+METRICS_ENABLED = True
+METRICS_DIR = None
+METRICS_FLUSH_SECONDS = 1.0
+METRICS_TOKEN = None
+METRICS_PUBLIC = False
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Budget alert digests from the nightly sweep_budget_alerts command are written
+# to files here rather than sent over SMTP
+EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+EMAIL_FILE_PATH = BASE_DIR / 'sent_emails'
+DEFAULT_FROM_EMAIL = 'alerts@financial-planner.local'